@@ -1,25 +1,93 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Request, render_template, request, jsonify, Response, stream_with_context
 import os
-from werkzeug.utils import secure_filename
 from datetime import datetime
 import torch
-from PIL import Image
-from test_model import get_model, process_image
+from warmup import tuned_thread_config, apply_thread_config, warmup
+from text_prefilter import TextPrefilter
+from test_model import (load_model, process_image, build_ladder, ocr_service, prepare_image, run_model,
+                        collect_crops, read_crops_lazily, build_detections, CHECKPOINT_PATH)
 from azure_vision import AzureVisionService
+from local_ocr import LocalOCRService
 from gpt_service import TextAnalysisService
+from inference_queue import InferenceScheduler
+from result_cache import ResultCache, make_key
+from checkpoint_store import checkpoint_id
+import metrics
+from image_ingest import IngestedImage
+from upload_store import UploadStore
+from stream_session import StreamSessions
+from jobs import JobQueue, QueueFull
+from resilience import Deadline
+from concurrent.futures import TimeoutError as FutureTimeout
 import platform
+import uuid
+import json
+import zipfile
+
+class AppRequest(Request):
+    # the batch endpoint takes a whole shelf of photos, everything else keeps the small upload limit
+    @property
+    def max_content_length(self):
+        if self.path == '/detect/batch':
+            return app.config['BATCH_MAX_CONTENT_LENGTH']
+        return super().max_content_length
+
+# thread counts from gunicorn.conf.py, or from `python warmup.py --autotune` when run on its own
+# (a single process unless GUNICORN_WORKERS says otherwise, a config tuned for another count is ignored)
+thread_config = tuned_thread_config(int(os.getenv('GUNICORN_WORKERS', 1)))
+apply_thread_config(
+    int(os.getenv('TORCH_THREADS_PER_WORKER', thread_config.get('intra_op_threads', torch.get_num_threads()))),
+    int(os.getenv('TORCH_INTEROP_THREADS', thread_config.get('interop_threads', 0)))
+)
 
 app = Flask(__name__)  # app setup
+app.request_class = AppRequest
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5000kb size limit from website.
+# /detect/batch: whole request limit, images per request and how many share one model forward
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.getenv('BATCH_MAX_MB', 200)) * 1024 * 1024
+app.config['BATCH_MAX_IMAGES'] = int(os.getenv('BATCH_MAX_IMAGES', 200))
+app.config['BATCH_GROUP_SIZE'] = int(os.getenv('BATCH_GROUP_SIZE', 8))
+# concurrent /detect requests get grouped into one model forward (batch size 1 turns it off)
+app.config['INFERENCE_MAX_BATCH'] = int(os.getenv('INFERENCE_MAX_BATCH', 4))
+app.config['INFERENCE_MAX_WAIT_MS'] = float(os.getenv('INFERENCE_MAX_WAIT_MS', 10))
+app.config['CHECKPOINT_PATH'] = CHECKPOINT_PATH
+app.config['MODEL_BACKEND'] = os.getenv('MODEL_BACKEND', 'eager')  # eager, torchscript, quantized or onnx
+app.config['DETECTION_SIZE'] = 640
+app.config['MIN_DETECTION_CONFIDENCE'] = 0.3
+# optional OCR budget per request, boxes that can't reach the top 3 are always skipped
+app.config['MAX_OCR_CROPS'] = int(os.getenv('MAX_OCR_CROPS')) if os.getenv('MAX_OCR_CROPS') else None
+app.config['OCR_TIME_BUDGET_MS'] = float(os.getenv('OCR_TIME_BUDGET_MS')) if os.getenv('OCR_TIME_BUDGET_MS') else None
+# resolution ladder, e.g. "320,640,960,640r90": start small and only climb when no confident date box was found
+# (empty = the fixed DETECTION_SIZE pass), tune it with benchmarks/bench_ladder.py
+app.config['DETECTION_LADDER'] = os.getenv('DETECTION_LADDER', '')
+app.config['LADDER_MIN_CONFIDENCE'] = float(os.getenv('LADDER_MIN_CONFIDENCE', 0.5))
+# opencv text check before the detector: pictures without text are answered without a forward, the rest only
+# send their text region through it. Off by default, check the recall on your uploads with benchmarks/bench_prefilter.py
+app.config['TEXT_PREFILTER'] = os.getenv('TEXT_PREFILTER', '0') == '1'
+# repeated uploads of the same picture skip inference, disk tier is off unless RESULT_CACHE_DIR is set
+app.config['RESULT_CACHE_MEMORY_MB'] = int(os.getenv('RESULT_CACHE_MEMORY_MB', 32))
+app.config['RESULT_CACHE_DIR'] = os.getenv('RESULT_CACHE_DIR')
+app.config['RESULT_CACHE_DISK_MB'] = int(os.getenv('RESULT_CACHE_DISK_MB', 256))
+# end-to-end budget for the cloud calls of one request (azure OCR + translate + gemini)
+app.config['REQUEST_DEADLINE_S'] = float(os.getenv('REQUEST_DEADLINE_S', 20.0))
+# full image text for /analyze and /scan: azure (OCR + translation) or local (tiled paddle, no translation)
+app.config['FULL_OCR_BACKEND'] = os.getenv('FULL_OCR_BACKEND', 'azure')
+# uploads are stored once per content, oldest go first when the folder is too big or too old (0 days keeps them)
+app.config['UPLOAD_MAX_MB'] = int(os.getenv('UPLOAD_MAX_MB', 512))
+app.config['UPLOAD_MAX_AGE_DAYS'] = int(os.getenv('UPLOAD_MAX_AGE_DAYS', 30))
+app.config['UPLOAD_THUMBNAIL_SIZE'] = int(os.getenv('UPLOAD_THUMBNAIL_SIZE', 640))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs('static/css', exist_ok=True)
 
 # here loading azure vision ep=(https://ankush.cognitiveservices.azure.com/) and text analysis services (OCR and translation by using google gemini)
-azure_vision = AzureVisionService()
+if app.config['FULL_OCR_BACKEND'] == 'local':
+    full_ocr = LocalOCRService()
+else:
+    full_ocr = AzureVisionService()
 text_analysis = TextAnalysisService()
 
 
@@ -34,29 +102,140 @@ def play_loading_sound():
 # Load expiration date detection model
 print("Incoming model...")
 play_loading_sound()
-model = get_model()
-checkpoint = torch.load('checkpoints/final_model.pth', map_location='cpu')
-model.load_state_dict(checkpoint['model_state_dict'])
-model.eval()
+model = load_model(app.config['MODEL_BACKEND'], app.config['CHECKPOINT_PATH'])
+# under gunicorn --preload the workers fork from this process and share the weights copy-on-write,
+# share_memory() moves them to shm so they stay shared even if a worker writes to a page
+if os.getenv('MODEL_SHARE_MEMORY') == '1' and hasattr(model, 'share_memory'):
+    model.share_memory()
 print("Model loaded successfully")
 play_loading_sound()
 
+scheduler = None
+if app.config['INFERENCE_MAX_BATCH'] > 1:
+    scheduler = InferenceScheduler(
+        model,
+        max_batch_size=app.config['INFERENCE_MAX_BATCH'],
+        max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS']
+    )
+
+ladder = build_ladder(model, app.config['DETECTION_LADDER']) if app.config['DETECTION_LADDER'] else None
+text_prefilter = TextPrefilter(work_size=app.config['DETECTION_SIZE']) if app.config['TEXT_PREFILTER'] else None
+if ladder and scheduler is not None:
+    # every rung runs at its own size, so each one batches separately
+    for rung in ladder:
+        rung.scheduler = InferenceScheduler(
+            rung.model,
+            max_batch_size=app.config['INFERENCE_MAX_BATCH'],
+            max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS']
+        )
+
+result_cache = ResultCache(
+    max_memory_bytes=app.config['RESULT_CACHE_MEMORY_MB'] * 1024 * 1024,
+    disk_dir=app.config['RESULT_CACHE_DIR'],
+    max_disk_bytes=app.config['RESULT_CACHE_DISK_MB'] * 1024 * 1024
+)
+
+upload_store = UploadStore(
+    root=app.config['UPLOAD_FOLDER'],
+    max_bytes=app.config['UPLOAD_MAX_MB'] * 1024 * 1024,
+    max_age_days=app.config['UPLOAD_MAX_AGE_DAYS'],
+    thumbnail_size=app.config['UPLOAD_THUMBNAIL_SIZE']
+)
+
+# live camera scans, one session per browser tab. sessions live in this process only,
+# so behind several gunicorn workers the stream needs sticky routing (or a single worker)
+stream_sessions = StreamSessions(
+    model, scheduler,
+    size=app.config['DETECTION_SIZE'],
+    min_detection_confidence=app.config['MIN_DETECTION_CONFIDENCE']
+)
+
+# identity of the loaded weights, so a new checkpoint never serves old cached results
+MODEL_ID = f"{app.config['MODEL_BACKEND']}-{checkpoint_id(app.config['CHECKPOINT_PATH'])}"
+
+# answers that only mean a cloud call failed must not stick in the cache
+FAILED_TEXT_MARKERS = ('issue:', 'Error processing image', 'Translation failed')
+
+def is_cacheable_analysis(result):
+    if result['analysis'].strip().startswith(('Error analyzing text', 'found a date but cant tell')):
+        return False
+    texts = (result['original_text'], result['translated_text'])
+    return not any(text.startswith(FAILED_TEXT_MARKERS) for text in texts)
+
 # checking the uploaded file is a image file, also protect the server from malicious files injections. until the img is itself a malicious file.
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_uploaded_file(file):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-    filename = f"upload_{timestamp}_{secure_filename(file.filename)}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
-    return filepath, filename
+def pipeline_options():
+    budget_ms = app.config['OCR_TIME_BUDGET_MS']
+    return {
+        'max_ocr_crops': app.config['MAX_OCR_CROPS'],
+        'ocr_time_budget': budget_ms / 1000.0 if budget_ms else None,
+        'ladder': ladder,
+        'ladder_min_confidence': app.config['LADDER_MIN_CONFIDENCE'],
+        'prefilter': text_prefilter
+    }
+
+def detection_rung(detections):
+    # which ladder rung answered, None when the ladder is off
+    if not ladder:
+        return None
+    return detections[0]['rung'] if detections else ladder[-1].label
+
+def save_upload(data):
+    # the write and the thumbnail happen on the store's writer thread, not in the request
+    return upload_store.store(data, ext='.jpg')
 
 # Main page
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def run_detect(data):
+    """Detection for one upload, shared by /detect and the job workers"""
+    cache_key = make_key(
+        data,
+        route='detect',
+        size=app.config['DETECTION_SIZE'],
+        min_detection_confidence=app.config['MIN_DETECTION_CONFIDENCE'],
+        max_ocr_crops=app.config['MAX_OCR_CROPS'],
+        ocr_time_budget_ms=app.config['OCR_TIME_BUDGET_MS'],
+        ladder=app.config['DETECTION_LADDER'],
+        ladder_min_confidence=app.config['LADDER_MIN_CONFIDENCE'],
+        prefilter=app.config['TEXT_PREFILTER'],
+        model=MODEL_ID
+    )
+    # stored on hits too: the cached answer links to the upload, storing it again refreshes its age for
+    # the retention policy (or writes it back if it was evicted), so the urls never 404
+    stored = save_upload(data)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # one ingested image for the request, the size is read from the header
+    image = IngestedImage(data)
+
+    # Process image to findingh exp dates
+    detected_dates = process_image(
+        image, model,
+        size=app.config['DETECTION_SIZE'],
+        min_detection_confidence=app.config['MIN_DETECTION_CONFIDENCE'],
+        scheduler=scheduler,
+        **pipeline_options()
+    )
+
+    result = {
+        'image_path': stored['image_path'],
+        'thumbnail_path': stored['thumbnail_path'],
+        'image_width': image.size[0],
+        'image_height': image.size[1],
+        'detections': detected_dates,
+        'rung': detection_rung(detected_dates)
+    }
+    result_cache.set(cache_key, result)
+
+    return result
+
 # API endpoint for detecting expiration dates in images
 @app.route('/detect', methods=['POST'])
 def detect():
@@ -69,27 +248,56 @@ def detect():
     
     if file and allowed_file(file.filename):
         try:
-            filepath, filename = save_uploaded_file(file)
-            
-            # Process image to findingh exp dates
-            detected_dates = process_image(filepath, model)
-            
-            img = Image.open(filepath)
-            result = {
-                'image_path': f'/static/uploads/{filename}',
-                'image_width': img.size[0],
-                'image_height': img.size[1],
-                'detections': detected_dates
-            }
-            
-            return jsonify(result)
-            
+            data = file.read()
+            return jsonify(run_detect(data))
+
         except Exception as e:
             print(f"Detection Error: {str(e)}")
             return jsonify({'error': str(e)}), 500
         
     return jsonify({'error': 'Invalid file type'}), 400
 
+def run_analyze(data, ocr_dates):
+    """Full image OCR and date analysis for one upload, ocr_dates are the detector's readings if any"""
+    # the analysis counts days until expiry, so a cached answer is only good for today
+    cache_key = make_key(
+        data,
+        route='analyze',
+        translate_to='en',
+        full_ocr=app.config['FULL_OCR_BACKEND'],
+        detections=ocr_dates,
+        today=datetime.now().date().isoformat()
+    )
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # azure gets the uploaded bytes, nothing to decode here
+    image = IngestedImage(data)
+    deadline = Deadline(app.config['REQUEST_DEADLINE_S'])
+
+    # Extract & translatr detected texts from image, any language detected translate in english lang
+    result = full_ocr.extract_text(image, translate_to='en', deadline=deadline)
+
+    # using google gemini to brainstorm the output translated texts to conclude a concise result.
+    try:
+        analysis = text_analysis.analyze_text(result['translated_text'], ocr_dates, deadline=deadline)
+    except Exception as e:
+        print(f"Text Analysis Error: {str(e)}")
+        analysis = "Error analyzing text. Please check the API configuration."
+
+    response = {
+        'status': 'success',
+        'original_text': result['original_text'],
+
+        'translated_text': result['translated_text'],
+        'analysis': analysis
+    }
+    if is_cacheable_analysis(response):
+        result_cache.set(cache_key, response)
+
+    return response
+
 # API endpoint for OCR, translation and ananalogu of text in images
 @app.route('/analyze', methods=['POST'])
 def analyze():
@@ -102,35 +310,18 @@ def analyze():
     
     if file and allowed_file(file.filename):
         try:
-            image = Image.open(file.stream)
-            
-            # Extract & translatr detected texts from image, any language detected translate in english lang
-            result = azure_vision.extract_text(image, translate_to='en')
+            data = file.read()
 
             # Get OCR dates from the request if available
             ocr_dates = None
             if request.form.get('detections'):
                 try:
-                    import json
                     ocr_dates = json.loads(request.form.get('detections'))
                 except:
                     ocr_dates = None
-            
-            # using google gemini to brainstorm the output translated texts to conclude a concise result.
-            try:
-                analysis = text_analysis.analyze_text(result['translated_text'], ocr_dates)
-            except Exception as e:
-                print(f"Text Analysis Error: {str(e)}")
-                analysis = "Error analyzing text. Please check the API configuration."
-            
-            return jsonify({
-                'status': 'success',
-                'original_text': result['original_text'],
 
-                'translated_text': result['translated_text'],
-                'analysis': analysis
-            })
-            
+            return jsonify(run_analyze(data, ocr_dates))
+
         except Exception as e:
             print(f"Analysis Error: {str(e)}")
             return jsonify({
@@ -140,5 +331,371 @@ def analyze():
     
     return jsonify({'error': 'Invalid file type'}), 400
 
+def run_scan(data):
+    """Detection and analysis in one go, azure runs while the model does"""
+    cache_key = make_key(
+        data,
+        route='scan',
+        size=app.config['DETECTION_SIZE'],
+        min_detection_confidence=app.config['MIN_DETECTION_CONFIDENCE'],
+        max_ocr_crops=app.config['MAX_OCR_CROPS'],
+        ocr_time_budget_ms=app.config['OCR_TIME_BUDGET_MS'],
+        ladder=app.config['DETECTION_LADDER'],
+        ladder_min_confidence=app.config['LADDER_MIN_CONFIDENCE'],
+        prefilter=app.config['TEXT_PREFILTER'],
+        model=MODEL_ID,
+        translate_to='en',
+        full_ocr=app.config['FULL_OCR_BACKEND'],
+        today=datetime.now().date().isoformat()
+    )
+    # stored on hits too, same as run_detect: the cached urls must keep pointing at a file
+    stored = save_upload(data)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # one ingested image for both the model and azure, azure gets the original bytes
+    image = IngestedImage(data)
+
+    # cloud OCR runs on the azure pool while this thread does local inference
+    deadline = Deadline(app.config['REQUEST_DEADLINE_S'])
+    azure_future = full_ocr.extract_text_async(image, translate_to='en', deadline=deadline)
+
+    detected_dates = process_image(
+        image, model,
+        size=app.config['DETECTION_SIZE'],
+        min_detection_confidence=app.config['MIN_DETECTION_CONFIDENCE'],
+        scheduler=scheduler,
+        **pipeline_options()
+    )
+
+    try:
+        # the azure calls have their own timeouts from the deadline, this is just the last guard
+        text_result = azure_future.result(timeout=deadline.remaining() + 1.0)
+    except FutureTimeout:
+        azure_future.cancel()
+        text_result = {
+            'original_text': 'issue: Azure did not answer in time',
+            'translated_text': 'issue: Azure did not answer in time'
+        }
+    try:
+        analysis = text_analysis.analyze_text(text_result['translated_text'], detected_dates, deadline=deadline)
+    except Exception as e:
+        print(f"Text Analysis Error: {str(e)}")
+        analysis = "Error analyzing text. Please check the API configuration."
+
+    response = {
+        'status': 'success',
+        'image_path': stored['image_path'],
+        'thumbnail_path': stored['thumbnail_path'],
+        'image_width': image.size[0],
+        'image_height': image.size[1],
+        'detections': detected_dates,
+        'rung': detection_rung(detected_dates),
+        'original_text': text_result['original_text'],
+        'translated_text': text_result['translated_text'],
+        'analysis': analysis
+    }
+    if is_cacheable_analysis(response):
+        result_cache.set(cache_key, response)
+
+    return response
+
+# API endpoint doing detection and analysis in one upload, azure runs while the model does
+@app.route('/scan', methods=['POST'])
+def scan():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    
+    if file and allowed_file(file.filename):
+        try:
+            data = file.read()
+            return jsonify(run_scan(data))
+
+        except Exception as e:
+            print(f"Scan Error: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 500
+
+    return jsonify({'error': 'Invalid file type'}), 400
+
+def batch_uploads():
+    """(name, bytes) for every image of a batch request, zip archives are opened member by member
+    so only the image being read is in memory (werkzeug keeps big uploads in temp files)"""
+    for file in request.files.getlist('files') + request.files.getlist('archive'):
+        if file.filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                yield file.filename, None
+                continue
+            for member in archive.infolist():
+                if member.is_dir() or not allowed_file(member.filename):
+                    continue
+                if member.file_size > app.config['MAX_CONTENT_LENGTH']:
+                    # same per image limit as /detect, also keeps a zip bomb from blowing up
+                    yield member.filename, None
+                    continue
+                yield member.filename, archive.read(member)
+        elif allowed_file(file.filename):
+            yield file.filename, file.read()
+        else:
+            yield file.filename, None
+
+def detect_group(group):
+    """Detection, crop OCR and date analysis for a group of (index, name, bytes), one model forward for
+    the whole group. Yields one result per image as soon as its OCR is done"""
+    size = app.config['DETECTION_SIZE']
+    options = pipeline_options()
+    prepared, rejected = [], []
+    for index, name, data in group:
+        try:
+            image = IngestedImage(data)
+            if text_prefilter is not None and not text_prefilter.analyze(image).has_text:
+                # no text at all, stays out of the forward (the whole group shares one, so no roi crop here)
+                rejected.append((index, name, data, image))
+                continue
+            tensor, scale = prepare_image(image, size)
+            prepared.append((index, name, data, image, tensor, scale))
+        except Exception as e:
+            yield {'index': index, 'name': name, 'error': f"could not read image: {str(e)}"}
+
+    for index, name, data, image in rejected:
+        yield batch_line(index, name, data, image, [])
+    if not prepared:
+        return
+
+    try:
+        with metrics.timed('forward'):
+            predictions = run_model(model, [tensor for _, _, _, _, tensor, _ in prepared])
+    except Exception as e:
+        print(f"Batch forward Error: {str(e)}")
+        for index, name, _, _, _, _ in prepared:
+            yield {'index': index, 'name': name, 'error': f"detection failed: {str(e)}"}
+        return
+
+    for (index, name, data, image, _, scale), prediction in zip(prepared, predictions):
+        try:
+            crops = collect_crops(image, prediction, scale, app.config['MIN_DETECTION_CONFIDENCE'])
+            crops, ocr_results = read_crops_lazily(crops, max_ocr_crops=options['max_ocr_crops'],
+                                                   ocr_time_budget=options['ocr_time_budget'])
+            detections = build_detections(crops, ocr_results)
+        except Exception as e:
+            print(f"Batch OCR Error: {str(e)}")
+            yield {'index': index, 'name': name, 'error': str(e)}
+            continue
+        yield batch_line(index, name, data, image, detections)
+
+def batch_line(index, name, data, image, detections):
+    stored = save_upload(data)
+    return {
+        'index': index,
+        'name': name,
+        'image_path': stored['image_path'],
+        'image_width': image.size[0],
+        'image_height': image.size[1],
+        'detections': detections,
+        # only the detector's readings, a gemini call per image would cost more than the batch saves
+        'analysis': text_analysis.analyze_text('', detections, use_gemini=False)
+    }
+
+# Many images in one request (multipart `files` and/or zip `archive`), the answer is NDJSON:
+# one line per image as soon as it is done (index = position in the upload), then a summary line
+@app.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    if not request.files.getlist('files') and not request.files.getlist('archive'):
+        return jsonify({'error': 'No files uploaded'}), 400
+
+    def lines():
+        started = datetime.now()
+        count = errors = 0
+        group = []
+
+        def flush():
+            for record in detect_group(group):
+                yield json.dumps(record) + '\n'
+            group.clear()
+
+        for name, data in batch_uploads():
+            if count >= app.config['BATCH_MAX_IMAGES']:
+                yield json.dumps({'error': f"more than {app.config['BATCH_MAX_IMAGES']} images, the rest was skipped"}) + '\n'
+                break
+            if data is None:
+                errors += 1
+                yield json.dumps({'index': count, 'name': name, 'error': 'Invalid file type or too large'}) + '\n'
+            else:
+                group.append((count, name, data))
+                if len(group) >= app.config['BATCH_GROUP_SIZE']:
+                    yield from flush()
+            count += 1
+        if group:
+            yield from flush()
+
+        seconds = (datetime.now() - started).total_seconds()
+        yield json.dumps({'done': True, 'images': count, 'rejected': errors, 'seconds': seconds}) + '\n'
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+def run_job(kind, payload):
+    # same work as the synchronous routes, the deadline starts when a worker picks the job up
+    if kind == 'detect':
+        return run_detect(payload['data'])
+    if kind == 'analyze':
+        return run_analyze(payload['data'], payload.get('detections'))
+    return run_scan(payload['data'])
+
+# the job queue is per gunicorn worker like the rest of the state, a job id only means something
+# to the worker that took it (same sticky routing note as the live scan)
+job_queue = JobQueue(run_job)
+
+JOB_KINDS = ('detect', 'analyze', 'scan')
+
+# Async version of /detect, /analyze and /scan: answers 202 with a job id right away,
+# or 429 when the queue is full. the result comes from GET /jobs/<id> or its event stream
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    file = request.files['file']
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    kind = request.form.get('kind', 'scan')
+    if kind not in JOB_KINDS:
+        return jsonify({'error': f"kind must be one of {', '.join(JOB_KINDS)}"}), 400
+
+    payload = {'data': file.read()}
+    if kind == 'analyze' and request.form.get('detections'):
+        try:
+            payload['detections'] = json.loads(request.form.get('detections'))
+        except:
+            payload['detections'] = None
+
+    try:
+        job = job_queue.submit(kind, payload)
+    except QueueFull as e:
+        response = jsonify({'error': 'Too many requests in the queue, try again later', 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    response = jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}',
+        'events_url': f'/jobs/{job.id}/events'
+    })
+    response.headers['Location'] = f'/jobs/{job.id}'
+    return response, 202
+
+# queue depth, wait times and counts of this worker
+@app.route('/jobs', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+# Server-Sent Events: one event per status change, the stream ends with the result
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+
+    def events():
+        version = None
+        while True:
+            if version != job.version:
+                version = job.version
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.is_finished:
+                    return
+            elif job_queue.wait(job, version, timeout=15) == version:
+                # comment line so proxies don't close an idle stream
+                yield ": keepalive\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx would hold the events back otherwise
+    return response
+
+# Live scan: one plain request per camera frame (no websocket, nothing chunked), the browser sends the
+# next frame when the answer is back. every answer has the tracked boxes and the best date seen so far
+# in this session. frames are not stored
+@app.route('/stream/frame', methods=['POST'])
+def stream_frame():
+    if 'frame' not in request.files:
+        return jsonify({'error': 'No frame uploaded'}), 400
+
+    session_id = request.form.get('session_id') or uuid.uuid4().hex
+    try:
+        session = stream_sessions.get(session_id)
+        return jsonify(session.process(request.files['frame'].read()))
+    except Exception as e:
+        print(f"Stream Error: {str(e)}")
+        return jsonify({'session_id': session_id, 'error': str(e)}), 500
+
+@app.route('/stream/end', methods=['POST'])
+def stream_end():
+    stats = stream_sessions.end(request.form.get('session_id', ''))
+    return jsonify({'status': 'ended', 'stats': stats})
+
+# Prometheus scrape endpoint, every gunicorn worker keeps its own numbers
+@app.route('/metrics')
+def metrics_endpoint():
+    cache = result_cache.stats()
+    gauges = {
+        'expiry_result_cache_hits': ('Result cache hits (memory and disk)', cache['hits']),
+        'expiry_result_cache_disk_hits': ('Result cache hits served from disk', cache['disk_hits']),
+        'expiry_result_cache_misses': ('Result cache misses', cache['misses']),
+        'expiry_result_cache_evictions': ('Results evicted from the cache', cache['evictions']),
+        'expiry_result_cache_memory_bytes': ('Bytes held by the in-memory cache tier', cache['memory_bytes']),
+        'expiry_result_cache_disk_bytes': ('Bytes held by the disk cache tier', cache['disk_bytes'])
+    }
+    uploads = upload_store.stats()
+    gauges['expiry_upload_store_bytes'] = ('Bytes kept in the upload folder by the store', uploads['total_bytes'])
+    gauges['expiry_upload_store_pending'] = ('Uploads waiting for the writer thread', uploads['pending'])
+    gauges['expiry_upload_store_duplicates'] = ('Uploads that were already stored', uploads['duplicates'])
+    gauges['expiry_upload_store_evictions'] = ('Uploads removed by the retention policy', uploads['evictions'])
+    # only a loaded pool has restarts, /metrics should not be the thing that loads paddle
+    if ocr_service.loaded and hasattr(ocr_service.get(), 'restarts'):
+        gauges['expiry_ocr_pool_restarts'] = ('Times the OCR worker pool was rebuilt after a crash', ocr_service.restarts)
+    if hasattr(full_ocr, 'restarts'):
+        gauges['expiry_local_ocr_restarts'] = ('Times the local OCR tile pool was rebuilt after a crash', full_ocr.restarts)
+    # memo of paid API answers, shared on disk but counted per worker
+    for memo in filter(None, (getattr(full_ocr, 'memo', None), text_analysis.memo)):
+        for namespace, counts in memo.stats().items():
+            gauges[f'expiry_memo_{namespace}_hits'] = (f'{namespace} answers served from the memo store', counts['hits'])
+            gauges[f'expiry_memo_{namespace}_misses'] = (f'{namespace} lookups that had to call the API', counts['misses'])
+    jobs = job_queue.stats()
+    gauges['expiry_job_queue_depth'] = ('Jobs waiting for a worker', jobs['depth'])
+    gauges['expiry_job_running'] = ('Jobs being worked on', jobs['running'])
+    gauges['expiry_job_rejected'] = ('Jobs turned away with 429 because the queue was full', jobs['rejected'])
+    gauges['expiry_job_completed'] = ('Jobs finished, failed ones included', jobs['completed'] + jobs['failed'])
+    gauges['expiry_job_wait_p50_seconds'] = ('Median time jobs waited in the queue (last 500)', jobs['wait_p50_seconds'])
+    gauges['expiry_job_wait_p95_seconds'] = ('95th percentile queue wait (last 500)', jobs['wait_p95_seconds'])
+    gauges['expiry_stream_sessions'] = ('Live scan sessions held by this worker', stream_sessions.stats()['active'])
+    # 1 while a breaker is open and calls to that service fail fast
+    breakers = [getattr(full_ocr, 'vision_breaker', None), getattr(full_ocr, 'translator_breaker', None),
+                text_analysis.gemini_breaker]
+    for breaker in filter(None, breakers):
+        gauges[f'expiry_breaker_open_{breaker.name}'] = (f'{breaker.name} circuit breaker is open', int(breaker.is_open()))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # under gunicorn the warmup runs in post_fork, see gunicorn.conf.py
+    if os.getenv('WARMUP', '1') == '1':
+        warmup(model, ocr_service, sizes=(app.config['DETECTION_SIZE'],))
     app.run(debug=True) 
\ No newline at end of file
@@ -2,7 +2,15 @@ from azure.cognitiveservices.vision.computervision import ComputerVisionClient
 from msrest.authentication import CognitiveServicesCredentials
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.translation.text import TextTranslationClient
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
+from metrics import timed
+from image_ingest import IngestedImage
+from resilience import CircuitBreaker, Deadline, hedged_call
+from memo_store import MemoStore, memo_key
+import requests
 import os
 import io
 
@@ -10,7 +18,7 @@ import io
 load_dotenv()
 
 class AzureVisionService:
-    def __init__(self):
+    def __init__(self, max_workers=None, memo=None):
 
         self.vision_endpoint = os.getenv('AZURE_VISION_ENDPOINT')
         self.vision_key = os.getenv('AZURE_VISION_KEY')
@@ -19,96 +27,242 @@ class AzureVisionService:
         if not all([self.vision_endpoint, self.vision_key, self.translator_key]):
             raise ValueError("not all keys are there in env, check the subscription status in azureportal. if its not active anymore")
         
+        # how many azure calls one worker keeps in flight, also the size of the connection pools
+        self.max_workers = max_workers or int(os.getenv('AZURE_MAX_WORKERS', 8))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='azure')
+        
         # Setting up the OCR service
         self.vision_client = ComputerVisionClient(
             endpoint=self.vision_endpoint,
             credentials=CognitiveServicesCredentials(self.vision_key)
         )
-        self.vision_client.config.connection.timeout = 15.0  # using 15s timeout- changee to 10 when in production
+        # using 15s timeout- changee to 10 when in production. a call never gets more than what's left of the request budget
+        self.call_timeout = float(os.getenv('AZURE_TIMEOUT_S', 15.0))
+        self.request_budget = float(os.getenv('REQUEST_DEADLINE_S', 20.0))
+        self.hedge_after = float(os.getenv('AZURE_HEDGE_MS', 0)) / 1000.0 or None
+        self.vision_client.config.connection.timeout = self.call_timeout
+        # keep the session (and its sockets) open between calls instead of closing it after every request
+        self.vision_client.config.keep_alive = True
+        self.vision_client.config.session_configuration_callback = self._configure_vision_session
         
           #   translation service - ()
-        self.translator_endpoint = "https://api.cognitive.microsofttranslator.com"
-        self.translator_location = "centralindia"
+        self.translator_endpoint = os.getenv('AZURE_TRANSLATOR_ENDPOINT', "https://api.cognitive.microsofttranslator.com")
+        self.translator_location = os.getenv('AZURE_TRANSLATOR_REGION', "centralindia")
+        self.translator_session = self._pooled_session()
         self.translator_client = TextTranslationClient(
             endpoint=self.translator_endpoint,
-            credential=AzureKeyCredential(self.translator_key)
+            credential=AzureKeyCredential(self.translator_key),
+            transport=RequestsTransport(session=self.translator_session, session_owner=False)
         )
 
-    def extract_text(self, image, translate_to='en'):
-        """Extract text from image and translate it to the angreji language"""
-        try:
+        # after a few failures in a row we stop calling azure and answer right away, a background
+        # probe closes the breaker again once the endpoint answers
+        failures = int(os.getenv('AZURE_BREAKER_FAILURES', 5))
+        probe_interval = float(os.getenv('AZURE_BREAKER_PROBE_S', 5.0))
+        self.vision_breaker = CircuitBreaker('azure_vision', failures, probe_interval=probe_interval,
+                                             probe=lambda: self._probe(self.vision_endpoint))
+        self.translator_breaker = CircuitBreaker('azure_translator', failures, probe_interval=probe_interval,
+                                                 probe=lambda: self._probe(self.translator_endpoint))
+
+        # OCR text per image and translations per text survive restarts, a rescanned product costs nothing
+        self.memo = memo or MemoStore()
+
+    def _pooled_session(self):
+        session = requests.Session()
+        self._mount_pool(session)
+        return session
+
+    def _mount_pool(self, session):
+        """Give the session a pool that holds one connection per worker thread"""
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session._pooled = True
+
+    def _configure_vision_session(self, session, global_config, local_config, **kwargs):
+        # msrest creates the session itself, so the bigger pool gets mounted on first use
+        if not getattr(session, '_pooled', False):
+            self._mount_pool(session)
+        return kwargs
+
+    def _probe(self, endpoint):
+        # any answer below 500 (even 401/404) means the service is reachable again
+        response = self.translator_session.head(endpoint, timeout=3)
+        return response.status_code < 500
+
+    def _call(self, breaker, deadline, send):
+        """send(timeout) through the breaker, hedged when AZURE_HEDGE_MS is set"""
+        timeout = deadline.timeout(self.call_timeout)
+        call = lambda: breaker.call(send, timeout)
+        if self.hedge_after:
+            return hedged_call(call, hedge_after=self.hedge_after, deadline=deadline)
+        return call()
+
+    def _recognize(self, image, deadline=None):
+        """Run Azure OCR on the image and join every detected line into one string"""
+        deadline = deadline or Deadline(self.request_budget)
+        if isinstance(image, IngestedImage):
+            # the uploaded jpeg goes as it is, no decode and no png re-encode
+            image_bytes = image.data
+        else:
             # Convert image format Azure can use
             img_byte_arr = io.BytesIO()
             image.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)  # Go back to start of byte array
+            image_bytes = img_byte_arr.getvalue()
 
-            # point 1: Extract text from image using OCR
-            try:
-                result = self.vision_client.recognize_printed_text_in_stream(
-                    image=img_byte_arr,
-                    language='ko',  # Assuming Korean text
-                    detect_orientation=True
+        key = memo_key(image_bytes, 'ko')
+        cached = self.memo.get('ocr_text', key)
+        if cached is not None:
+            return cached
+
+        def send(timeout):
+            # a fresh stream per attempt, a hedged second call must not share the read position
+            return self.vision_client.recognize_printed_text_in_stream(
+                image=io.BytesIO(image_bytes),
+                language='ko',  # Assuming Korean text
+                detect_orientation=True,
+                connection_timeout=timeout
+            )
+
+        with timed('azure_ocr'):
+            result = self._call(self.vision_breaker, deadline, send)
+
+        all_text = []
+        if result.regions:
+            for region in result.regions:
+                for line in region.lines:
+                    line_text = " ".join(word.text for word in line.words)
+                    all_text.append(line_text)
+
+        text = " ".join(all_text)
+        self.memo.set('ocr_text', key, text)
+        return text
+
+    def translate_texts(self, texts, translate_to='en', from_language='ko', deadline=None):
+        """Translate many texts with as few requests as possible, the API takes a list body (None when it answers nothing)"""
+        deadline = deadline or Deadline(self.request_budget)
+        keys = [memo_key(from_language, translate_to, text) for text in texts]
+        translated = [self.memo.get('translation', key) for key in keys]
+        missing = [i for i, text in enumerate(translated) if text is None]
+        if not missing:
+            return translated
+
+        fresh = []
+        headers = {'Ocp-Apim-Subscription-Region': self.translator_location}
+
+        # only the texts nobody translated before go to azure
+        for chunk in _translation_chunks([texts[i] for i in missing]):
+            def send(timeout, chunk=chunk):
+                return self.translator_client.translate(
+                    body=[{'text': text} for text in chunk],
+                    to_language=[translate_to],
+                    from_language=from_language,           # testing to convert only korean language as of now. can add more if needed.
+                    headers=headers,
+                    connection_timeout=timeout,
+                    read_timeout=timeout
                 )
+
+            with timed('azure_translate'):
+                response = self._call(self.translator_breaker, deadline, send)
+            if not response or len(response) != len(chunk):
+                return None
+            fresh.extend(item.translations[0].text for item in response)
+
+        for i, text in zip(missing, fresh):
+            translated[i] = text
+            self.memo.set('translation', keys[i], text)
+        return translated
+
+    def extract_text(self, image, translate_to='en', deadline=None):
+        """Extract text from image and translate it to the angreji language"""
+        try:
+            return self.extract_texts([image], translate_to, deadline)[0]
+        except Exception as e:
+            print(f"General Error: {str(e)}")
+            return {
+                'original_text': 'Error processing image',
+                'translated_text': 'Error processing image'
+            }
+
+    def extract_text_async(self, image, translate_to='en', deadline=None):
+        """Same as extract_text but runs on the shared pool, returns a future"""
+        return self.executor.submit(self.extract_text, image, translate_to, deadline)
+
+    def extract_texts(self, images, translate_to='en', deadline=None):
+        """OCR every image concurrently, then translate all of their text in one request"""
+        # one budget for the OCR calls and the translation together
+        deadline = deadline or Deadline(self.request_budget)
+        results = [None] * len(images)
+        original_texts = {}
+
+        # point 1: Extract text from every image using OCR
+        # a single image runs inline, extract_text_async already sits on a pool thread and must not wait on the pool
+        if len(images) == 1:
+            futures = [_inline(self._recognize, images[0], deadline)]
+        else:
+            futures = [self.executor.submit(self._recognize, image, deadline) for image in images]
+        for i, future in enumerate(futures):
+            try:
+                original_text = future.result()
             except Exception as e:
                 print(f"OCR Error: {str(e)}")
-                return {
+                results[i] = {
                     'original_text': 'issue: cant connect to Azure Vision API',
                     'translated_text': 'issue: Vision is not in service anymore '
                 }
+                continue
 
-            # point 2: Combine all detected text
-            all_text = []
-            if result.regions:
-                for region in result.regions:
-                    for line in region.lines:
-                        line_text = " ".join(word.text for word in line.words)
-                        all_text.append(line_text)
-
-            original_text = " ".join(all_text)
-            
             #send back early if not texr founded.
             if not original_text.strip():
-                return {
+                results[i] = {
                     'original_text': 'No text detected in image',
                     'translated_text': 'No text detected in image'
                 }
+                continue
 
-            # point 3: Translate the text
-            try:
-                translation_input = [{'text': original_text}]
-                headers = {'Ocp-Apim-Subscription-Region': self.translator_location}
-
-                # Call translation API
-                response = self.translator_client.translate(
-                    body=translation_input,
-                    to_language=[translate_to],
-                    from_language='ko',           # testing to convert only korean language as of now. can add more if needed.
-                    headers=headers
-                )
+            original_texts[i] = original_text
 
-                # Get translated text from response
-                if response and len(response) > 0:
-                    translated_text = response[0].translations[0].text
-                    return {
-                        'original_text': original_text,
-                        'translated_text': translated_text
-                    }
-                else:
-                    return {
-                        'original_text': original_text,
-                        'translated_text': 'Translation failed - no response'
-                    }
-                
-            except Exception as e:
-                print(f"Translation Error: {str(e)}")
-                return {
-                    'original_text': original_text,
-                    'translated_text': f'Translation failed: {str(e)}'
-                }
+        if not original_texts:
+            return results
 
+        # point 2: Translate the text of all images together
+        indexes = list(original_texts)
+        try:
+            translated = self.translate_texts([original_texts[i] for i in indexes], translate_to, deadline=deadline)
         except Exception as e:
-            print(f"General Error: {str(e)}")
-            return {
-                'original_text': 'Error processing image',
-                'translated_text': 'Error processing image'
-            } 
\ No newline at end of file
+            print(f"Translation Error: {str(e)}")
+            translated = [f'Translation failed: {str(e)}'] * len(indexes)
+
+        if translated is None:
+            translated = ['Translation failed - no response'] * len(indexes)
+
+        for i, translated_text in zip(indexes, translated):
+            results[i] = {
+                'original_text': original_texts[i],
+                'translated_text': translated_text
+            }
+
+        return results
+
+
+def _inline(fn, *args):
+    """Run fn right away and wrap the outcome in a finished future"""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _translation_chunks(texts, max_items=1000, max_chars=50000):
+    """Split texts so each translate request stays under the API's element and character limits"""
+    chunk, chars = [], 0
+    for text in texts:
+        if chunk and (len(chunk) >= max_items or chars + len(text) > max_chars):
+            yield chunk
+            chunk, chars = [], 0
+        chunk.append(text)
+        chars += len(text)
+    if chunk:
+        yield chunk
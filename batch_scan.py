@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# filled in once per pool process by init_worker
+_worker = {}
+
+
+def find_images(inputs, list_file=None):
+    """Every image under the given folders/files plus the paths listed in list_file, in a stable order"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.append(item)
+
+    if list_file:
+        with open(list_file, 'r', encoding='utf-8') as f:
+            paths.extend(line.strip() for line in f if line.strip())
+
+    # same file given twice only gets scanned once
+    seen = set()
+    unique = []
+    for path in sorted(paths):
+        if path not in seen:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def load_done(output_path):
+    """Paths already in the output file. A half written last line from a killed run, or any other line
+    without a path, gets dropped"""
+    if not os.path.exists(output_path):
+        return set()
+
+    done = set()
+    good_lines = []
+    broken = False
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                broken = True
+                continue
+            # valid json without a path can't be matched to an image, drop it so the image gets rescanned
+            path = record.get('path') if isinstance(record, dict) else None
+            if path is None:
+                broken = True
+                continue
+            if not line.endswith('\n'):
+                broken = True
+                line += '\n'
+            done.add(path)
+            good_lines.append(line)
+
+    if broken:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.writelines(good_lines)
+    return done
+
+
+def init_worker(backend, threads):
+    # the model and paddle are loaded once per process, not once per batch
+    import torch
+    torch.set_num_threads(threads)
+    os.environ.setdefault('OCR_CPU_THREADS', str(threads))
+    # these processes already are the parallelism, no OCR pool inside them
+    os.environ['OCR_POOL_SIZE'] = '0'
+
+    from date_engine import DateEngine
+    from test_model import load_model
+    _worker['model'] = load_model(backend)
+    _worker['dates'] = DateEngine()
+
+
+def scan_batch(paths, size=640, min_detection_confidence=0.3):
+    """decode -> resize -> one forward for the batch -> one OCR pass over all crops -> dates"""
+    from image_ingest import IngestedImage
+    from test_model import build_detections, collect_crops, ocr_service, prepare_image, run_model
+
+    records = []
+    images = []
+    for path in paths:
+        try:
+            # draft decode for the detector, full resolution only for images that have crops
+            image = IngestedImage.from_path(path)
+            tensor, scale = prepare_image(image, size)
+            images.append((path, image, tensor, scale))
+        except Exception as e:
+            records.append({'path': path, 'error': f"decode failed: {str(e)}"})
+
+    if not images:
+        return records
+
+    try:
+        predictions = run_model(_worker['model'], [tensor for _, _, tensor, _ in images])
+    except Exception as e:
+        print(f"Batch forward Error: {str(e)}")
+        return records + [{'path': path, 'error': f"detection failed: {str(e)}"} for path, _, _, _ in images]
+
+    # crops of the whole batch go through paddle together, then get split back per image
+    crops_per_image = [collect_crops(image, prediction, scale, min_detection_confidence)
+                       for (_, image, _, scale), prediction in zip(images, predictions)]
+    all_crops = [crop for crops in crops_per_image for crop in crops]
+    ocr_results = ocr_service.read_text_batch([crop['region'] for crop in all_crops])
+
+    start = 0
+    for (path, image, _, _), crops in zip(images, crops_per_image):
+        detections = build_detections(crops, ocr_results[start:start + len(crops)])
+        start += len(crops)
+
+        for detection in detections:
+            date = _worker['dates'].parse(_worker['dates'].clean(detection['paddle_text']))
+            detection['parsed_date'] = date.strftime('%Y-%m-%d') if date else None
+
+        dates = [detection['parsed_date'] for detection in detections if detection['parsed_date']]
+        records.append({
+            'path': path,
+            'width': image.size[0],
+            'height': image.size[1],
+            'detections': detections,
+            'best_date': dates[0] if dates else None
+        })
+
+    return records
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run(paths, output_path, workers, batch_size, backend, size, min_detection_confidence):
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # a few batches queued per worker keeps everyone busy without loading the whole archive up front
+    max_pending = workers * 2
+    batches = chunks(paths, batch_size)
+    scanned = 0
+    failed = 0
+    started = time.time()
+
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(backend, threads)) as pool:
+        pending = set()
+        while True:
+            for batch in batches:
+                pending.add(pool.submit(scan_batch, batch, size, min_detection_confidence))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                # results are written as soon as a batch is done, so a killed run keeps what it had
+                for record in future.result():
+                    out.write(json.dumps(record) + '\n')
+                    scanned += 1
+                    failed += 'error' in record
+                out.flush()
+
+            elapsed = time.time() - started
+            print(f"{scanned}/{len(paths)} images, {scanned / elapsed:.1f} img/s, {failed} failed")
+
+    return scanned, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a folder or list of images for expiry dates, results go to a JSONL file")
+    parser.add_argument('inputs', nargs='*', help="image files or folders")
+    parser.add_argument('--list', dest='list_file', help="text file with one image path per line")
+    parser.add_argument('--output', default='scan_results.jsonl')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--backend', default=os.getenv('MODEL_BACKEND', 'eager'))
+    parser.add_argument('--size', type=int, default=640)
+    parser.add_argument('--min-confidence', type=float, default=0.3)
+    parser.add_argument('--restart', action='store_true', help="ignore earlier results and scan everything again")
+    args = parser.parse_args()
+
+    paths = find_images(args.inputs, args.list_file)
+    if not paths:
+        parser.error("no images found")
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_done(args.output)
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} images, {len(done & set(paths))} already scanned, {len(todo)} to go")
+    if not todo:
+        return 0
+
+    scanned, failed = run(todo, args.output, max(1, args.workers), max(1, args.batch_size),
+                          args.backend, args.size, args.min_confidence)
+    print(f"Done: {scanned} scanned, {failed} failed, results in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
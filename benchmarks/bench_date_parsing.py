@@ -0,0 +1,166 @@
+"""Microbenchmark: DateEngine against the regex + strptime parsing TextAnalysisService used before
+
+    python -m benchmarks.bench_date_parsing
+"""
+import random
+import re
+import sys
+import timeit
+from datetime import datetime
+
+from date_engine import DateEngine
+
+
+class LegacyDateParser:
+    """The old TextAnalysisService helpers, copied as they were"""
+
+    def _clean_date_string(self, text):
+        """kick out everything thats not part of the date"""
+        # work on strings
+        text = str(text).strip()
+        # some patterns that are not part of the date but often appear near to them in the text
+        filler_words = [
+            'best before', 'best by', 'use by', 
+            'expiry', 'expiration', 'exp', 
+            'date', 'sell by', 'valid until'
+        ]
+        
+        for word in filler_words:
+            text = re.sub(r'(?i)' + word, '', text)
+        text = text.strip()
+        
+        # Handle the tricky YYYYMM/DD format                  -- # Ai generated code for the specific error types found on random image in testing.
+        if re.match(r'^\d{6}/\d{1,2}$', text):
+            y, m, d = text[:4], text[4:6], text.split('/')[1]
+            return f"{y}/{m}/{d}"
+        
+        return text
+    
+    def _looks_like_date(self, text):
+        date_pattern = r'\d+[-/.,]\d+|^\d{6,8}$'
+        return bool(re.search(date_pattern, text))
+    
+    def _parse_date(self, text):
+        text = text.strip()
+        # Format:  (20240402)
+        if re.match(r'^\d{8}$', text):
+            try:
+                y, m, d = int(text[:4]), int(text[4:6]), int(text[6:8])
+                # fast validation
+                if 1 <= m <= 12 and 1 <= d <= 31:
+                    return datetime(y, m, d)
+            except ValueError:
+                pass
+        
+        # Format: YYYYMM (202401)
+        if re.match(r'^\d{6}$', text):
+            try:
+                y, m = int(text[:4]), int(text[4:6])
+                if 1 <= m <= 12:
+                    # Default to 1st of month when day not specified
+                    return datetime(y, m, 1)
+            except ValueError:
+                pass
+        
+        # Format: (2022.07.19)
+        if re.match(r'^\d{4}[.]\d{2}[.]\d{2}$', text):
+            try:
+                y = int(text[:4])
+                m = int(text[5:7])
+                d = int(text[8:10])
+                if 1 <= m <= 12 and 1 <= d <= 31:
+                    return datetime(y, m, d)
+            except ValueError:
+                pass
+        
+        #  standard formats as a fallback mechanism
+        date_formats = [
+            # day first
+            '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y',
+            
+            # Mmonth first 
+            '%m/%d/%Y', '%m-%d-%Y', '%m.%d.%Y',
+            
+            # year first 
+            '%Y/%m/%d', '%Y-%m-%d', '%Y.%m.%d',
+            
+            # month year only
+            '%m/%Y', '%m-%Y', '%m.%Y',
+            
+            # year month only
+            '%Y/%m', '%Y-%m', '%Y.%m'
+        ]
+        
+        # retry try hard until any one of that works up
+        for fmt in date_formats:
+            try:
+                return datetime.strptime(text, fmt)
+            except ValueError:
+                # No match, try the next format
+                continue
+        
+        # finaslly
+        return None
+
+
+# what paddle actually hands us: clean dates, filler words, compact formats and junk
+SAMPLES = [
+    '2024.07.19', '20240530', '202501/28', '202401', '25/12/2023', '12/25/2023', '2023/12/25',
+    '12/2023', '2023-12', 'EXP 2024.05.01', 'Best before 12/2024', 'use by 1.2.2025',
+    '31/02/2023', 'LOT A1234', '8801234567890', 'sell by 2024-06-05', 'expiry date 05.06.24'
+]
+
+
+def make_corpus(size, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(SAMPLES) for _ in range(size)]
+
+
+def legacy_pipeline(parser, texts):
+    results = []
+    for text in texts:
+        clean = parser._clean_date_string(text)
+        results.append(parser._parse_date(clean) if parser._looks_like_date(clean) else None)
+    return results
+
+
+def engine_pipeline(engine, texts):
+    results = []
+    for text in texts:
+        clean = engine.clean(text)
+        results.append(engine.parse(clean) if engine.looks_like_date(clean) else None)
+    return results
+
+
+def main(size=20000, repeat=5):
+    texts = make_corpus(size)
+    parser = LegacyDateParser()
+
+    # parity first, a fast wrong answer is worth nothing
+    if legacy_pipeline(parser, texts) != engine_pipeline(DateEngine(), texts):
+        print("engine and legacy parser disagree!")
+        return 1
+
+    legacy = min(timeit.repeat(lambda: legacy_pipeline(parser, texts), number=1, repeat=repeat))
+    # a new engine per run so the cold number includes filling the memo
+    cold = min(timeit.repeat(lambda: engine_pipeline(DateEngine(), texts), number=1, repeat=repeat))
+    warm_engine = DateEngine()
+    engine_pipeline(warm_engine, texts)
+    warm = min(timeit.repeat(lambda: engine_pipeline(warm_engine, texts), number=1, repeat=repeat))
+
+    unique_texts = [f"{d:02d}/{m:02d}/{y}" for y in range(2000, 2030) for m in range(1, 13) for d in range(1, 29)]
+    legacy_unique = min(timeit.repeat(lambda: legacy_pipeline(parser, unique_texts), number=1, repeat=repeat))
+    engine_unique = min(timeit.repeat(lambda: engine_pipeline(DateEngine(), unique_texts), number=1, repeat=repeat))
+
+    print(f"{size} strings from {len(SAMPLES)} samples")
+    print(f"legacy          {legacy * 1000:8.1f} ms  {legacy / size * 1e6:6.2f} us/string")
+    print(f"engine (cold)   {cold * 1000:8.1f} ms  {cold / size * 1e6:6.2f} us/string  x{legacy / cold:.1f}")
+    print(f"engine (warm)   {warm * 1000:8.1f} ms  {warm / size * 1e6:6.2f} us/string  x{legacy / warm:.1f}")
+    print(f"{len(unique_texts)} unique dates, no memo hits")
+    print(f"legacy          {legacy_unique * 1000:8.1f} ms")
+    print(f"engine          {engine_unique * 1000:8.1f} ms  x{legacy_unique / engine_unique:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Calibrate the resolution ladder on the upload corpus
+
+Every rung is timed on its own for every image, then candidate ladders are simulated from those
+numbers: cost is the time of all rungs tried until one finds a confident date box.
+
+    python -m benchmarks.bench_ladder
+    python -m benchmarks.bench_ladder --ladders "320,640" "320,640,960,640r90" --min-confidence 0.5
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from benchmarks.bench_pipeline import percentile
+
+DEFAULT_LADDERS = ['640', '320,640', '480,960', '320,640,960', '320,640,960,640r90', '480,800,640r90,640r270']
+
+
+def confident_date(detections, min_confidence):
+    return any(d['is_date'] and d['detection_confidence'] >= min_confidence for d in detections)
+
+
+def top_text(detections):
+    return detections[0]['paddle_text'] if detections else None
+
+
+def measure(paths, model, rung_specs, min_confidence):
+    """Per image: how long the fixed 640 pass and every rung take, and what they find"""
+    from image_ingest import IngestedImage
+    from test_model import Rung, process_image, process_image_ladder, sized_model
+
+    rungs = [Rung(size, angle, sized_model(model, size)) for size, angle in rung_specs]
+    rows = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        # a fresh IngestedImage every time so no rung profits from another one's decode
+        start = time.perf_counter()
+        reference = process_image(IngestedImage(data), model, size=640)
+        row = {
+            'path': path,
+            'reference': {'seconds': time.perf_counter() - start, 'text': top_text(reference),
+                          'found': confident_date(reference, min_confidence)},
+            'rungs': {}
+        }
+
+        for rung in rungs:
+            start = time.perf_counter()
+            detections = process_image_ladder(IngestedImage(data), [rung], ladder_min_confidence=min_confidence)
+            row['rungs'][rung.label] = {'seconds': time.perf_counter() - start, 'text': top_text(detections),
+                                        'found': confident_date(detections, min_confidence)}
+        rows.append(row)
+        print(f"{os.path.basename(path)}: " + ', '.join(
+            f"{label} {'Y' if r['found'] else '-'} {r['seconds'] * 1000:.0f}ms" for label, r in row['rungs'].items()))
+    return rows
+
+
+def simulate(rows, ladder_labels):
+    costs, answered_by, lost = [], {}, []
+    found = agree = gained = 0
+    for row in rows:
+        cost = 0.0
+        answer = None
+        for label in ladder_labels:
+            result = row['rungs'][label]
+            cost += result['seconds']
+            if result['found']:
+                answer = (label, result)
+                break
+        costs.append(cost)
+        # per image, a ladder must not trade a date the fixed pass found for one on another image
+        if row['reference']['found'] and not answer:
+            lost.append(row['path'])
+        if answer and not row['reference']['found']:
+            gained += 1
+        if answer:
+            found += 1
+            answered_by[answer[0]] = answered_by.get(answer[0], 0) + 1
+            agree += answer[1]['text'] == row['reference']['text']
+    return {
+        'mean_ms': sum(costs) / len(costs) * 1000,
+        'p95_ms': percentile(costs, 95) * 1000,
+        'found': found,
+        'lost': lost,
+        'gained': gained,
+        'same_text_as_reference': agree,
+        'answered_by': answered_by
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick a resolution ladder from timings on real uploads")
+    parser.add_argument('--images', default='static/uploads')
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--ladders', nargs='+', default=DEFAULT_LADDERS)
+    parser.add_argument('--min-confidence', type=float, default=0.5, help="LADDER_MIN_CONFIDENCE to calibrate for")
+    parser.add_argument('--backend', default=os.getenv('MODEL_BACKEND', 'eager'))
+    parser.add_argument('--save', help="write per-image timings and the summary to this JSON file")
+    args = parser.parse_args()
+
+    from test_model import Rung, load_model, parse_ladder
+
+    paths = sorted(glob.glob(os.path.join(args.images, '*.jpg')) + glob.glob(os.path.join(args.images, '*.jpeg')))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        parser.error(f"no jpgs in {args.images}")
+
+    rung_specs = []
+    for spec in args.ladders:
+        for rung in parse_ladder(spec):
+            if rung not in rung_specs:
+                rung_specs.append(rung)
+
+    model = load_model(args.backend)
+    # one untimed pass so the first image doesn't carry the warm up
+    measure(paths[:1], model, rung_specs, args.min_confidence)
+    rows = measure(paths, model, rung_specs, args.min_confidence)
+
+    reference_costs = [row['reference']['seconds'] for row in rows]
+    reference_found = sum(row['reference']['found'] for row in rows)
+    print(f"\n{len(rows)} images, fixed 640 pass: {sum(reference_costs) / len(rows) * 1000:.0f} ms/image, "
+          f"p95 {percentile(reference_costs, 95) * 1000:.0f} ms, confident date on {reference_found}")
+    print(f"{'ladder':<28}{'mean ms':>9}{'p95 ms':>9}{'found':>7}{'lost':>6}{'gained':>8}{'same':>6}  answered by")
+
+    summary = {}
+    for spec in args.ladders:
+        labels = [Rung(size, angle, None).label for size, angle in parse_ladder(spec)]
+        result = simulate(rows, labels)
+        summary[spec] = result
+        answered = ', '.join(f"{label}:{count}" for label, count in result['answered_by'].items())
+        print(f"{spec:<28}{result['mean_ms']:>9.0f}{result['p95_ms']:>9.0f}{result['found']:>7}"
+              f"{len(result['lost']):>6}{result['gained']:>8}{result['same_text_as_reference']:>6}  {answered}")
+
+    recall_loss = {spec: len(result['lost']) / reference_found if reference_found else 0.0
+                   for spec, result in summary.items()}
+    for spec, result in summary.items():
+        result['recall_loss'] = recall_loss[spec]
+        if result['lost']:
+            print(f"  {spec}: recall loss {recall_loss[spec]:.1%}, misses " + ', '.join(map(os.path.basename, result['lost'])))
+
+    # cheapest ladder that misses none of the images where the fixed pass found a date
+    good = [spec for spec, result in summary.items() if not result['lost']]
+    if good:
+        best = min(good, key=lambda spec: summary[spec]['mean_ms'])
+        print(f"\nsuggested: DETECTION_LADDER=\"{best}\" LADDER_MIN_CONFIDENCE={args.min_confidence}")
+    else:
+        print("\nevery ladder misses dates the fixed 640 pass finds, add higher or rotated rungs")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'min_confidence': args.min_confidence, 'images': rows, 'ladders': summary}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""Per-stage latency benchmark over the images in static/uploads, Azure and Gemini are local fakes
+
+    python -m benchmarks.bench_pipeline --save benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --baseline benchmarks/baseline.json
+
+With --baseline the run exits with 1 when a stage got slower than the allowed threshold.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+
+# sequential requests would only wait for a batch that never fills, time the plain forward instead
+os.environ.setdefault('INFERENCE_MAX_BATCH', '1')
+# the fakes stand in for azure, a local OCR backend would bypass them
+os.environ['FULL_OCR_BACKEND'] = 'azure'
+# no memo either, every run has to pay for the (fake) cloud calls
+os.environ['MEMO_DB'] = ''
+
+STAGES = ['decode_resize', 'forward', 'crop_ocr', 'crop_ocr_batch', 'analyze_text', 'detect_request', 'analyze_request']
+
+
+class FakeAzureVisionService:
+    """Stands in for AzureVisionService, sleeps like a round trip and answers with fixed text"""
+
+    def __init__(self, max_workers=None, latency_ms=300, text="유통기한 표시 / expiry printed on the side"):
+        self.latency = latency_ms / 1000.0
+        self.text = text
+
+    def extract_text(self, image, translate_to='en', deadline=None):
+        # one OCR call plus one translate call
+        time.sleep(self.latency * 2)
+        return {'original_text': self.text, 'translated_text': self.text}
+
+    def extract_texts(self, images, translate_to='en', deadline=None):
+        return [self.extract_text(image, translate_to) for image in images]
+
+    def extract_text_async(self, image, translate_to='en', deadline=None):
+        future = Future()
+        future.set_result(self.extract_text(image, translate_to))
+        return future
+
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text]
+
+
+class FakeGeminiModel:
+    def __init__(self, latency_ms=800, reply='31/12/2025'):
+        self.latency = latency_ms / 1000.0
+        self.reply = reply
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency)
+        return FakeGeminiResponse(self.reply)
+
+
+def percentile(values, pct):
+    """Linear interpolation between the closest ranks, same as numpy's default"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples):
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'mean_ms': total / len(samples) * 1000 if samples else 0.0,
+        'images_per_sec': len(samples) / total if total else 0.0
+    }
+
+
+def load_app(azure_latency_ms, gemini_latency_ms):
+    """Import the Flask app with the cloud services swapped for fakes and caching turned off"""
+    import azure_vision
+    azure_vision.AzureVisionService = lambda max_workers=None: FakeAzureVisionService(latency_ms=azure_latency_ms)
+
+    import app as app_module
+    from result_cache import ResultCache
+    from upload_store import UploadStore
+
+    app_module.text_analysis.ai_model = FakeGeminiModel(latency_ms=gemini_latency_ms)
+    # a zero byte memory tier never stores anything, every request does the full work
+    app_module.result_cache = ResultCache(max_memory_bytes=0)
+    # uploads made by the benchmark must not end up in the corpus
+    app_module.upload_store = UploadStore(root=tempfile.mkdtemp(prefix='bench_uploads_'), max_age_days=0)
+    return app_module
+
+
+def set_latency(app_module, azure_latency_ms, gemini_latency_ms):
+    app_module.full_ocr.latency = azure_latency_ms / 1000.0
+    app_module.text_analysis.ai_model.latency = gemini_latency_ms / 1000.0
+
+
+def run(app_module, paths, repeat, stages):
+    from image_ingest import IngestedImage
+    from test_model import build_detections, collect_crops, ocr_service, prepare_image, run_model
+
+    app = app_module.app
+    model = app_module.model
+    size = app.config['DETECTION_SIZE']
+    min_confidence = app.config['MIN_DETECTION_CONFIDENCE']
+    client = app.test_client()
+
+    samples = {stage: [] for stage in stages}
+
+    def timed(stage, fn):
+        start = time.perf_counter()
+        value = fn()
+        if stage in samples:
+            samples[stage].append(time.perf_counter() - start)
+        return value
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        name = os.path.basename(path)
+
+        for _ in range(repeat):
+            # same steps process_image does, one timer each (crop_ocr includes the full resolution decode)
+            image = IngestedImage(data)
+            tensor, scale = timed('decode_resize', lambda: prepare_image(image, size))
+            prediction = timed('forward', lambda: run_model(model, [tensor])[0])
+
+            def crop_ocr():
+                crops = collect_crops(image, prediction, scale, min_confidence)
+                return crops, [ocr_service.read_text(crop['region']) for crop in crops]
+            crops, ocr_results = timed('crop_ocr', crop_ocr)
+            timed('crop_ocr_batch', lambda: ocr_service.read_text_batch([crop['region'] for crop in crops]))
+            detections = build_detections(crops, ocr_results)
+
+            fake_text = app_module.full_ocr.text
+            timed('analyze_text', lambda: app_module.text_analysis.analyze_text(fake_text, detections))
+
+            if 'detect_request' in samples:
+                response = timed('detect_request', lambda: client.post(
+                    '/detect', data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data'))
+                if response.status_code != 200:
+                    print(f"/detect failed for {name}: {response.status_code}")
+            if 'analyze_request' in samples:
+                response = timed('analyze_request', lambda: client.post(
+                    '/analyze', data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data'))
+                if response.status_code != 200:
+                    print(f"/analyze failed for {name}: {response.status_code}")
+
+    return {stage: summarize(values) for stage, values in samples.items() if values}
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline p50/p95 per stage, returns the stages that got slower than threshold"""
+    regressions = []
+    print(f"\n{'stage':<16}{'p50 base':>10}{'p50 now':>10}{'p95 base':>10}{'p95 now':>10}  change")
+    for stage, now in results.items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base:
+            continue
+        ratio = now['p95_ms'] / base['p95_ms'] if base['p95_ms'] else 1.0
+        flag = ''
+        if ratio > threshold:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f"{stage:<16}{base['p50_ms']:>10.1f}{now['p50_ms']:>10.1f}{base['p95_ms']:>10.1f}"
+              f"{now['p95_ms']:>10.1f}  {(ratio - 1) * 100:+.0f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every stage of the date pipeline")
+    parser.add_argument('--images', default='static/uploads')
+    parser.add_argument('--limit', type=int, default=0, help="only use the first N images")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=2, help="images run once before timing starts")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--azure-latency-ms', type=float, default=300)
+    parser.add_argument('--gemini-latency-ms', type=float, default=800)
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against a JSON file written by --save")
+    parser.add_argument('--threshold', type=float, default=1.2, help="allowed p95 slowdown, 1.2 = 20%%")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, '*.jpg')) + glob.glob(os.path.join(args.images, '*.jpeg')))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        parser.error(f"no jpgs in {args.images}")
+
+    app_module = load_app(args.azure_latency_ms, args.gemini_latency_ms)
+    if args.warmup:
+        # first forwards and paddle calls pay for allocations and lazy init, no point sleeping for the fakes there
+        set_latency(app_module, 0, 0)
+        run(app_module, paths[:args.warmup], 1, args.stages)
+        set_latency(app_module, args.azure_latency_ms, args.gemini_latency_ms)
+
+    results = run(app_module, paths, args.repeat, args.stages)
+
+    print(f"{len(paths)} images x {args.repeat}, azure {args.azure_latency_ms:.0f} ms, gemini {args.gemini_latency_ms:.0f} ms")
+    print(f"{'stage':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'img/s':>9}")
+    for stage, stats in results.items():
+        print(f"{stage:<16}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+              f"{stats['images_per_sec']:>9.2f}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'images': len(paths),
+        'repeat': args.repeat,
+        'azure_latency_ms': args.azure_latency_ms,
+        'gemini_latency_ms': args.gemini_latency_ms,
+        'model_backend': os.getenv('MODEL_BACKEND', 'eager'),
+        'stages': results
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nsaved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nslower than baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
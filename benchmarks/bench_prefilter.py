@@ -0,0 +1,143 @@
+"""What the OpenCV text prefilter saves and what it costs in recall on the upload corpus
+
+Every image goes through process_image twice, once as it is and once with the prefilter in front.
+Recall loss counts the images where the plain pass found a confident date box and the prefiltered one didn't.
+
+    python -m benchmarks.bench_prefilter
+    python -m benchmarks.bench_prefilter --max-roi 0.8 --limit 50 --save prefilter.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from benchmarks.bench_ladder import confident_date, top_text
+from benchmarks.bench_pipeline import percentile
+
+
+def measure(paths, model, prefilter, size, min_confidence):
+    from image_ingest import IngestedImage
+    from test_model import process_image
+
+    rows = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        # a fresh IngestedImage for both runs so neither profits from the other's decode
+        start = time.perf_counter()
+        plain = process_image(IngestedImage(data), model, size=size)
+        plain_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered = process_image(IngestedImage(data), model, size=size, prefilter=prefilter)
+        filtered_seconds = time.perf_counter() - start
+
+        # the decision again on its own, for the outcome and what the check costs (decode included)
+        image = IngestedImage(data)
+        start = time.perf_counter()
+        found = prefilter.analyze(image)
+        check_seconds = time.perf_counter() - start
+
+        if not found.has_text:
+            outcome = 'rejected'
+        elif found.roi is not None:
+            outcome = 'cropped'
+        else:
+            outcome = 'full'
+        roi_share = 1.0
+        if found.roi is not None:
+            x1, y1, x2, y2 = found.roi
+            roi_share = (x2 - x1) * (y2 - y1) / float(image.size[0] * image.size[1])
+
+        row = {
+            'path': path,
+            'outcome': outcome,
+            'roi_share': roi_share,
+            'check_seconds': check_seconds,
+            'plain': {'seconds': plain_seconds, 'text': top_text(plain), 'found': confident_date(plain, min_confidence)},
+            'filtered': {'seconds': filtered_seconds, 'text': top_text(filtered),
+                         'found': confident_date(filtered, min_confidence)}
+        }
+        rows.append(row)
+        print(f"{os.path.basename(path)}: {outcome:<8} roi {roi_share:>4.0%}  "
+              f"plain {'Y' if row['plain']['found'] else '-'} {plain_seconds * 1000:.0f}ms  "
+              f"prefiltered {'Y' if row['filtered']['found'] else '-'} {filtered_seconds * 1000:.0f}ms")
+    return rows
+
+
+def summarize(rows):
+    plain = [row['plain']['seconds'] for row in rows]
+    filtered = [row['filtered']['seconds'] for row in rows]
+    plain_found = [row for row in rows if row['plain']['found']]
+    return {
+        'images': len(rows),
+        'plain_mean_ms': sum(plain) / len(rows) * 1000,
+        'plain_p95_ms': percentile(plain, 95) * 1000,
+        'prefiltered_mean_ms': sum(filtered) / len(rows) * 1000,
+        'prefiltered_p95_ms': percentile(filtered, 95) * 1000,
+        'check_mean_ms': sum(row['check_seconds'] for row in rows) / len(rows) * 1000,
+        'speedup': sum(plain) / sum(filtered) if sum(filtered) else 0.0,
+        'outcomes': {outcome: sum(row['outcome'] == outcome for row in rows)
+                     for outcome in ('rejected', 'cropped', 'full')},
+        'plain_found': len(plain_found),
+        'lost': [row['path'] for row in plain_found if not row['filtered']['found']],
+        'lost_by_reject': sum(row['outcome'] == 'rejected' for row in plain_found),
+        'gained': sum(row['filtered']['found'] and not row['plain']['found'] for row in rows),
+        'same_text': sum(row['filtered']['text'] == row['plain']['text'] for row in rows)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speedup and recall loss of the text prefilter on real uploads")
+    parser.add_argument('--images', default='static/uploads')
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--size', type=int, default=640)
+    parser.add_argument('--min-confidence', type=float, default=0.5, help="what counts as a found date box")
+    parser.add_argument('--min-regions', type=int, default=None, help="PREFILTER_MIN_REGIONS to try")
+    parser.add_argument('--max-roi', type=float, default=None, help="PREFILTER_MAX_ROI to try")
+    parser.add_argument('--backend', default=os.getenv('MODEL_BACKEND', 'eager'))
+    parser.add_argument('--save', help="write per-image results and the summary to this JSON file")
+    args = parser.parse_args()
+
+    from test_model import load_model
+    from text_prefilter import TextPrefilter
+
+    paths = sorted(glob.glob(os.path.join(args.images, '*.jpg')) + glob.glob(os.path.join(args.images, '*.jpeg')))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        parser.error(f"no jpgs in {args.images}")
+
+    model = load_model(args.backend)
+    prefilter = TextPrefilter(work_size=args.size, min_regions=args.min_regions, max_roi_ratio=args.max_roi)
+    # one untimed pass so the first image doesn't carry the warm up
+    measure(paths[:1], model, prefilter, args.size, args.min_confidence)
+    rows = measure(paths, model, prefilter, args.size, args.min_confidence)
+    summary = summarize(rows)
+
+    outcomes = summary['outcomes']
+    print(f"\n{summary['images']} images: {outcomes['rejected']} rejected, {outcomes['cropped']} cropped, "
+          f"{outcomes['full']} full, the check itself {summary['check_mean_ms']:.1f} ms/image")
+    print(f"{'':<14}{'mean ms':>9}{'p95 ms':>9}")
+    print(f"{'plain':<14}{summary['plain_mean_ms']:>9.0f}{summary['plain_p95_ms']:>9.0f}")
+    print(f"{'prefiltered':<14}{summary['prefiltered_mean_ms']:>9.0f}{summary['prefiltered_p95_ms']:>9.0f}")
+    print(f"speedup {summary['speedup']:.2f}x, same top text on {summary['same_text']}/{summary['images']}")
+
+    lost = len(summary['lost'])
+    recall_loss = lost / summary['plain_found'] if summary['plain_found'] else 0.0
+    print(f"recall: {lost} of {summary['plain_found']} confident dates lost ({recall_loss:.1%}), "
+          f"{summary['lost_by_reject']} of them rejected as text-free, {summary['gained']} gained")
+    for path in summary['lost']:
+        print(f"  lost: {path}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'min_confidence': args.min_confidence, 'images': rows, 'summary': summary}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""AzureVisionService against a local fake Azure, to see the deadline and circuit breaker at work
+
+The fake serves both the OCR and the translator API on 127.0.0.1 and can be switched between
+answering, hanging and failing. Every request prints its latency and the breaker state.
+
+    python -m benchmarks.bench_resilience --outage hang --requests 10
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OCR_ANSWER = {
+    'language': 'ko', 'orientation': 'Up',
+    'regions': [{'boundingBox': '0,0,100,20', 'lines': [
+        {'boundingBox': '0,0,100,20', 'words': [{'boundingBox': '0,0,40,20', 'text': '유통기한'},
+                                                {'boundingBox': '50,0,100,20', 'text': '2025.12.31'}]}]}]
+}
+
+
+class FakeAzure(BaseHTTPRequestHandler):
+    # keep-alive like the real service, so pooled clients can reuse their connections
+    protocol_version = 'HTTP/1.1'
+    mode = 'ok'  # ok, hang or error
+    hang_seconds = 30.0
+    # seconds to wait before answering, one entry used up per POST (the tests make single slow calls with it)
+    delays = []
+    # (path, body, client address) of every POST, one client address per connection
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _answer(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_HEAD(self):
+        # the breaker probes with HEAD
+        self.send_response(503 if FakeAzure.mode != 'ok' else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        # the vision client streams the image, what is left unread would break the kept-alive connection
+        body = b''
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if not size:
+                self.rfile.readline()
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def do_POST(self):
+        body = self._read_body()
+        FakeAzure.requests.append((self.path, body, self.client_address))
+        if FakeAzure.delays:
+            time.sleep(FakeAzure.delays.pop(0))
+        if FakeAzure.mode == 'hang':
+            time.sleep(FakeAzure.hang_seconds)
+        if FakeAzure.mode != 'ok':
+            return self._answer(500, {'error': {'code': 'InternalServerError', 'message': 'fake outage'}})
+        if self.path.startswith('/translate'):
+            texts = json.loads(body or b'[]')
+            return self._answer(200, [{'translations': [{'text': f"(en) {item['text']}", 'to': 'en'}]}
+                                      for item in texts])
+        return self._answer(200, OCR_ANSWER)
+
+
+def start_fake():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAzure)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deadline and circuit breaker behaviour against a fake Azure")
+    parser.add_argument('--outage', choices=['hang', 'error'], default='hang')
+    parser.add_argument('--requests', type=int, default=10, help="requests sent during the outage")
+    parser.add_argument('--deadline', type=float, default=3.0, help="REQUEST_DEADLINE_S for the run")
+    parser.add_argument('--probe-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    endpoint = start_fake()
+    os.environ.update({
+        'AZURE_VISION_ENDPOINT': endpoint, 'AZURE_VISION_KEY': 'fake', 'AZURE_TRANSLATOR_KEY': 'fake',
+        'AZURE_TRANSLATOR_ENDPOINT': endpoint, 'REQUEST_DEADLINE_S': str(args.deadline),
+        'AZURE_BREAKER_PROBE_S': str(args.probe_interval),
+        'MEMO_DB': ''  # a memo hit would hide the outage
+    })
+    from PIL import Image
+    from azure_vision import AzureVisionService
+
+    service = AzureVisionService()
+    image = Image.new('RGB', (200, 60), 'white')
+
+    def send(label):
+        start = time.perf_counter()
+        result = service.extract_text(image)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<10}{elapsed * 1000:>8.0f} ms  breaker {service.vision_breaker.state:<10}"
+              f"{result['translated_text'][:50]}")
+
+    send('healthy')
+    FakeAzure.mode = args.outage
+    for i in range(args.requests):
+        send(f"outage {i + 1}")
+
+    FakeAzure.mode = 'ok'
+    # the probe closes the breaker in the background, no request has to fail for it
+    deadline = time.monotonic() + args.probe_interval * 5
+    while service.vision_breaker.is_open() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    send('recovered')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+
+def safetensors_path_for(checkpoint_path):
+    """checkpoints/final_model.pth -> checkpoints/final_model.safetensors"""
+    return os.path.splitext(checkpoint_path)[0] + '.safetensors'
+
+
+def hash_path_for(path):
+    return path + '.sha256'
+
+
+def file_sha256(path, chunk_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def convert_checkpoint(checkpoint_path, output_path=None):
+    """Turn the training .pth into a memory-mappable safetensors file plus a sha256 sidecar"""
+    output_path = output_path or safetensors_path_for(checkpoint_path)
+    checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    state_dict = checkpoint.get('model_state_dict', checkpoint)
+
+    # safetensors wants contiguous tensors that don't share storage
+    state_dict = {name: tensor.contiguous().clone() for name, tensor in state_dict.items()}
+    save_file(state_dict, output_path, metadata={'source': os.path.basename(checkpoint_path)})
+
+    content_hash = file_sha256(output_path)
+    with open(hash_path_for(output_path), 'w') as f:
+        f.write(content_hash + '\n')
+    return output_path, content_hash
+
+
+def stored_hash(path):
+    try:
+        with open(hash_path_for(path)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def verify_checkpoint(path):
+    """Compare the weights file against its sidecar hash, raises if it was truncated or changed"""
+    expected = stored_hash(path)
+    if expected is None:
+        raise ValueError(f"no hash file next to {path}, run download_checkpoint.py again")
+    actual = file_sha256(path)
+    if actual != expected:
+        raise ValueError(f"checkpoint {path} is corrupted (sha256 {actual[:12]} != {expected[:12]})")
+    return actual
+
+
+def load_weights(model, path, verify=True):
+    """Load safetensors weights into the model without copying them, tensors stay backed by the mmap"""
+    if verify:
+        verify_checkpoint(path)
+
+    state_dict = {}
+    with safe_open(path, framework='pt', device='cpu') as f:
+        for name in f.keys():
+            state_dict[name] = f.get_tensor(name)
+
+    # assign=True hands the mmap'd tensors to the module instead of copying into its own parameters
+    model.load_state_dict(state_dict, assign=True)
+
+    leftover = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+                if tensor.is_meta]
+    if leftover:
+        raise ValueError(f"checkpoint {path} is missing weights for {', '.join(leftover[:5])}")
+    return model
+
+
+def checkpoint_id(checkpoint_path):
+    """Content hash of the weights when we have one, otherwise size + mtime of the .pth"""
+    content_hash = stored_hash(safetensors_path_for(checkpoint_path))
+    if content_hash:
+        return content_hash[:16]
+    stat = os.stat(checkpoint_path)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
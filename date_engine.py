@@ -0,0 +1,157 @@
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# words that sit next to dates on packaging but are not part of them
+FILLER_WORDS = re.compile(
+    r'best before|best by|use by|expiry|expiration|exp|date|sell by|valid until',
+    re.IGNORECASE
+)
+
+# YYYYMM/DD, a format paddle reads off some korean packaging
+COMPACT_MONTH_DAY = re.compile(r'^(\d{4})(\d{2})/(\d{1,2})$')
+COMPACT_DATE = re.compile(r'^(\d{4})(\d{2})(\d{2})$')
+COMPACT_MONTH = re.compile(r'^(\d{4})(\d{2})$')
+
+# one or two numbers after the first, all with the same separator
+SEPARATED = re.compile(r'^(\d+)([-/.])(\d+)(?:\2(\d+))?$')
+
+LOOKS_LIKE_DATE = re.compile(r'\d+[-/.,]\d+|^\d{6,8}$')
+
+# what we search for inside longer text (the translated azure OCR output)
+TEXT_PATTERNS = [
+    re.compile(r'\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}'),  #25/12/2023,12-31-2023
+    re.compile(r'\d{2,4}[-/.]\d{1,2}[-/.]\d{1,2}'),  # 2023/12/25
+    re.compile(r'\d{1,2}[-/.]\d{2,4}'),             #12/2023
+    re.compile(r'\d{2,4}[-/.]\d{1,2}')            #2023/12
+]
+
+# field order tried for separated dates, same order the old strptime list used
+THREE_PART_ORDERS = [('d', 'm', 'y'), ('m', 'd', 'y'), ('y', 'm', 'd')]
+TWO_PART_ORDERS = [('m', 'y'), ('y', 'm')]
+FIELD_NAMES = {'d': 'DD', 'm': 'MM', 'y': 'YYYY'}
+
+DateCandidate = namedtuple('DateCandidate', ['year', 'month', 'day', 'confidence', 'layout'])
+
+
+def _valid_field(kind, length, value):
+    # same rules strptime has: %d/%m take 1-2 digits, %Y exactly 4
+    if kind == 'y':
+        return length == 4
+    return length <= 2 and 1 <= value <= (31 if kind == 'd' else 12)
+
+
+DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _real_date(year, month, day):
+    # same check datetime() does, without paying for an exception on bad dates
+    if not (1 <= year <= 9999 and 1 <= month <= 12 and day >= 1):
+        return False
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return day <= 29
+    return day <= DAYS_IN_MONTH[month]
+
+
+class DateEngine:
+    """Turns OCR text into (year, month, day) candidates with precompiled patterns, repeated inputs are memoized"""
+
+    def __init__(self, cache_size=4096):
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+        self.candidates = lru_cache(maxsize=cache_size)(self._candidates)
+
+    def clean(self, text):
+        """kick out everything thats not part of the date"""
+        text = FILLER_WORDS.sub('', str(text).strip()).strip()
+
+        # Handle the tricky YYYYMM/DD format
+        match = COMPACT_MONTH_DAY.match(text)
+        if match:
+            y, m, d = match.groups()
+            return f"{y}/{m}/{d}"
+        return text
+
+    def looks_like_date(self, text):
+        return bool(LOOKS_LIKE_DATE.search(text))
+
+    def _candidates(self, text):
+        """Every reading of the text as a date, most likely first"""
+        text = text.strip()
+        found = []
+
+        match = COMPACT_DATE.match(text)
+        if match:
+            y, m, d = map(int, match.groups())
+            if 1 <= m <= 12 and 1 <= d <= 31 and _real_date(y, m, d):
+                found.append((y, m, d, 'YYYYMMDD', False))
+
+        match = COMPACT_MONTH.match(text)
+        if match:
+            y, m = map(int, match.groups())
+            # Default to 1st of month when day not specified
+            if 1 <= m <= 12 and _real_date(y, m, 1):
+                found.append((y, m, 1, 'YYYYMM', True))
+
+        match = SEPARATED.match(text)
+        if match:
+            first, sep, second, third = match.groups()
+            tokens = (first, second) if third is None else (first, second, third)
+            orders = TWO_PART_ORDERS if third is None else THREE_PART_ORDERS
+            # tokenized once, every layout below only looks at lengths and values
+            lengths = [len(token) for token in tokens]
+            values = [int(token) for token in tokens]
+
+            for order in orders:
+                fields = {}
+                for kind, length, value in zip(order, lengths, values):
+                    if not _valid_field(kind, length, value):
+                        break
+                    fields[kind] = value
+                else:
+                    y, m, d = fields['y'], fields['m'], fields.get('d', 1)
+                    if _real_date(y, m, d):
+                        layout = sep.join(FIELD_NAMES[kind] for kind in order)
+                        found.append((y, m, d, layout, 'd' not in order))
+
+        # a reading is only sure when nothing else fits, month-only dates lose a bit for the guessed day
+        candidates = []
+        for y, m, d, layout, guessed_day in found:
+            confidence = 1.0 / len(found)
+            if guessed_day:
+                confidence *= 0.9
+            candidates.append(DateCandidate(y, m, d, confidence, layout))
+        return tuple(candidates)
+
+    def _parse(self, text):
+        candidates = self.candidates(text)
+        if not candidates:
+            return None
+        best = candidates[0]
+        return datetime(best.year, best.month, best.day)
+
+    def parse_many(self, texts):
+        """Parse a batch of strings, repeats are served from the memo"""
+        return [self.parse(text) for text in texts]
+
+    def find_dates(self, text):
+        """All (date, matched text) pairs found anywhere in a longer text"""
+        found = []
+        for pattern in TEXT_PATTERNS:
+            for match in pattern.finditer(text):
+                date = self.parse(match.group())
+                if date:
+                    found.append((date, match.group()))
+        return found
+
+    def parse_compact(self, text):
+        """YYYYMM/DD and YYYYMMDD with a plausible year, for OCR text that lost its separators"""
+        match = COMPACT_MONTH_DAY.match(text) or COMPACT_DATE.match(text)
+        if not match:
+            return None
+        year, month, day = map(int, match.groups())
+        if month < 1 or month > 12 or day < 1 or day > 31 or year < 2000 or year > 2100:
+            return None
+        if not _real_date(year, month, day):
+            return None
+        return datetime(year, month, day)
@@ -2,6 +2,7 @@ import os
 import gdown
 import sys
 from pathlib import Path
+from checkpoint_store import convert_checkpoint, safetensors_path_for, stored_hash, verify_checkpoint
 
 def download_checkpoints():
     """
@@ -16,27 +17,49 @@ def download_checkpoints():
     # Your Google Drive file ID
     file_id = "1PI4sChoFi7UCF0Ejijds_mbN6scVSSr9"
     
-    # Output path
-    output_path = checkpoint_dir / "model_epoch_final.pth"
+    # Output path (the name app.py and test_model.py load)
+    output_path = checkpoint_dir / "final_model.pth"
     
     if output_path.exists():
         print("Checkpoint file already exists. Skipping download.")
-        return True
-    
+    else:
+        try:
+            print("Downloading model checkpoint...")
+            url = f"https://drive.google.com/uc?id={file_id}"
+            gdown.download(url, str(output_path), quiet=False)
+            
+            if output_path.exists() and os.path.getsize(output_path) > 0:
+                print(f"Successfully downloaded checkpoint to {output_path}")
+            else:
+                print("Download failed or file is empty!")
+                return False
+                
+        except Exception as e:
+            print(f"Error downloading checkpoint: {str(e)}")
+            return False
+
+    return convert_for_fast_start(output_path)
+
+def convert_for_fast_start(checkpoint_path):
+    """
+    Writes the safetensors copy the app mmaps at startup, with its sha256 next to it
+    Returns:
+        bool: True if the fast-start weights are there and match their hash
+    """
+    weights_path = Path(safetensors_path_for(str(checkpoint_path)))
     try:
-        print("Downloading model checkpoint...")
-        url = f"https://drive.google.com/uc?id={file_id}"
-        gdown.download(url, str(output_path), quiet=False)
-        
-        if output_path.exists() and os.path.getsize(output_path) > 0:
-            print(f"Successfully downloaded checkpoint to {output_path}")
+        if weights_path.exists() and stored_hash(str(weights_path)):
+            verify_checkpoint(str(weights_path))
+            print("Fast-start weights already exist. Skipping conversion.")
             return True
-        else:
-            print("Download failed or file is empty!")
-            return False
-            
+
+        print("Converting checkpoint to safetensors...")
+        _, content_hash = convert_checkpoint(str(checkpoint_path), str(weights_path))
+        print(f"Saved {weights_path} (sha256 {content_hash[:12]})")
+        return True
+
     except Exception as e:
-        print(f"Error downloading checkpoint: {str(e)}")
+        print(f"Error converting checkpoint: {str(e)}")
         return False
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+import argparse
+import glob
+import os
+import sys
+
+import torch
+from PIL import Image
+
+from test_model import (CHECKPOINT_PATH, EXPORT_PATHS, load_eager_model, load_model,
+                        prepare_image, run_model)
+
+# quantized linear layers move boxes a bit, the float exports should match almost exactly
+PARITY_TOLERANCE = {
+    'torchscript': {'box': 1.0, 'score': 1e-3},
+    'onnx': {'box': 1.0, 'score': 1e-3},
+    'quantized': {'box': 8.0, 'score': 0.05}
+}
+
+
+def export_torchscript(model, path):
+    scripted = torch.jit.script(model)
+    scripted.save(path)
+
+
+def export_quantized(model, path):
+    # dynamic int8 only touches nn.Linear (box head + predictor), the conv backbone stays float32
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    scripted = torch.jit.script(quantized)
+    scripted.save(path)
+
+
+def export_onnx(model, path, size=640):
+    dummy = torch.rand(3, size, size)
+    torch.onnx.export(
+        model,
+        ([dummy],),
+        path,
+        opset_version=11,
+        input_names=['image'],
+        output_names=['boxes', 'labels', 'scores'],
+        dynamic_axes={'image': {1: 'height', 2: 'width'}, 'boxes': {0: 'detections'},
+                      'labels': {0: 'detections'}, 'scores': {0: 'detections'}}
+    )
+
+
+EXPORTERS = {
+    'torchscript': export_torchscript,
+    'quantized': export_quantized,
+    'onnx': export_onnx
+}
+
+
+def sample_tensors(image_dir='static/uploads', limit=5, size=640):
+    """A few real uploads to compare on, random input if there are none"""
+    paths = sorted(glob.glob(os.path.join(image_dir, '*.jpg')))[:limit]
+    if not paths:
+        return [torch.rand(3, size, size)]
+    return [prepare_image(Image.open(path).convert('RGB'), size)[0] for path in paths]
+
+
+def _box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def check_parity(reference, candidate, tensors, tolerance, min_score=0.3):
+    """Compare confident boxes and scores of a candidate model against the eager one"""
+    report = {'images': len(tensors), 'max_box_diff': 0.0, 'max_score_diff': 0.0, 'missing': 0, 'extra': 0}
+
+    for tensor in tensors:
+        expected = run_model(reference, [tensor])[0]
+        actual = run_model(candidate, [tensor])[0]
+
+        expected_boxes = [(box.tolist(), float(score), int(label)) for box, score, label
+                          in zip(expected['boxes'], expected['scores'], expected['labels']) if score > min_score]
+        actual_boxes = [(box.tolist(), float(score), int(label)) for box, score, label
+                        in zip(actual['boxes'], actual['scores'], actual['labels']) if score > min_score]
+
+        # greedy match on IoU, order can shuffle when scores are almost equal
+        unmatched = list(actual_boxes)
+        for box, score, label in expected_boxes:
+            candidates = [item for item in unmatched if item[2] == label]
+            best = max(candidates, key=lambda item: _box_iou(box, item[0]), default=None)
+            if best is None or _box_iou(box, best[0]) < 0.5:
+                report['missing'] += 1
+                continue
+            unmatched.remove(best)
+            box_diff = max(abs(x - y) for x, y in zip(box, best[0]))
+            report['max_box_diff'] = max(report['max_box_diff'], box_diff)
+            report['max_score_diff'] = max(report['max_score_diff'], abs(score - best[1]))
+        report['extra'] += len(unmatched)
+
+    report['passed'] = (report['missing'] == 0 and report['extra'] == 0
+                        and report['max_box_diff'] <= tolerance['box']
+                        and report['max_score_diff'] <= tolerance['score'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the date detector to faster CPU formats")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH)
+    parser.add_argument('--backends', nargs='+', default=list(EXPORTERS), choices=list(EXPORTERS))
+    parser.add_argument('--images', default='static/uploads', help="folder with jpgs for the parity check")
+    parser.add_argument('--skip-parity', action='store_true')
+    args = parser.parse_args()
+
+    print("Loading model...")
+    model = load_eager_model(args.checkpoint)
+    tensors = [] if args.skip_parity else sample_tensors(args.images)
+
+    failed = False
+    for backend in args.backends:
+        path = EXPORT_PATHS[backend]
+        print(f"\nExporting {backend} -> {path}")
+        try:
+            # every export starts from clean eager weights
+            EXPORTERS[backend](load_eager_model(args.checkpoint), path)
+        except Exception as e:
+            print(f"Export Error ({backend}): {str(e)}")
+            failed = True
+            continue
+        print(f"Saved {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        if args.skip_parity:
+            continue
+        candidate = load_model(backend, args.checkpoint, fallback=False)
+        report = check_parity(model, candidate, tensors, PARITY_TOLERANCE[backend])
+        print(f"Parity on {report['images']} images: max box diff {report['max_box_diff']:.2f}px, "
+              f"max score diff {report['max_score_diff']:.4f}, missing {report['missing']}, extra {report['extra']}")
+        print("OK" if report['passed'] else "FAILED")
+        failed = failed or not report['passed']
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
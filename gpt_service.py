@@ -2,14 +2,30 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 from datetime import datetime
-import re
+from date_engine import DateEngine
+from metrics import ANALYZE_METHOD, timed
+from resilience import CircuitBreaker, Deadline, hedged_call
+from memo_store import MemoStore, memo_key, normalize_text
 load_dotenv()
 
 class TextAnalysisService:
-    def __init__(self):
+    def __init__(self, memo=None):
         # Get API key from environment
         gemini_key = os.getenv('GEMINI_API_KEY')
         self.ai_model = None
+        self.dates = DateEngine()
+        # what gemini read out of a text is kept, the same label is not sent (and paid for) twice
+        self.memo = memo or MemoStore()
+        # gemini is only the 3rd fallback, it must never hold a request longer than this
+        self.gemini_timeout = float(os.getenv('GEMINI_TIMEOUT_S', 10.0))
+        self.request_budget = float(os.getenv('REQUEST_DEADLINE_S', 20.0))
+        self.hedge_after = float(os.getenv('GEMINI_HEDGE_MS', 0)) / 1000.0 or None
+        self.gemini_breaker = CircuitBreaker(
+            'gemini',
+            failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', 3)),
+            probe=self._probe_gemini,
+            probe_interval=float(os.getenv('GEMINI_BREAKER_PROBE_S', 15.0))
+        )
         
         if not gemini_key:
             print("gemini api not in your .env file")
@@ -31,47 +47,58 @@ class TextAnalysisService:
         except Exception as e:
             print(f"unknown error , replace ai , or api key: {str(e)}")
 
-    def analyze_text(self, text, detected_ocr_dates=None): # responsible for deciding if a product is expired based on detected text (date)
+    def _probe_gemini(self):
+        genai.get_model(self.ai_model.model_name, request_options={'timeout': 5})
+        return True
+
+    def _ask_gemini(self, prompt, deadline):
+        timeout = deadline.timeout(self.gemini_timeout)
+        call = lambda: self.gemini_breaker.call(self.ai_model.generate_content, prompt, request_options={'timeout': timeout})
+        if self.hedge_after:
+            return hedged_call(call, hedge_after=self.hedge_after, deadline=deadline)
+        return call()
+
+    def analyze_text(self, text, detected_ocr_dates=None, deadline=None, use_gemini=True): # responsible for deciding if a product is expired based on detected text (date)
+        deadline = deadline or Deadline(self.request_budget)
         
         try:
             found_dates = []
+            method = 'none'  # which method below found the dates, for the metrics
         
             if detected_ocr_dates and isinstance(detected_ocr_dates, list): # DATE OUR OCR FOUNDED - WE ARE USING IT FIRST ()
-                for date_obj in detected_ocr_dates:
-                    raw_text = date_obj.get('paddle_text')
-                    if not raw_text:
-                        continue
-                    clean_text = self._clean_date_string(raw_text)
-                    
-                    # Is it a date?
-                    if not self._looks_like_date(clean_text):
-                        continue
+                with timed('date_parse'):
+                    for date_obj in detected_ocr_dates:
+                        raw_text = date_obj.get('paddle_text')
+                        if not raw_text:
+                            continue
+                        clean_text = self.dates.clean(raw_text)
                         
-                    date = self._parse_date(clean_text)
-                    if date:
-                        confidence = date_obj.get('paddle_confidence', 0)
-                        found_dates.append((date, raw_text, confidence))
+                        # Is it a date?
+                        if not self.dates.looks_like_date(clean_text):
+                            continue
+                            
+                        date = self.dates.parse(clean_text)
+                        if date:
+                            confidence = date_obj.get('paddle_confidence', 0)
+                            found_dates.append((date, raw_text, confidence))
+                if found_dates:
+                    method = 'ocr'
             
             #  method 2nd ----- Regex patterns (custom defined)
             if not found_dates:
-                patterns = [
-                    r'\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}',  #25/12/2023,12-31-2023
-                    r'\d{2,4}[-/.]\d{1,2}[-/.]\d{1,2}',  # 2023/12/25
-                    r'\d{1,2}[-/.]\d{2,4}',             #12/2023
-                    r'\d{2,4}[-/.]\d{1,2}'            #2023/12
-                ]
-                
-                for pattern in patterns:
-                    matches = re.finditer(pattern, text)
-                    for match in matches:
-                        date_text = match.group()
-                        date = self._parse_date(date_text)
-                        if date:
-                           
-                            found_dates.append((date, date_text, 0.8))
+                with timed('date_parse'):
+                    for date, date_text in self.dates.find_dates(text):
+                        found_dates.append((date, date_text, 0.8))
+                if found_dates:
+                    method = 'regex'
             
             # optional method 3rd ----- Gemini help us if you found dates in the text
-            if not found_dates and self.ai_model:
+            # (an answer it gave for the same text before comes from the memo, even while it is down)
+            gemini_key = memo_key(normalize_text(text)) if not found_dates and self.ai_model and use_gemini else None
+            date_text = self.memo.get('gemini_date', gemini_key) if gemini_key else None
+            if gemini_key and date_text is None and self.gemini_breaker.is_open():
+                print("gemini is failing lately, skipping it")
+            elif gemini_key and date_text is None:
                 try:
                     prompt = f"""
                     Hey, I have a project, and i have used 2 methodes prior to it to find dates from image texts. if i am here it means both methods have already failed. i am so demotivated with my project , but still i want to give it a final try to find date from those texts ,  i need you to extract an expiration date from this product text please please please help me use your full power to help me, and if you do it sucessfullt i will buy your premium version , heres the text:
@@ -81,57 +108,37 @@ class TextAnalysisService:
                     If you can't find a date,  say "No date found".
                     """
                     
-                    response = self.ai_model.generate_content(prompt)
+                    with timed('gemini'):
+                        response = self._ask_gemini(prompt, deadline)
                     if response.parts:
                         date_text = response.text.strip()
-                        if date_text != "No date found":
-                            date = self._parse_date(date_text)
-                            if date:
-                                # not trusted , so we give it a lower confidence
-                                found_dates.append((date, date_text, 0.7))
+                        self.memo.set('gemini_date', gemini_key, date_text)
                 except Exception as e:
                     print(f"gemini is in coma , or api key is not valid: {str(e)}")
+            if date_text and date_text != "No date found":
+                date = self.dates.parse(date_text)
+                if date:
+                    # not trusted , so we give it a lower confidence
+                    found_dates.append((date, date_text, 0.7))
+                    method = 'gemini'
             
             # 4th method ----- Check for weird date formats
             if not found_dates and detected_ocr_dates:
-                for date_obj in detected_ocr_dates:
-                    raw_text = date_obj.get('paddle_text')
-                    if not raw_text:
-                        continue
-                    
-                    # Check for format YYYYMM/DD (like 202401/15)           # Ai generated code for the specific error types.
-                    if re.match(r'^\d{6}/\d{1,2}$', raw_text):
-                        try:
-                            year = int(raw_text[:4])
-                            month = int(raw_text[4:6])
-                            day = int(raw_text.split('/')[1])
-                            
-                            if month < 1 or month > 12 or day < 1 or day > 31 or year < 2000 or year > 2100:
-                                continue
-                                
-                            date = datetime(year, month, day)
-                            confidence = date_obj.get('paddle_confidence', 0) * 0.9
-                            found_dates.append((date, raw_text, confidence))
-                        except ValueError:
-                            # Skip invalid dates
-                            pass
-                    
-                    # Check for format YYYYMMDD (like 20240115)
-                    elif re.match(r'^\d{8}$', raw_text):
-                        try:
-                            year = int(raw_text[:4])
-                            month = int(raw_text[4:6])
-                            day = int(raw_text[6:8])
-                            
-                            # Sanity check
-                            if month < 1 or month > 12 or day < 1 or day > 31 or year < 2000 or year > 2100:
-                                continue
-                                
-                            date = datetime(year, month, day)
+                with timed('date_parse'):
+                    for date_obj in detected_ocr_dates:
+                        raw_text = date_obj.get('paddle_text')
+                        if not raw_text:
+                            continue
+                        
+                        # Check for format YYYYMM/DD (like 202401/15) or YYYYMMDD (like 20240115)
+                        date = self.dates.parse_compact(raw_text)
+                        if date:
                             confidence = date_obj.get('paddle_confidence', 0) * 0.9
                             found_dates.append((date, raw_text, confidence))
-                        except ValueError:
-                            pass
+                if found_dates:
+                    method = 'compact'
+
+            ANALYZE_METHOD.inc(method=method)
 
             # If we still couldn't find any dates, let the user know
             if not found_dates:
@@ -165,91 +172,3 @@ class TextAnalysisService:
         except Exception as e:
             print(f"something is worng: {str(e)}")
             return " found a date but cant tell if it's expired."
-    
-    def _clean_date_string(self, text):
-        """kick out everything thats not part of the date"""
-        # work on strings
-        text = str(text).strip()
-        # some patterns that are not part of the date but often appear near to them in the text
-        filler_words = [
-            'best before', 'best by', 'use by', 
-            'expiry', 'expiration', 'exp', 
-            'date', 'sell by', 'valid until'
-        ]
-        
-        for word in filler_words:
-            text = re.sub(r'(?i)' + word, '', text)
-        text = text.strip()
-        
-        # Handle the tricky YYYYMM/DD format                  -- # Ai generated code for the specific error types found on random image in testing.
-        if re.match(r'^\d{6}/\d{1,2}$', text):
-            y, m, d = text[:4], text[4:6], text.split('/')[1]
-            return f"{y}/{m}/{d}"
-        
-        return text
-    
-    def _looks_like_date(self, text):
-        date_pattern = r'\d+[-/.,]\d+|^\d{6,8}$'
-        return bool(re.search(date_pattern, text))
-    
-    def _parse_date(self, text):
-        text = text.strip()
-        # Format:  (20240402)
-        if re.match(r'^\d{8}$', text):
-            try:
-                y, m, d = int(text[:4]), int(text[4:6]), int(text[6:8])
-                # fast validation
-                if 1 <= m <= 12 and 1 <= d <= 31:
-                    return datetime(y, m, d)
-            except ValueError:
-                pass
-        
-        # Format: YYYYMM (202401)
-        if re.match(r'^\d{6}$', text):
-            try:
-                y, m = int(text[:4]), int(text[4:6])
-                if 1 <= m <= 12:
-                    # Default to 1st of month when day not specified
-                    return datetime(y, m, 1)
-            except ValueError:
-                pass
-        
-        # Format: (2022.07.19)
-        if re.match(r'^\d{4}[.]\d{2}[.]\d{2}$', text):
-            try:
-                y = int(text[:4])
-                m = int(text[5:7])
-                d = int(text[8:10])
-                if 1 <= m <= 12 and 1 <= d <= 31:
-                    return datetime(y, m, d)
-            except ValueError:
-                pass
-        
-        #  standard formats as a fallback mechanism
-        date_formats = [
-            # day first
-            '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y',
-            
-            # Mmonth first 
-            '%m/%d/%Y', '%m-%d-%Y', '%m.%d.%Y',
-            
-            # year first 
-            '%Y/%m/%d', '%Y-%m-%d', '%Y.%m.%d',
-            
-            # month year only
-            '%m/%Y', '%m-%Y', '%m.%Y',
-            
-            # year month only
-            '%Y/%m', '%Y-%m', '%Y.%m'
-        ]
-        
-        # retry try hard until any one of that works up
-        for fmt in date_formats:
-            try:
-                return datetime.strptime(text, fmt)
-            except ValueError:
-                # No match, try the next format
-                continue
-        
-        # finaslly
-        return None 
\ No newline at end of file
@@ -0,0 +1,83 @@
+# gunicorn picks this file up on its own: gunicorn --bind 0.0.0.0:5000 app:app
+import gc
+import multiprocessing
+import os
+import sys
+
+# the config file is loaded before gunicorn puts the app folder on the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from warmup import load_thread_config, tuned_thread_config
+
+# written by `python warmup.py --autotune`, env vars still win over it
+thread_config = load_thread_config() or {}
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', thread_config.get('workers', 2)))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+# GUNICORN_PRELOAD=1 loads the detector once in the master, workers share its weights through fork
+# copy-on-write. PaddleOCR is never loaded there, each worker builds its own on first use after the fork.
+# off by default until forked torch has run under real load for a while
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+# the thread variables somebody set by hand, those always win
+user_set = {name for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OCR_CPU_THREADS',
+                              'TORCH_THREADS_PER_WORKER', 'TORCH_INTEROP_THREADS') if name in os.environ}
+
+
+def thread_counts(worker_count):
+    """Split the cores between workers so torch/paddle in different workers don't fight over them.
+    The tuned numbers only fit the worker count they were measured with"""
+    tuned = tuned_thread_config(worker_count)
+    cpu = int(os.getenv('TORCH_THREADS_PER_WORKER') if 'TORCH_THREADS_PER_WORKER' in user_set else
+              tuned.get('intra_op_threads', max(1, multiprocessing.cpu_count() // worker_count)))
+    interop = int(os.getenv('TORCH_INTEROP_THREADS') if 'TORCH_INTEROP_THREADS' in user_set else
+                  tuned.get('interop_threads', 0))
+    return cpu, interop, tuned.get('ocr_cpu_threads', cpu)
+
+
+def export_thread_counts(worker_count, cpu, interop, ocr):
+    # read by torch/paddle when they get imported and by app.py, set by hand they stay as they are
+    values = {'OMP_NUM_THREADS': cpu, 'MKL_NUM_THREADS': cpu, 'OCR_CPU_THREADS': ocr,
+              'TORCH_THREADS_PER_WORKER': cpu, 'TORCH_INTEROP_THREADS': interop}
+    for name, value in values.items():
+        if name not in user_set and value:
+            os.environ[name] = str(value)
+    os.environ['GUNICORN_WORKERS'] = str(worker_count)
+
+
+cpu_threads, interop_threads, ocr_threads = thread_counts(workers)
+export_thread_counts(workers, cpu_threads, interop_threads, ocr_threads)
+
+
+def pre_fork(server, worker):
+    # everything loaded so far is long lived, keep the gc from touching (and so copying) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    global cpu_threads, interop_threads
+    if server.cfg.workers != workers:
+        # -w on the command line beats this file, the counts above were worked out for the wrong number
+        cpu_threads, interop_threads, ocr = thread_counts(server.cfg.workers)
+        export_thread_counts(server.cfg.workers, cpu_threads, interop_threads, ocr)
+    try:
+        import torch
+        torch.set_num_threads(cpu_threads)
+    except Exception as e:
+        print(f"could not set torch threads in worker {worker.pid}: {str(e)}")
+    if interop_threads and not preload_app:
+        # with preload app.py set it in the master already and the worker inherits it
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except Exception as e:
+            print(f"could not set interop threads in worker {worker.pid}: {str(e)}")
+    server.log.info(f"worker {worker.pid} using {cpu_threads} cpu threads")
+
+    # the worker only starts accepting once post_fork returns, so the first request finds warm kernels
+    try:
+        from warmup import warmup_app
+        warmup_app()
+    except Exception as e:
+        print(f"warmup failed in worker {worker.pid}: {str(e)}")
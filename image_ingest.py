@@ -0,0 +1,133 @@
+import io
+import math
+import threading
+
+from PIL import Image
+
+from metrics import timed
+
+
+class IngestedImage:
+    """One uploaded image for the whole request. The size comes from the header, pixels are decoded
+    only when something asks for them, and at most once per resolution"""
+
+    def __init__(self, data):
+        self.data = data
+        header = Image.open(io.BytesIO(data))  # Image.open only parses the header
+        self.size = header.size
+        self.format = header.format
+
+        self._full = None
+        self._detector = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def detector_image(self, size):
+        """RGB image with a long side of at least `size`, JPEGs get DCT-scaled (1/2, 1/4, 1/8) while decoding"""
+        with self._lock:
+            image = self._detector.get(size)
+            if image is not None:
+                return image
+
+            if self._full is not None:
+                # already paid for the full decode, just reuse it
+                image = self._full
+            else:
+                with timed('decode'):
+                    image = Image.open(io.BytesIO(self.data))
+                    ratio = size / max(self.size)
+                    if ratio < 1:
+                        # draft never goes below the requested size, the final resize does the rest
+                        image.draft('RGB', (math.ceil(self.size[0] * ratio), math.ceil(self.size[1] * ratio)))
+                    image = image.convert('RGB')
+
+            self._detector[size] = image
+            return image
+
+    @property
+    def full_image(self):
+        """Full resolution RGB pixels, decoded on first use (only images with detections need them)"""
+        with self._lock:
+            if self._full is None:
+                with timed('decode_full'):
+                    self._full = Image.open(io.BytesIO(self.data)).convert('RGB')
+            return self._full
+
+    def crop(self, box):
+        return self.full_image.crop(box)
+
+
+# PIL rotates counter-clockwise
+ROTATIONS = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+
+class RotatedImage:
+    """Rotated view of an IngestedImage, decodes through the base image and rotates the result"""
+
+    def __init__(self, base, angle):
+        if angle not in ROTATIONS:
+            raise ValueError(f"rotation must be one of {sorted(ROTATIONS)}, got {angle}")
+        self.base = base
+        self.angle = angle
+        width, height = base.size
+        self.size = (height, width) if angle in (90, 270) else (width, height)
+
+        self._full = None
+        self._lock = threading.Lock()
+
+    def detector_image(self, size):
+        return self.base.detector_image(size).transpose(ROTATIONS[self.angle])
+
+    @property
+    def full_image(self):
+        with self._lock:
+            if self._full is None:
+                self._full = self.base.full_image.transpose(ROTATIONS[self.angle])
+            return self._full
+
+    def crop(self, box):
+        return self.full_image.crop(box)
+
+    def box_to_original(self, box):
+        """Map [x1, y1, x2, y2] in rotated pixels back onto the unrotated image"""
+        x1, y1, x2, y2 = box
+        width, height = self.base.size
+        if self.angle == 90:
+            return [width - y2, x1, width - y1, x2]
+        if self.angle == 270:
+            return [y1, height - x2, y2, height - x1]
+        return [width - x2, height - y2, width - x1, height - y1]
+
+
+class CroppedImage:
+    """Part of an IngestedImage (box in original pixels), decodes through the base image and crops the result"""
+
+    def __init__(self, base, box):
+        self.base = base
+        self.box = [int(v) for v in box]
+        x1, y1, x2, y2 = self.box
+        self.size = (x2 - x1, y2 - y1)
+
+    def detector_image(self, size):
+        # the base has to be decoded big enough that the cropped part still has a long side of `size`
+        ratio = max(self.base.size) / max(self.size)
+        image = self.base.detector_image(math.ceil(size * ratio))
+        scale = image.size[0] / self.base.size[0]
+        x1, y1, x2, y2 = self.box
+        return image.crop((int(x1 * scale), int(y1 * scale), math.ceil(x2 * scale), math.ceil(y2 * scale)))
+
+    @property
+    def full_image(self):
+        return self.base.full_image.crop(self.box)
+
+    def crop(self, box):
+        return self.base.crop(self.box_to_original(box))
+
+    def box_to_original(self, box):
+        """Map [x1, y1, x2, y2] in cropped pixels back onto the whole image"""
+        x1, y1, x2, y2 = box
+        return [x1 + self.box[0], y1 + self.box[1], x2 + self.box[0], y2 + self.box[1]]
@@ -0,0 +1,103 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from test_model import run_model
+
+
+class InferenceScheduler:
+    """Groups concurrent requests into one batched model forward"""
+
+    def __init__(self, model, max_batch_size=4, max_wait_ms=10):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _ensure_worker(self):
+        # threads don't survive fork, so a gunicorn worker starts its own batching thread on first use
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+                self._worker.start()
+
+    def submit(self, image_tensor):
+        """Queue one image tensor, the returned future resolves to its prediction dict"""
+        if self._stopped.is_set():
+            raise RuntimeError("inference scheduler is stopped")
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image_tensor, future))
+        return future
+
+    def predict(self, image_tensor, timeout=None):
+        return self.submit(image_tensor).result(timeout=timeout)
+
+    def stop(self):
+        self._stopped.set()
+        if self._worker is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _collect_batch(self):
+        # block for the first item, then wait at most max_wait for the batch to fill up
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # keep the stop marker for the run loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            # callers that gave up already don't need a forward
+            batch = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                predictions = run_model(self.model, [tensor for tensor, _ in batch])
+            except Exception as e:
+                print(f"Batched inference Error: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), prediction in zip(batch, predictions):
+                future.set_result(prediction)
+
+        # nothing should wait forever on a stopped scheduler
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("inference scheduler is stopped"))
@@ -0,0 +1,188 @@
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+class QueueFull(Exception):
+    """The job queue is at its limit, retry_after is a guess in seconds of when a slot frees up"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, kind, payload):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = self.QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # bumped on every status change, event streams wait for it to move
+        self.version = 0
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def to_dict(self):
+        info = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'created': self.created,
+            'queued_seconds': (self.started or time.time()) - self.created
+        }
+        if self.finished:
+            info['run_seconds'] = self.finished - self.started
+        if self.status == self.DONE:
+            info['result'] = self.result
+        if self.status == self.FAILED:
+            info['error'] = self.error
+        return info
+
+
+class JobQueue:
+    """Bounded queue in front of a few worker threads. submit() answers right away with a Job or raises
+    QueueFull, so a load spike turns into 429s instead of requests piling up in gunicorn until they time out.
+    `handler(kind, payload)` does the work and returns the result dict"""
+
+    def __init__(self, handler, workers=None, max_depth=None, result_ttl=None):
+        self.handler = handler
+        self.workers = workers or int(os.getenv('JOB_WORKERS', 2))
+        self.max_depth = max_depth or int(os.getenv('JOB_QUEUE_SIZE', 32))
+        self.result_ttl = result_ttl if result_ttl is not None else float(os.getenv('JOB_RESULT_TTL_S', 600))
+
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        # the last few hundred waits and run times, for the stats and the Retry-After guess
+        self._waits = deque(maxlen=500)
+        self._runs = deque(maxlen=500)
+
+        self._jobs = {}
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _ensure_workers(self):
+        # called with the lock held, threads don't survive the gunicorn fork
+        if self._pid == os.getpid():
+            return
+        self._queue = queue.Queue(maxsize=self.max_depth)
+        self._pid = os.getpid()
+        self._threads = [threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind, payload):
+        with self._lock:
+            self._ensure_workers()
+            self._expire()
+            job = Job(kind, payload)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+            self._jobs[job.id] = job
+            self.accepted += 1
+            return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def wait(self, job, version, timeout):
+        """Block until the job changed after `version` (or timeout), returns the job's current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.version
+
+    def _set_status(self, job, status, **fields):
+        with self._changed:
+            job.status = status
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            started = time.time()
+            with self._lock:
+                self.running += 1
+                self._waits.append(started - job.created)
+            self._set_status(job, Job.RUNNING, started=started)
+
+            try:
+                result = self.handler(job.kind, job.payload)
+                status, fields = Job.DONE, {'result': result}
+            except Exception as e:
+                print(f"Job Error: {str(e)}")
+                status, fields = Job.FAILED, {'error': str(e)}
+
+            finished = time.time()
+            with self._lock:
+                self.running -= 1
+                self._runs.append(finished - started)
+                if status == Job.DONE:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            # the upload is not needed anymore, only the result stays around
+            job.payload = None
+            self._set_status(job, status, finished=finished, **fields)
+
+    def _retry_after(self):
+        # the queue drains at about workers / mean run time jobs per second
+        mean_run = sum(self._runs) / len(self._runs) if self._runs else 1.0
+        return max(1, math.ceil(self._queue.qsize() * mean_run / self.workers))
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [jid for jid, job in self._jobs.items()
+                       if job.finished and now - job.finished > self.result_ttl]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            waits = list(self._waits)
+            return {
+                'depth': self._queue.qsize() if self._queue is not None else 0,
+                'max_depth': self.max_depth,
+                'running': self.running,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'wait_p50_seconds': _percentile(waits, 50),
+                'wait_p95_seconds': _percentile(waits, 95)
+            }
@@ -0,0 +1,212 @@
+import difflib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from image_ingest import IngestedImage
+from metrics import timed
+
+# filled in once per pool process by _init_worker
+_worker = {}
+
+
+def _init_worker(lang, cpu_threads):
+    from paddleocr import PaddleOCR
+    _worker['ocr'] = PaddleOCR(use_angle_cls=True, lang=lang, show_log=False, cpu_threads=cpu_threads)
+
+
+def _read_tile(shm_name, shape, offset, tile_size):
+    """Full paddle pipeline (detection + cls + recognition) on one tile, boxes in full image pixels.
+    The whole image sits in a shared block, only its name and the tile position get pickled"""
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        array = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        x_offset, y_offset = offset
+        # paddle wants its own contiguous pixels, the copy is made here instead of in a pickle
+        tile = np.ascontiguousarray(array[y_offset:y_offset + tile_size, x_offset:x_offset + tile_size])
+        del array  # the view into the block has to go before it can close
+    finally:
+        block.close()
+
+    result = _worker['ocr'].ocr(tile, cls=True)
+    lines = []
+    if result and result[0]:
+        for points, (text, conf) in result[0]:
+            xs = [point[0] + x_offset for point in points]
+            ys = [point[1] + y_offset for point in points]
+            lines.append({'text': text.strip(), 'confidence': float(conf),
+                          'box': [min(xs), min(ys), max(xs), max(ys)]})
+    return [line for line in lines if line['text']]
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """Top-left corners of overlapping tiles covering the image, the last row/column sits flush with the edge"""
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+    return [(x, y) for y in starts(height) for x in starts(width)]
+
+
+def _overlap_ratio(a, b):
+    # intersection over the smaller box, a line cut at a tile border sits inside its full version
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return inter / smaller if smaller > 0 else 0.0
+
+
+def _same_text(a, b):
+    return a in b or b in a or difflib.SequenceMatcher(None, a, b).ratio() > 0.8
+
+
+def merge_lines(lines, min_overlap=0.5):
+    """Drop the copies of a line that two overlapping tiles both read, keeping the longest / surest one"""
+    kept = []
+    # longest text first so a full line wins over the half that was cut off at a tile edge
+    for line in sorted(lines, key=lambda line: (len(line['text']), line['confidence']), reverse=True):
+        duplicate = any(_overlap_ratio(line['box'], other['box']) >= min_overlap and _same_text(line['text'], other['text'])
+                        for other in kept)
+        if not duplicate:
+            kept.append(line)
+    return kept
+
+
+def reading_order(lines):
+    """Sort lines top to bottom, and left to right inside a row"""
+    rows = []
+    for line in sorted(lines, key=lambda line: (line['box'][1] + line['box'][3]) / 2):
+        center = (line['box'][1] + line['box'][3]) / 2
+        if rows:
+            last = rows[-1][-1]['box']
+            if abs(center - (last[1] + last[3]) / 2) < (last[3] - last[1]) / 2:
+                rows[-1].append(line)
+                continue
+        rows.append([line])
+    return [line for row in rows for line in sorted(row, key=lambda line: line['box'][0])]
+
+
+class LocalOCRService:
+    """Full image OCR with PaddleOCR instead of Azure. Big images are cut into overlapping tiles that run
+    in a process pool, lines read twice at tile borders are merged. Same interface as AzureVisionService"""
+
+    def __init__(self, max_workers=None, lang=None, tile_size=None, overlap=None):
+        # half the cores per gunicorn worker (2 by default), one paddle thread per tile process
+        self.max_workers = max_workers or int(os.getenv('LOCAL_OCR_WORKERS', max(1, (os.cpu_count() or 1) // 2)))
+        # korean like the azure path, paddle reads latin letters and digits with it too
+        self.lang = lang or os.getenv('LOCAL_OCR_LANG', 'korean')
+        self.tile_size = tile_size or int(os.getenv('LOCAL_OCR_TILE', 1280))
+        self.overlap = overlap or int(os.getenv('LOCAL_OCR_OVERLAP', 160))
+        self.cpu_threads = int(os.getenv('LOCAL_OCR_THREADS', 1))
+
+        self.restarts = 0
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # started on first use in each process, a pool made in the gunicorn master is useless after the fork.
+        # spawn, because paddle does not survive being forked once it is loaded
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.lang, self.cpu_threads)
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _restart(self, broken):
+        with self._lock:
+            # another thread may have replaced it already
+            if self._pool is broken:
+                print("Local OCR worker died, restarting the pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self.restarts += 1
+
+    def read_lines(self, image, deadline=None):
+        """Every text line of the image in reading order, as dicts of text, confidence and box"""
+        if isinstance(image, IngestedImage):
+            image = image.full_image
+        array = cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+        height, width = array.shape[:2]
+
+        # the image goes into shared memory once, every tile process reads its part straight from there
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        try:
+            block.buf[:array.nbytes] = array.reshape(-1)
+            del array
+            tiles = tile_grid(width, height, self.tile_size, self.overlap)
+            lines = self._run(block.name, (height, width, 3), tiles, deadline)
+        finally:
+            block.close()
+            block.unlink()
+        return reading_order(merge_lines(lines))
+
+    def _run(self, shm_name, shape, tiles, deadline):
+        # a crashed tile process breaks the whole pool, it is rebuilt and the image retried once
+        for attempt in range(2):
+            pool = self._get_pool()
+            futures = []
+            try:
+                futures = [pool.submit(_read_tile, shm_name, shape, offset, self.tile_size) for offset in tiles]
+                lines = []
+                for future in futures:
+                    lines.extend(future.result(timeout=deadline.remaining() if deadline else None))
+                return lines
+            except FutureTimeout:
+                for future in futures:
+                    future.cancel()
+                raise
+            except BrokenProcessPool:
+                self._restart(pool)
+                if attempt or (deadline and deadline.expired()):
+                    raise
+
+    def extract_text(self, image, translate_to='en', deadline=None):
+        """Same answer shape as AzureVisionService.extract_text. There is no local translator, so the
+        translated text is the original (dates are digits in every language anyway)"""
+        try:
+            with timed('local_ocr'):
+                lines = self.read_lines(image, deadline)
+        except Exception as e:
+            print(f"Local OCR Error: {str(e)}")
+            return {
+                'original_text': 'issue: local OCR failed',
+                'translated_text': 'issue: local OCR failed'
+            }
+
+        text = " ".join(line['text'] for line in lines)
+        if not text.strip():
+            return {
+                'original_text': 'No text detected in image',
+                'translated_text': 'No text detected in image'
+            }
+        return {'original_text': text, 'translated_text': text}
+
+    def extract_texts(self, images, translate_to='en', deadline=None):
+        return [self.extract_text(image, translate_to, deadline) for image in images]
+
+    def extract_text_async(self, image, translate_to='en', deadline=None):
+        """Returns a future like the azure service, the tiles already run in the pool so a thread is enough"""
+        future = Future()
+
+        def run():
+            if future.set_running_or_notify_cancel():
+                future.set_result(self.extract_text(image, translate_to, deadline))
+        threading.Thread(target=run, name='local-ocr', daemon=True).start()
+        return future
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# how long an answer stays good, per namespace (label text of a product barely changes)
+DEFAULT_TTL_DAYS = {
+    'translation': 30,
+    'gemini_date': 30,
+    'ocr_text': 7
+}
+
+
+def memo_key(*parts):
+    """Stable key for any mix of strings and bytes, long texts don't end up as sqlite keys"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def normalize_text(text):
+    # same label read twice differs in case and spacing more than in anything else
+    return ' '.join(str(text).lower().split())
+
+
+class MemoStore:
+    """Persistent memo of paid API answers in SQLite. WAL mode lets every gunicorn worker read and write
+    the same file, entries expire after their namespace's TTL and the least recently used go once there
+    are more than `max_entries`. A broken or missing database only means misses, never a failed request"""
+
+    def __init__(self, path=None, max_entries=None, ttl_days=None):
+        self.path = os.getenv('MEMO_DB', 'cache/memo.sqlite3') if path is None else path
+        self.max_entries = max_entries or int(os.getenv('MEMO_MAX_ENTRIES', 50000))
+        self.ttls = {}
+        for namespace, days in {**DEFAULT_TTL_DAYS, **(ttl_days or {})}.items():
+            days = float(os.getenv(f'MEMO_TTL_{namespace.upper()}_DAYS', days))
+            self.ttls[namespace] = days * 86400
+
+        self.hits = {}
+        self.misses = {}
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connection(self):
+        # one connection per thread and process, sqlite connections don't survive a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS memo ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+            ' created REAL NOT NULL, accessed REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key)) WITHOUT ROWID'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS memo_accessed ON memo (accessed)')
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, counter, namespace):
+        with self._lock:
+            counter[namespace] = counter.get(namespace, 0) + 1
+
+    def get(self, namespace, key):
+        """The stored value, or None when it is missing or expired"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute('SELECT value, created, accessed FROM memo WHERE namespace = ? AND key = ?',
+                                     (namespace, key)).fetchone()
+            if row is not None and now - row[1] > self.ttls.get(namespace, float('inf')):
+                connection.execute('DELETE FROM memo WHERE namespace = ? AND key = ?', (namespace, key))
+                row = None
+            if row is not None and now - row[2] > 60:
+                # last access only matters for eviction, no need to write it on every hit
+                connection.execute('UPDATE memo SET accessed = ? WHERE namespace = ? AND key = ?',
+                                   (now, namespace, key))
+        except sqlite3.Error as e:
+            print(f"Memo read Error: {str(e)}")
+            row = None
+
+        if row is None:
+            self._count(self.misses, namespace)
+            return None
+        self._count(self.hits, namespace)
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute('INSERT OR REPLACE INTO memo (namespace, key, value, created, accessed) '
+                               'VALUES (?, ?, ?, ?, ?)', (namespace, key, json.dumps(value), now, now))
+        except sqlite3.Error as e:
+            print(f"Memo write Error: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % 100 == 1
+        if sweep:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        now = time.time()
+        try:
+            connection = self._connection()
+            for namespace, ttl in self.ttls.items():
+                connection.execute('DELETE FROM memo WHERE namespace = ? AND created < ?', (namespace, now - ttl))
+            (count,) = connection.execute('SELECT COUNT(*) FROM memo').fetchone()
+            if count > self.max_entries:
+                connection.execute(
+                    'DELETE FROM memo WHERE (namespace, key) IN '
+                    '(SELECT namespace, key FROM memo ORDER BY accessed LIMIT ?)', (count - self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"Memo eviction Error: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            result = {}
+            for namespace in sorted(namespaces):
+                hits, misses = self.hits.get(namespace, 0), self.misses.get(namespace, 0)
+                result[namespace] = {'hits': hits, 'misses': misses,
+                                     'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+            return result
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import sys
+
+# Rss counts shared pages in every process, Pss splits them between the sharers so it adds up
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def read_memory(pid):
+    """Memory of one process in MB from /proc/<pid>/smaps_rollup"""
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            key = parts[0].rstrip(':')
+            if key in FIELDS:
+                usage[key] = int(parts[1]) / 1024
+    return usage
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_name(pid):
+    with open(f'/proc/{pid}/cmdline', 'rb') as f:
+        return f.read().replace(b'\0', b' ').decode(errors='replace').strip()
+
+
+def collect(master_pid):
+    report = {'master': {'pid': master_pid, **read_memory(master_pid)}, 'workers': []}
+    for pid in child_pids(master_pid):
+        try:
+            report['workers'].append({'pid': pid, **read_memory(pid)})
+        except OSError:
+            continue  # worker restarted while we were reading
+
+    processes = [report['master']] + report['workers']
+    report['total_rss'] = sum(p.get('Rss', 0) for p in processes)
+    report['total_pss'] = sum(p.get('Pss', 0) for p in processes)
+    return report
+
+
+def print_report(report, label=''):
+    print(f"{label}master {report['master']['pid']} + {len(report['workers'])} workers")
+    print(f"{'pid':>8} {'rss':>9} {'pss':>9} {'shared':>9} {'private':>9}")
+    for p in [report['master']] + report['workers']:
+        shared = p.get('Shared_Clean', 0) + p.get('Shared_Dirty', 0)
+        private = p.get('Private_Clean', 0) + p.get('Private_Dirty', 0)
+        print(f"{p['pid']:>8} {p.get('Rss', 0):>8.0f}M {p.get('Pss', 0):>8.0f}M {shared:>8.0f}M {private:>8.0f}M")
+    print(f"total rss {report['total_rss']:.0f}M, total pss (real footprint) {report['total_pss']:.0f}M")
+
+
+def find_master():
+    """Oldest gunicorn process running app:app"""
+    for pid in sorted(int(name) for name in os.listdir('/proc') if name.isdigit()):
+        try:
+            name = process_name(pid)
+        except OSError:
+            continue
+        if 'gunicorn' in name and 'app:app' in name and pid != os.getpid():
+            return pid
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS/PSS per gunicorn worker, run once without and once with preload")
+    parser.add_argument('--pid', type=int, help="gunicorn master pid (found automatically if left out)")
+    parser.add_argument('--save', help="write the report to this json file")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two saved reports")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        print_report(before, 'before: ')
+        print()
+        print_report(after, 'after:  ')
+        print(f"\npss saved: {before['total_pss'] - after['total_pss']:.0f}M "
+              f"({(1 - after['total_pss'] / before['total_pss']) * 100:.0f}%)")
+        return 0
+
+    pid = args.pid or find_master()
+    if pid is None:
+        print("no gunicorn master found, pass --pid")
+        return 1
+
+    report = collect(pid)
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
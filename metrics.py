@@ -0,0 +1,145 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds, from a cached date parse up to a slow Azure round trip
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                # prometheus buckets are cumulative
+                running = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    running += bucket_count
+                    labels = _label_text(self.labelnames + ('le',), key + (_number(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {running}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_number(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    'expiry_stage_seconds',
+    'Time spent in each pipeline stage',
+    ['stage']
+)
+
+STAGE_ERRORS = Counter(
+    'expiry_stage_errors_total',
+    'Pipeline stages that raised',
+    ['stage']
+)
+
+ANALYZE_METHOD = Counter(
+    'expiry_analyze_method_total',
+    'Which analyze_text method produced the answer (ocr, regex, gemini, compact or none)',
+    ['method']
+)
+
+OCR_CROPS = Counter(
+    'expiry_ocr_crops_total',
+    'Detected boxes that went through OCR (read) or were skipped because they could not reach the top 3',
+    ['outcome']
+)
+
+STREAM_FRAMES = Counter(
+    'expiry_stream_frames_total',
+    'Live scan frames by what they cost: keyframe (detector ran) or tracked (optical flow only)',
+    ['kind']
+)
+
+PREFILTER = Counter(
+    'expiry_prefilter_total',
+    'Text prefilter decisions: rejected (no text, detector skipped), cropped (detector on the text region) or full',
+    ['outcome']
+)
+
+METRICS = [STAGE_SECONDS, STAGE_ERRORS, ANALYZE_METHOD, OCR_CROPS, STREAM_FRAMES, PREFILTER]
+
+
+@contextmanager
+def timed(stage):
+    """Time the block into expiry_stage_seconds{stage=...}, also when it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def render(gauges=None):
+    """Everything in the Prometheus text format, gauges is {name: (help, value)} for one-off numbers"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, (documentation, value) in sorted((gauges or {}).items()):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_number(value)}")
+    return '\n'.join(lines) + '\n'
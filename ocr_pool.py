@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import timed
+
+# the OCRService of a pool process, made once by _init_worker
+_worker = {}
+
+
+def _init_worker(cpu_threads):
+    from ocr_service import OCRService
+    _worker['ocr'] = OCRService(cpu_threads=cpu_threads)
+
+
+def _read_shared(shm_name, layout, det):
+    """Runs in a pool process: read the crops straight out of the shared block, no copy of the pixels"""
+    from PIL import Image
+
+    block = shared_memory.SharedMemory(name=shm_name)
+    arrays = []
+    try:
+        arrays = [np.ndarray(shape, dtype=np.uint8, buffer=block.buf, offset=offset) for offset, shape in layout]
+        ocr = _worker['ocr']
+        if det:
+            return [ocr.read_text(Image.fromarray(array)) for array in arrays]
+        sizes = [(shape[1], shape[0]) for _, shape in layout]
+        try:
+            rec_results = ocr.recognize(arrays)
+        except Exception as e:
+            print(f"Batch OCR Error: {str(e)}")
+            rec_results = [('', 0.0)] * len(arrays)
+        return ocr.batch_results(sizes, rec_results)
+    finally:
+        del arrays[:]  # views into the block have to go before it can close
+        block.close()
+
+
+def _empty_result(size):
+    return {'paddle_text': '', 'paddle_confidence': 0.0, 'dimensions': f"{size[0]}x{size[1]}px", 'is_date': False}
+
+
+class OCRWorkerPool:
+    """OCRService in a pool of processes, each with its own PaddleOCR, so OCR of several requests runs on
+    several cores instead of queueing behind one engine. Crops go through one shared memory block per call,
+    only their offsets and shapes get pickled. A crashed worker breaks the pool, it is rebuilt and the
+    batch retried once. read_text_batch is a drop-in for OCRService.read_text_batch"""
+
+    def __init__(self, size=None, cpu_threads=None):
+        self.size = size or int(os.getenv('OCR_POOL_SIZE', 2))
+        total_threads = int(os.getenv('OCR_CPU_THREADS', 10))
+        self.cpu_threads = cpu_threads or int(os.getenv('OCR_POOL_THREADS', max(1, total_threads // self.size)))
+
+        self.restarts = 0
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # made on first use in each process (the gunicorn master's pool is no good after the fork),
+        # spawn because paddle does not survive a fork once loaded
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.cpu_threads,)
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _restart(self, broken):
+        with self._lock:
+            # another thread may have replaced it already
+            if self._pool is broken:
+                print("OCR worker died, restarting the OCR pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self.restarts += 1
+
+    def read_text_batch(self, images, det=False):
+        """Read text from many cropped regions at once, split over the pool processes"""
+        if not images:
+            return []
+
+        arrays = [np.ascontiguousarray(np.array(image.convert('RGB'), dtype=np.uint8)) for image in images]
+        layout, offset = [], 0
+        for array in arrays:
+            layout.append((offset, array.shape))
+            offset += array.nbytes
+
+        block = shared_memory.SharedMemory(create=True, size=max(1, offset))
+        try:
+            for array, (start, _) in zip(arrays, layout):
+                block.buf[start:start + array.nbytes] = array.reshape(-1)
+            with timed('ocr_pool'):
+                return self._run(block.name, layout, det)
+        finally:
+            block.close()
+            block.unlink()
+
+    def _run(self, shm_name, layout, det):
+        # an even share of the crops per process, every slice is one batched paddle call
+        per_worker = -(-len(layout) // self.size)
+        slices = [layout[start:start + per_worker] for start in range(0, len(layout), per_worker)]
+
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                futures = [pool.submit(_read_shared, shm_name, part, det) for part in slices]
+                return [result for future in futures for result in future.result()]
+            except BrokenProcessPool:
+                self._restart(pool)
+            except Exception as e:
+                print(f"OCR pool Error: {str(e)}")
+                break
+        return [_empty_result((shape[1], shape[0])) for _, shape in layout]
+
+    def stats(self):
+        return {'size': self.size, 'restarts': self.restarts}
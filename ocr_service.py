@@ -3,11 +3,12 @@ from paddleocr import PaddleOCR
 import numpy as np
 import cv2
 import re
+from metrics import timed
 
 class OCRService:
-    def __init__(self):
-        # Setup OCR engine
-        self.paddle_ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+    def __init__(self, cpu_threads=10):
+        # Setup OCR engine (cpu_threads is per process, lower it when several workers share the cores)
+        self.paddle_ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False, cpu_threads=cpu_threads)
         
         # Patterns to detect dates (YYYY-MM-DD, etc.) the detiction is not accurate.
         #  so sorting muntiple detected outputs on basis of date visibility. 
@@ -31,7 +32,8 @@ class OCRService:
             
             # Converting images for PaddleOCR detection
             paddle_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            paddle_result = self.paddle_ocr.ocr(paddle_image, cls=True)
+            with timed('ocr'):
+                paddle_result = self.paddle_ocr.ocr(paddle_image, cls=True)
             
             # def valuee
             paddle_text = ""
@@ -76,4 +78,44 @@ class OCRService:
                 'paddle_confidence': 0.0,
                 'dimensions': f"{width}x{height}px",
                 'is_date': False
-            } 
\ No newline at end of file
+            }
+
+    def read_text_batch(self, images, det=False):
+        """Read text from many cropped regions at once (crops can come from one or several images)"""
+        if not images:
+            return []
+
+        # with det the full pipeline runs on every crop, same as calling read_text one by one
+        if det:
+            return [self.read_text(image) for image in images]
+
+        sizes = [image.size for image in images]
+        try:
+            rec_results = self.recognize([np.array(image.convert('RGB')) for image in images])
+        except Exception as e:
+            print(f"Batch OCR Error: {str(e)}")
+            rec_results = [('', 0.0)] * len(images)
+        return self.batch_results(sizes, rec_results)
+
+    def recognize(self, arrays):
+        """(text, confidence) for every RGB crop array"""
+        # the detector already localized the date, so skip paddle's text detection and
+        # send every crop through angle cls + recognition in batches (rec_batch_num per pass)
+        crops = [cv2.cvtColor(array, cv2.COLOR_RGB2BGR) for array in arrays]
+        with timed('ocr_batch'):
+            if self.paddle_ocr.use_angle_cls:
+                crops, _, _ = self.paddle_ocr.text_classifier(crops)
+            rec_results, _ = self.paddle_ocr.text_recognizer(crops)
+        return rec_results
+
+    def batch_results(self, sizes, rec_results):
+        results = []
+        for (width, height), (text, conf) in zip(sizes, rec_results):
+            text = text.strip()
+            results.append({
+                'paddle_text': text,
+                'paddle_confidence': float(conf) * 100 if text else 0.0,
+                'dimensions': f"{width}x{height}px",
+                'is_date': self.is_date_format(text)
+            })
+        return results 
\ No newline at end of file
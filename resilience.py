@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Deadline:
+    """End-to-end time budget of one request, every outgoing call gets at most what is left of it"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap=None):
+        """Timeout for the next call: what is left of the budget, never more than cap. Raises when nothing is left"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"request budget of {self.seconds:.1f}s used up")
+        return min(remaining, cap) if cap else remaining
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` failures in a row, calls then fail right away.
+    While open a background thread runs `probe` every `probe_interval` seconds and closes the breaker
+    once it succeeds. Without a probe the breaker goes half-open after `reset_timeout` and lets one
+    trial call through"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, probe=None, probe_interval=5.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.probe_interval = probe_interval
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._trial_running = False
+        self._prober = None
+        self._prober_pid = None
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args, **kwargs):
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == self.OPEN and self.probe is None and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_running):
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} is failing, not calling it for now")
+            if self.state == self.HALF_OPEN:
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"{self.name} is back, closing the circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"{self.name} failed {self.failures} times, opening the circuit")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._start_prober()
+
+    def _start_prober(self):
+        # called with the lock held, one prober per process (threads don't survive a gunicorn fork)
+        if self.probe is None:
+            return
+        if self._prober is not None and self._prober.is_alive() and self._prober_pid == os.getpid():
+            return
+        self._prober_pid = os.getpid()
+        self._prober = threading.Thread(target=self._probe_loop, name=f"probe-{self.name}", daemon=True)
+        self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self.state != self.OPEN:
+                    return
+            try:
+                healthy = self.probe()
+            except Exception as e:
+                print(f"{self.name} probe Error: {str(e)}")
+                healthy = False
+            if healthy:
+                self.record_success()
+                return
+
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+# own small pool for hedged calls, so a service that already runs on its pool never waits on itself
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _hedge_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv('HEDGE_MAX_WORKERS', 8)),
+                                           thread_name_prefix='hedge')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def hedged_call(fn, *args, hedge_after=None, deadline=None, **kwargs):
+    """Run fn and, when it has not answered after `hedge_after` seconds, start a second identical call.
+    The first result wins, the loser is cancelled if it has not started yet. Only for idempotent calls.
+    Raises DeadlineExceeded when neither answers within the deadline"""
+    executor = _hedge_executor()
+    answered = threading.Event()
+
+    def attempt():
+        # a pool thread can pick the hedge up before it gets cancelled, it checks again here
+        if answered.is_set():
+            raise CancelledError("the other call already answered")
+        result = fn(*args, **kwargs)
+        answered.set()
+        return result
+
+    futures = [executor.submit(attempt)]
+    errors = []
+
+    def time_left():
+        return deadline.remaining() if deadline else None
+
+    if hedge_after is not None:
+        wait_for = hedge_after if deadline is None else min(hedge_after, deadline.remaining())
+        done, _ = wait(futures, timeout=wait_for)
+        if not done and not (deadline and deadline.expired()):
+            futures.append(executor.submit(attempt))
+
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=time_left(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            errors.append(future.exception())
+
+    if errors and not pending:
+        raise errors[0]
+    for future in pending:
+        future.cancel()
+    raise DeadlineExceeded("no answer within the request budget")
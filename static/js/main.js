@@ -1,4 +1,5 @@
 let currentImageData = null;
+let liveScan = null;
 
 // Run when page loads
 document.addEventListener('DOMContentLoaded', function() {
@@ -50,8 +51,8 @@ document.addEventListener('DOMContentLoaded', function() {
         formData.append('file', file);
         
         try {
-            // Step 1: Detect dates
-            const response = await fetch('/detect', {
+            // One upload: detection and text analysis come back together
+            const response = await fetch('/scan', {
                 method: 'POST',
                 body: formData
             });
@@ -61,11 +62,12 @@ document.addEventListener('DOMContentLoaded', function() {
             resultsSection.style.display = 'block';
             
             if (response.ok) {
-                if (data.detections && data.detections.length > 0) {
+                const detections = data.detections || [];
+                if (detections.length > 0) {
                     // Show results
                     let html = '<h3>Detection Results</h3>';
                     
-                    data.detections.forEach((item, index) => {
+                    detections.forEach((item, index) => {
                         html += `
                             <div class="result-item">
                                 <div class="date-text">Date ${index + 1}: ${item.paddle_text || 'Unknown'}</div>
@@ -81,16 +83,14 @@ document.addEventListener('DOMContentLoaded', function() {
                     resultsDiv.innerHTML = html;
                     
                     // Draw boxes on image
-                    drawBoxes(data.detections, data.image_width, data.image_height);
-                    
-                    // Pass detected dates to analyze
-                    analyzeImage(file, data.detections);
+                    drawBoxes(detections, data.image_width, data.image_height);
                 } else {
                     resultsDiv.innerHTML = '<div class="error">No dates detected</div>';
-                    
-                    // Even if no dates detected, try to analyze text
-                    analyzeImage(file, []);
                 }
+                
+                addFormattedDates(detections);
+                showAnalysis(true, data, detections);
+                showThumbnail(data.thumbnail_path);
             } else {
                 resultsDiv.innerHTML = `<div class="error">Error: ${data.error || 'Failed to process'}</div>`;
                 analyzeImage(file, []);
@@ -103,6 +103,15 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Start / stop the live camera scan
+    document.getElementById('liveButton').addEventListener('click', function() {
+        if (liveScan) {
+            stopLiveScan();
+        } else {
+            startLiveScan();
+        }
+    });
+    
     // Fix boxes when window size changes
     window.addEventListener('resize', function() {
         if (currentImageData) {
@@ -144,6 +153,138 @@ function drawBoxes(detections, imageWidth, imageHeight) {
     });
 }
 
+// Swap the full size local preview for the small server thumbnail once it exists
+function showThumbnail(thumbnailPath, retries = 3) {
+    if (!thumbnailPath) return;
+    
+    const thumb = new Image();
+    thumb.onload = function() {
+        const preview = document.getElementById('imagePreview');
+        preview.onload = function() {
+            preview.onload = null;
+            // boxes are in original pixels, only the display scale changed
+            if (currentImageData) {
+                drawBoxes(currentImageData.detections || [], currentImageData.image_width, currentImageData.image_height);
+            }
+        };
+        preview.src = thumbnailPath;
+    };
+    thumb.onerror = function() {
+        // the server writes it in the background, it can be a moment late
+        if (retries > 0) {
+            setTimeout(() => showThumbnail(thumbnailPath, retries - 1), 500);
+        }
+    };
+    thumb.src = thumbnailPath;
+}
+
+// Live scan: camera frames go to /stream/frame one at a time, the next one is sent when the answer is back
+async function startLiveScan() {
+    const button = document.getElementById('liveButton');
+    const video = document.getElementById('liveVideo');
+    const bestDiv = document.getElementById('liveBest');
+    
+    let stream;
+    try {
+        stream = await navigator.mediaDevices.getUserMedia({ video: { facingMode: 'environment' }, audio: false });
+    } catch (error) {
+        alert(`Camera not available: ${error.message}`);
+        return;
+    }
+    
+    video.srcObject = stream;
+    document.getElementById('live-section').style.display = 'block';
+    bestDiv.textContent = 'Point the camera at the date';
+    button.textContent = 'Stop Live Scan';
+    
+    liveScan = { stream: stream, sessionId: null, canvas: document.createElement('canvas') };
+    const scan = liveScan;
+    
+    while (liveScan === scan) {
+        const started = Date.now();
+        const frame = await grabFrame(video, scan.canvas);
+        if (frame) {
+            try {
+                const formData = new FormData();
+                formData.append('frame', frame, 'frame.jpg');
+                if (scan.sessionId) formData.append('session_id', scan.sessionId);
+                
+                const response = await fetch('/stream/frame', { method: 'POST', body: formData });
+                const data = await response.json();
+                if (liveScan !== scan) break;
+                scan.sessionId = data.session_id || scan.sessionId;
+                
+                if (response.ok) {
+                    drawLiveBoxes(data.tracks, data.image_width, data.image_height);
+                    if (data.best) {
+                        bestDiv.textContent = `Best date so far: ${data.best.parsed_date} (read "${data.best.paddle_text}")`;
+                    }
+                }
+            } catch (error) {
+                console.error('Live scan error:', error);
+            }
+        }
+        // at most ~8 frames a second, slower when the server is busy
+        const wait = Math.max(0, 125 - (Date.now() - started));
+        await new Promise(resolve => setTimeout(resolve, wait));
+    }
+}
+
+function stopLiveScan() {
+    if (!liveScan) return;
+    
+    liveScan.stream.getTracks().forEach(track => track.stop());
+    if (liveScan.sessionId) {
+        const formData = new FormData();
+        formData.append('session_id', liveScan.sessionId);
+        fetch('/stream/end', { method: 'POST', body: formData });
+    }
+    liveScan = null;
+    
+    document.getElementById('liveVideo').srcObject = null;
+    document.getElementById('liveBoxes').innerHTML = '';
+    document.getElementById('liveButton').textContent = 'Live Scan';
+}
+
+// Current video frame as a jpeg of at most 640px, the server decodes it with a draft
+function grabFrame(video, canvas) {
+    if (!video.videoWidth) {
+        return Promise.resolve(null);
+    }
+    const scale = Math.min(1, 640 / Math.max(video.videoWidth, video.videoHeight));
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.8));
+}
+
+// Tracked boxes over the video, in frame pixels
+function drawLiveBoxes(tracks, frameWidth, frameHeight) {
+    const container = document.getElementById('liveBoxes');
+    container.innerHTML = '';
+    
+    const video = document.getElementById('liveVideo');
+    const scale = video.offsetWidth / frameWidth;
+    
+    (tracks || []).forEach(track => {
+        const [x1, y1, x2, y2] = track.bbox;
+        
+        const box = document.createElement('div');
+        box.className = 'box';
+        box.style.left = `${x1 * scale}px`;
+        box.style.top = `${y1 * scale}px`;
+        box.style.width = `${(x2 - x1) * scale}px`;
+        box.style.height = `${(y2 - y1) * scale}px`;
+        
+        const label = document.createElement('div');
+        label.className = 'box-label';
+        label.textContent = track.paddle_text || '...';
+        box.appendChild(label);
+        
+        container.appendChild(box);
+    });
+}
+
 // Get text analysis
 async function analyzeImage(file, detections = []) {
     const formData = new FormData();
@@ -164,46 +305,10 @@ async function analyzeImage(file, detections = []) {
         
         // Add to form data
         formData.append('detections', JSON.stringify(cleanDetections));
-        
-        // Pre-process detected dates to help with display
-        detections.forEach((item, index) => {
-            if (item.paddle_text) {
-                // Clean up text with regex to handle special formats
-                const text = item.paddle_text;
-                
-                // For formats like "202501/28"
-                if (/^\d{6}\/\d{1,2}$/.test(text)) {
-                    const year = text.substring(0, 4);
-                    const month = text.substring(4, 6);
-                    const day = text.split('/')[1];
-                    
-                    // Add a reformatted version
-                    item.formatted_date = `${day}/${month}/${year}`;
-                }
-                
-                // For formats like "20240530"
-                else if (/^\d{8}$/.test(text)) {
-                    const year = text.substring(0, 4);
-                    const month = text.substring(4, 6);
-                    const day = text.substring(6, 8);
-                    
-                    // Add a reformatted version
-                    item.formatted_date = `${day}/${month}/${year}`;
-                }
-                
-                // For formats like "2022.07.19"
-                else if (/^\d{4}[.]\d{2}[.]\d{2}$/.test(text)) {
-                    const year = text.substring(0, 4);
-                    const month = text.substring(5, 7);
-                    const day = text.substring(8, 10);
-                    
-                    // Add a reformatted version
-                    item.formatted_date = `${day}/${month}/${year}`;
-                }
-            }
-        });
     }
     
+    addFormattedDates(detections);
+    
     try {
         const response = await fetch('/analyze', {
             method: 'POST',
@@ -211,89 +316,133 @@ async function analyzeImage(file, detections = []) {
         });
         
         const data = await response.json();
-        
-        if (response.ok) {
-            // Show original and translated text
-            document.getElementById('originalText').textContent = data.original_text || 'No text found';
-            document.getElementById('translatedText').textContent = data.translated_text || 'No text found';
+        showAnalysis(response.ok, data, detections);
+    } catch (error) {
+        console.error('Analysis error:', error);
+        const analysisResult = document.getElementById('analysisResult');
+        analysisResult.textContent = 'Expiration date analysis unavailable';
+        document.getElementById('analysis-section').style.display = 'block';
+    }
+}
+
+// Pre-process detected dates to help with display
+function addFormattedDates(detections) {
+    detections.forEach((item, index) => {
+        if (item.paddle_text) {
+            // Clean up text with regex to handle special formats
+            const text = item.paddle_text;
             
-            // Handle expiry status
-            const analysisResult = document.getElementById('analysisResult');
-            const analysisText = data.analysis || 'No expiration date found';
+            // For formats like "202501/28"
+            if (/^\d{6}\/\d{1,2}$/.test(text)) {
+                const year = text.substring(0, 4);
+                const month = text.substring(4, 6);
+                const day = text.split('/')[1];
+                
+                // Add a reformatted version
+                item.formatted_date = `${day}/${month}/${year}`;
+            }
+            
+            // For formats like "20240530"
+            else if (/^\d{8}$/.test(text)) {
+                const year = text.substring(0, 4);
+                const month = text.substring(4, 6);
+                const day = text.substring(6, 8);
+                
+                // Add a reformatted version
+                item.formatted_date = `${day}/${month}/${year}`;
+            }
             
-            // If we have detected dates but no analysis result, use detected dates directly
-            if (analysisText === 'No expiration date found. Please check the image for visible dates.' && detections.length > 0) {
-                // Try to parse the first date detection directly in the browser
-                for (const item of detections) {
-                    if (item.paddle_text) {
-                        const dateText = item.paddle_text;
-                        const dateObj = parseDetectedDate(dateText);
+            // For formats like "2022.07.19"
+            else if (/^\d{4}[.]\d{2}[.]\d{2}$/.test(text)) {
+                const year = text.substring(0, 4);
+                const month = text.substring(5, 7);
+                const day = text.substring(8, 10);
+                
+                // Add a reformatted version
+                item.formatted_date = `${day}/${month}/${year}`;
+            }
+        }
+    });
+}
+
+// Show text analysis results
+function showAnalysis(ok, data, detections = []) {
+    if (ok) {
+        // Show original and translated text
+        document.getElementById('originalText').textContent = data.original_text || 'No text found';
+        document.getElementById('translatedText').textContent = data.translated_text || 'No text found';
+        
+        // Handle expiry status
+        const analysisResult = document.getElementById('analysisResult');
+        const analysisText = data.analysis || 'No expiration date found';
+        
+        // If we have detected dates but no analysis result, use detected dates directly
+        if (analysisText === 'No expiration date found. Please check the image for visible dates.' && detections.length > 0) {
+            // Try to parse the first date detection directly in the browser
+            for (const item of detections) {
+                if (item.paddle_text) {
+                    const dateText = item.paddle_text;
+                    const dateObj = parseDetectedDate(dateText);
+                    
+                    if (dateObj) {
+                        // Calculate if expired
+                        const now = new Date();
+                        const daysDiff = Math.floor((dateObj - now) / (1000 * 60 * 60 * 24));
+                        const isExpired = daysDiff < 0;
                         
-                        if (dateObj) {
-                            // Calculate if expired
-                            const now = new Date();
-                            const daysDiff = Math.floor((dateObj - now) / (1000 * 60 * 60 * 24));
-                            const isExpired = daysDiff < 0;
-                            
-                            // Create formatted display text
-                            const status = isExpired ? "EXPIRED" : "NOT EXPIRED";
-                            const timeText = isExpired 
-                                ? `${Math.abs(daysDiff)} days ago` 
-                                : `${daysDiff} days remaining`;
-                                
-                            const formattedDate = `${dateObj.getDate().toString().padStart(2, '0')}-${(dateObj.getMonth()+1).toString().padStart(2, '0')}-${dateObj.getFullYear()}`;
-                                
-                            // Format text with HTML
-                            const formattedText = `Expiration Date: ${formattedDate}<br>` +
-                                `Original Format: ${dateText}<br>` +
-                                `Status: <span class="${isExpired ? 'expired' : 'not-expired'}">${status}</span><br>` +
-                                `Time: ${timeText}`;
+                        // Create formatted display text
+                        const status = isExpired ? "EXPIRED" : "NOT EXPIRED";
+                        const timeText = isExpired 
+                            ? `${Math.abs(daysDiff)} days ago` 
+                            : `${daysDiff} days remaining`;
                             
-                            analysisResult.innerHTML = formattedText;
+                        const formattedDate = `${dateObj.getDate().toString().padStart(2, '0')}-${(dateObj.getMonth()+1).toString().padStart(2, '0')}-${dateObj.getFullYear()}`;
                             
-                            // Add additional info about the format
-                            if (item.formatted_date) {
-                                analysisResult.innerHTML += `<div class="date-format-info">OCR detected "${dateText}" (interpreted as ${item.formatted_date})</div>`;
-                            }
-                            
-                            document.getElementById('analysis-section').style.display = 'block';
-                            return; // Exit early since we've handled the date
+                        // Format text with HTML
+                        const formattedText = `Expiration Date: ${formattedDate}<br>` +
+                            `Original Format: ${dateText}<br>` +
+                            `Status: <span class="${isExpired ? 'expired' : 'not-expired'}">${status}</span><br>` +
+                            `Time: ${timeText}`;
+                        
+                        analysisResult.innerHTML = formattedText;
+                        
+                        // Add additional info about the format
+                        if (item.formatted_date) {
+                            analysisResult.innerHTML += `<div class="date-format-info">OCR detected "${dateText}" (interpreted as ${item.formatted_date})</div>`;
                         }
+                        
+                        document.getElementById('analysis-section').style.display = 'block';
+                        return; // Exit early since we've handled the date
                     }
                 }
             }
+        }
+        
+        // Format the expiration status
+        if (analysisText.includes('EXPIRED')) {
+            // Bold the status and colorize
+            const formattedText = analysisText
+                .replace(/(Status: )(EXPIRED)/g, '$1<span class="expired">$2</span>')
+                .replace(/(Status: )(NOT EXPIRED)/g, '$1<span class="not-expired">$2</span>')
+                .replace(/\n/g, '<br>');
             
-            // Format the expiration status
-            if (analysisText.includes('EXPIRED')) {
-                // Bold the status and colorize
-                const formattedText = analysisText
-                    .replace(/(Status: )(EXPIRED)/g, '$1<span class="expired">$2</span>')
-                    .replace(/(Status: )(NOT EXPIRED)/g, '$1<span class="not-expired">$2</span>')
-                    .replace(/\n/g, '<br>');
-                
-                analysisResult.innerHTML = formattedText;
+            analysisResult.innerHTML = formattedText;
+            
+            // Add a clear explanation for special formats
+            if (detections.some(d => d.formatted_date)) {
+                const specialFormats = detections
+                    .filter(d => d.formatted_date)
+                    .map(d => `<div class="date-format-info">OCR detected "${d.paddle_text}" (interpreted as ${d.formatted_date})</div>`)
+                    .join('');
                 
-                // Add a clear explanation for special formats
-                if (detections.some(d => d.formatted_date)) {
-                    const specialFormats = detections
-                        .filter(d => d.formatted_date)
-                        .map(d => `<div class="date-format-info">OCR detected "${d.paddle_text}" (interpreted as ${d.formatted_date})</div>`)
-                        .join('');
-                    
-                    analysisResult.innerHTML += specialFormats;
-                }
-            } else {
-                analysisResult.textContent = analysisText;
+                analysisResult.innerHTML += specialFormats;
             }
-            
-            document.getElementById('analysis-section').style.display = 'block';
         } else {
-            const analysisResult = document.getElementById('analysisResult');
-            analysisResult.textContent = 'Expiration date analysis unavailable';
-            document.getElementById('analysis-section').style.display = 'block';
+            analysisResult.textContent = analysisText;
         }
-    } catch (error) {
-        console.error('Analysis error:', error);
+        
+        document.getElementById('analysis-section').style.display = 'block';
+    } else {
         const analysisResult = document.getElementById('analysisResult');
         analysisResult.textContent = 'Expiration date analysis unavailable';
         document.getElementById('analysis-section').style.display = 'block';
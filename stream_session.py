@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from date_engine import DateEngine
+from image_ingest import IngestedImage
+from metrics import STREAM_FRAMES, timed
+from test_model import collect_crops, get_detection_priority, ocr_service, prepare_image, run_model
+
+# tracking and change checks run on a small grayscale copy of the frame
+TRACK_SIZE = 320
+# every box is compared to what it looked like when it was last read, at this size
+SIGNATURE_SIZE = (32, 16)
+
+_dates = DateEngine()
+
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class StreamSession:
+    """State of one live camera scan. The detector only runs on keyframes (first frame, scene change,
+    lost track or every `keyframe_interval` frames), in between the boxes follow the picture with
+    optical flow. A box is OCR'd again only when it moved or its content changed since the last read"""
+
+    def __init__(self, session_id, model, scheduler=None, size=640, min_detection_confidence=0.3,
+                 keyframe_interval=15, scene_change=30.0, content_change=12.0, move_threshold=0.25, max_tracks=5):
+        self.session_id = session_id
+        self.model = model
+        self.scheduler = scheduler
+        self.size = size
+        self.min_detection_confidence = min_detection_confidence
+        self.keyframe_interval = keyframe_interval
+        self.scene_change = scene_change
+        self.content_change = content_change
+        self.move_threshold = move_threshold
+        self.max_tracks = max_tracks
+
+        self.frames = 0
+        self.keyframes = 0
+        self.ocr_reads = 0
+        self.tracks = []
+        self.best = None
+        self.last_seen = time.monotonic()
+
+        self._prev_gray = None
+        self._since_keyframe = 0
+        self._next_track_id = 1
+        self._lock = threading.Lock()
+
+    def process(self, data):
+        """Take one encoded frame, returns the tracked boxes and the best date seen so far"""
+        with self._lock:
+            self.last_seen = time.monotonic()
+            self.frames += 1
+            image = IngestedImage(data)
+            gray = self._tracking_gray(image)
+            scale = max(image.size) / max(gray.shape)
+
+            scene_changed = self._scene_changed(gray)
+            # with nothing to track the detector looks again a bit sooner
+            interval = self.keyframe_interval if self.tracks else max(1, self.keyframe_interval // 3)
+            keyframe = scene_changed or self._since_keyframe >= interval
+            if not keyframe:
+                with timed('stream_track'):
+                    keyframe = not self._track(gray, scale, image.size)
+            if keyframe:
+                self._detect(image)
+                self._since_keyframe = 0
+                self.keyframes += 1
+            else:
+                self._since_keyframe += 1
+            STREAM_FRAMES.inc(kind='keyframe' if keyframe else 'tracked')
+
+            reread = self._read_changed(image, gray, scale)
+            best_changed = self._update_best()
+            self._prev_gray = gray
+
+            return {
+                'session_id': self.session_id,
+                'frame': self.frames,
+                'keyframe': keyframe,
+                'scene_change': scene_changed,
+                'image_width': image.size[0],
+                'image_height': image.size[1],
+                'tracks': [self._track_view(track, track['id'] in reread) for track in self.tracks],
+                'best': self.best,
+                'best_changed': best_changed
+            }
+
+    def _tracking_gray(self, image):
+        # jpeg frames get draft decoded straight to about this size
+        small = image.detector_image(TRACK_SIZE)
+        ratio = TRACK_SIZE / max(small.size)
+        if ratio < 1:
+            small = small.resize((max(1, int(small.size[0] * ratio)), max(1, int(small.size[1] * ratio))))
+        return np.array(small.convert('L'))
+
+    def _scene_changed(self, gray):
+        if self._prev_gray is None or self._prev_gray.shape != gray.shape:
+            return True
+        return float(cv2.absdiff(self._prev_gray, gray).mean()) > self.scene_change
+
+    def _detect(self, image):
+        image_tensor, scale = prepare_image(image, self.size)
+        with timed('forward'):
+            if self.scheduler is not None:
+                prediction = self.scheduler.submit(image_tensor).result()
+            else:
+                prediction = run_model(self.model, [image_tensor])[0]
+        crops = collect_crops(image, prediction, scale, self.min_detection_confidence)
+        crops = sorted(crops, key=lambda crop: crop['score'], reverse=True)[:self.max_tracks]
+
+        # boxes that overlap an old track keep its id and last reading, the content check decides on OCR
+        tracks = []
+        unmatched = list(self.tracks)
+        for crop in crops:
+            match = max(unmatched, key=lambda track: _iou(track['bbox'], crop['bbox']), default=None)
+            if match is not None and _iou(match['bbox'], crop['bbox']) >= 0.3:
+                unmatched.remove(match)
+                track = dict(match, bbox=crop['bbox'], score=crop['score'])
+            else:
+                track = {'id': self._next_track_id, 'bbox': crop['bbox'], 'score': crop['score'],
+                         'reading': None, 'read_bbox': None, 'signature': None}
+                self._next_track_id += 1
+            tracks.append(track)
+        self.tracks = tracks
+
+    def _track(self, gray, scale, image_size):
+        """Shift every box by the median optical flow of the corners inside it, False when a box got lost"""
+        width, height = image_size
+        for track in self.tracks:
+            x1, y1, x2, y2 = [int(v / scale) for v in track['bbox']]
+            mask = np.zeros_like(self._prev_gray)
+            mask[y1:y2, x1:x2] = 255
+            points = cv2.goodFeaturesToTrack(self._prev_gray, maxCorners=30, qualityLevel=0.01, minDistance=3, mask=mask)
+            if points is None or len(points) < 3:
+                return False
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None)
+            found = status.reshape(-1) == 1
+            if found.sum() < 3:
+                return False
+
+            dx, dy = np.median((moved - points).reshape(-1, 2)[found], axis=0) * scale
+            bx1, by1, bx2, by2 = track['bbox']
+            if bx2 + dx <= 0 or by2 + dy <= 0 or bx1 + dx >= width or by1 + dy >= height:
+                return False  # left the picture
+            track['bbox'] = [int(max(0, bx1 + dx)), int(max(0, by1 + dy)),
+                             int(min(width, bx2 + dx)), int(min(height, by2 + dy))]
+        return True
+
+    def _signature(self, gray, scale, bbox):
+        height, width = gray.shape
+        x1, y1 = min(int(bbox[0] / scale), width - 1), min(int(bbox[1] / scale), height - 1)
+        x2, y2 = max(int(bbox[2] / scale), x1 + 1), max(int(bbox[3] / scale), y1 + 1)
+        region = gray[y1:y2, x1:x2]
+        return cv2.resize(region, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _needs_read(self, track, signature):
+        if track['reading'] is None:
+            return True
+        x1, y1, x2, y2 = track['bbox']
+        rx1, ry1, rx2, ry2 = track['read_bbox']
+        width, height = max(1, rx2 - rx1), max(1, ry2 - ry1)
+        moved = max(abs((x1 + x2) - (rx1 + rx2)) / 2 / width, abs((y1 + y2) - (ry1 + ry2)) / 2 / height)
+        resized = max(abs((x2 - x1) - width) / width, abs((y2 - y1) - height) / height)
+        if moved > self.move_threshold or resized > self.move_threshold:
+            return True
+        return float(np.abs(signature - track['signature']).mean()) > self.content_change
+
+    def _read_changed(self, image, gray, scale):
+        """OCR only the boxes that moved or changed, in one batched paddle call"""
+        pending = []
+        for track in self.tracks:
+            signature = self._signature(gray, scale, track['bbox'])
+            if self._needs_read(track, signature):
+                pending.append((track, signature))
+        if not pending:
+            return set()
+
+        results = ocr_service.read_text_batch([image.crop(tuple(track['bbox'])) for track, _ in pending])
+        for (track, signature), result in zip(pending, results):
+            track['reading'] = result
+            track['read_bbox'] = list(track['bbox'])
+            track['signature'] = signature
+        self.ocr_reads += len(pending)
+        return {track['id'] for track, _ in pending}
+
+    def _update_best(self):
+        """Keep the surest date of the whole session, True when this frame found a better one"""
+        changed = False
+        for track in self.tracks:
+            reading = track['reading']
+            if not reading or not reading['paddle_text'] or not reading['is_date']:
+                continue
+            date = _dates.parse(_dates.clean(reading['paddle_text']))
+            if date is None:
+                continue
+            priority = get_detection_priority({
+                'is_date': True,
+                'detection_confidence': track['score'],
+                'paddle_confidence': float(reading['paddle_confidence'])
+            })
+            if self.best is None or priority > self.best['priority']:
+                self.best = {
+                    'paddle_text': reading['paddle_text'],
+                    'parsed_date': date.strftime('%Y-%m-%d'),
+                    'detection_confidence': track['score'],
+                    'paddle_confidence': float(reading['paddle_confidence']),
+                    'priority': priority,
+                    'frame': self.frames
+                }
+                changed = True
+        return changed
+
+    def _track_view(self, track, reread):
+        reading = track['reading'] or {}
+        return {
+            'id': track['id'],
+            'bbox': track['bbox'],
+            'detection_confidence': track['score'],
+            'paddle_text': reading.get('paddle_text', ''),
+            'paddle_confidence': float(reading.get('paddle_confidence', 0.0)),
+            'is_date': reading.get('is_date', False),
+            'reread': reread
+        }
+
+    def stats(self):
+        return {'frames': self.frames, 'keyframes': self.keyframes, 'ocr_reads': self.ocr_reads}
+
+
+class StreamSessions:
+    """Live sessions of this process, idle ones expire after `ttl` seconds and the oldest
+    goes when there are more than `max_sessions`"""
+
+    def __init__(self, model, scheduler=None, ttl=None, max_sessions=None, **session_options):
+        self.model = model
+        self.scheduler = scheduler
+        self.ttl = ttl if ttl is not None else float(os.getenv('STREAM_SESSION_TTL_S', 60))
+        self.max_sessions = max_sessions or int(os.getenv('STREAM_MAX_SESSIONS', 32))
+        self.session_options = {
+            'keyframe_interval': int(os.getenv('STREAM_KEYFRAME_INTERVAL', 15)),
+            'scene_change': float(os.getenv('STREAM_SCENE_CHANGE', 30.0)),
+            'content_change': float(os.getenv('STREAM_CONTENT_CHANGE', 12.0)),
+            'move_threshold': float(os.getenv('STREAM_MOVE_THRESHOLD', 0.25))
+        }
+        self.session_options.update(session_options)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """The session with this id, a new one when it is unknown or expired"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                session = StreamSession(session_id, self.model, self.scheduler, **self.session_options)
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def end(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        return session.stats() if session else None
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_seen > self.ttl]:
+            del self._sessions[session_id]
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {'active': len(self._sessions)}
@@ -1,17 +1,67 @@
 import torch
 import torchvision.transforms as T
 from PIL import Image
-from torchvision.models.detection import fasterrcnn_resnet50_fpn
+from torchvision.models import resnet50
+from torchvision.models.detection import FasterRCNN, fasterrcnn_resnet50_fpn
+from torchvision.models.detection._utils import overwrite_eps
+from torchvision.models.detection.backbone_utils import _resnet_fpn_extractor
 from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
+from torchvision.ops import FrozenBatchNorm2d
 import cv2
 import numpy as np
+import copy
+import os
+import threading
+import time
 from ocr_service import OCRService
+from ocr_pool import OCRWorkerPool
+from checkpoint_store import load_weights, safetensors_path_for
+from metrics import OCR_CROPS, timed
+from image_ingest import CroppedImage, IngestedImage, RotatedImage
 
-ocr_service = OCRService()
+class LazyOCRService:
+    """The OCR engine, made on first use in each process. PaddleOCR does not survive a fork once loaded,
+    so a gunicorn master with preload must never build it, every worker makes its own after the fork.
+    OCR_POOL_SIZE > 0 moves paddle into that many worker processes, 0 keeps one engine in this process"""
 
-def get_model(num_classes=5):
-    # pre-trained 
-    model = fasterrcnn_resnet50_fpn(pretrained=True)
+    def __init__(self):
+        self._service = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._service is None or self._pid != os.getpid():
+                if int(os.getenv('OCR_POOL_SIZE', 0)) > 0:
+                    self._service = OCRWorkerPool()
+                else:
+                    self._service = OCRService(cpu_threads=int(os.getenv('OCR_CPU_THREADS', 10)))
+                self._pid = os.getpid()
+            return self._service
+
+    @property
+    def loaded(self):
+        return self._service is not None and self._pid == os.getpid()
+
+    def __getattr__(self, name):
+        # read_text, read_text_batch, ... of the real service
+        return getattr(self.get(), name)
+
+ocr_service = LazyOCRService()
+
+def get_model(num_classes=5, pretrained=False):
+    # COCO weights only matter for training, for inference the checkpoint overwrites all of them anyway
+    if pretrained:
+        model = fasterrcnn_resnet50_fpn(weights='DEFAULT')
+    else:
+        # the same network fasterrcnn_resnet50_fpn(weights='DEFAULT') builds, without the download. with
+        # weights=None torchvision switches to plain BatchNorm2d, which has num_batches_tracked buffers the
+        # checkpoint (trained from the COCO model) doesn't have
+        backbone = resnet50(weights=None, norm_layer=FrozenBatchNorm2d)
+        backbone = _resnet_fpn_extractor(backbone, 3)
+        model = FasterRCNN(backbone, num_classes=91)
+        # the COCO model runs its frozen batch norms with eps 0, it is not part of the state dict
+        overwrite_eps(model, 0.0)
     
     # Change the model to work with our number of classes
     in_features = model.roi_heads.box_predictor.cls_score.in_features
@@ -19,8 +69,91 @@ def get_model(num_classes=5):
     
     return model
 
-def process_image(image_path, model, size=640, min_detection_confidence=0.3):
-    image = Image.open(image_path)
+CHECKPOINT_PATH = 'checkpoints/final_model.pth'
+
+# optimized builds written by export_model.py, picked with MODEL_BACKEND
+EXPORT_PATHS = {
+    'torchscript': 'checkpoints/final_model.torchscript.pt',
+    'quantized': 'checkpoints/final_model.int8.torchscript.pt',
+    'onnx': 'checkpoints/final_model.onnx'
+}
+
+def load_eager_model(checkpoint_path=CHECKPOINT_PATH, verify=None):
+    weights_path = safetensors_path_for(checkpoint_path)
+    if os.path.exists(weights_path):
+        if verify is None:
+            verify = os.getenv('CHECKPOINT_VERIFY', '1') == '1'
+        # built on the meta device there is no random init to pay for, the mmap'd weights get assigned right in
+        with torch.device('meta'):
+            model = get_model()
+        load_weights(model, weights_path, verify=verify)
+    else:
+        # old style checkpoint, run download_checkpoint.py to get the fast format
+        model = get_model()
+        checkpoint = torch.load(checkpoint_path, map_location='cpu')
+        model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()  # evaluation mode
+    return model
+
+class ScriptedDetector:
+    """TorchScript detection models return (losses, detections), this gives back the eager interface"""
+
+    def __init__(self, path):
+        self.module = torch.jit.load(path, map_location='cpu')
+        self.module.eval()
+
+    def __call__(self, images):
+        output = self.module(list(images))
+        if isinstance(output, tuple):
+            output = output[1]
+        return output
+
+class OnnxDetector:
+    """Runs the exported ONNX graph with onnxruntime, one image per run"""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, images):
+        predictions = []
+        for image in images:
+            boxes, labels, scores = self.session.run(None, {self.input_name: image.numpy()})
+            predictions.append({
+                'boxes': torch.from_numpy(boxes),
+                'labels': torch.from_numpy(labels),
+                'scores': torch.from_numpy(scores)
+            })
+        return predictions
+
+def load_model(backend='eager', checkpoint_path=CHECKPOINT_PATH, fallback=True):
+    """Load the detector for the given backend, falls back to the eager model if the export is missing or broken"""
+    if backend and backend != 'eager':
+        try:
+            if backend not in EXPORT_PATHS:
+                raise ValueError(f"unknown backend {backend}")
+            if backend == 'onnx':
+                return OnnxDetector(EXPORT_PATHS[backend])
+            return ScriptedDetector(EXPORT_PATHS[backend])
+        except Exception as e:
+            if not fallback:
+                raise
+            print(f"could not load {backend} model, using eager instead: {str(e)}")
+
+    return load_eager_model(checkpoint_path)
+
+# Prepare image for processing on the the model
+transform = T.Compose([
+    T.ToTensor(),
+    T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+def prepare_image(image, size=640):
+    """Resize the image for the model, returns the input tensor and the scale back to original pixels"""
     original_width, original_height = image.size
     
     # chjanging inmage size for faster processing
@@ -33,26 +166,225 @@ def process_image(image_path, model, size=640, min_detection_confidence=0.3):
         new_width = int(original_width * (size / original_height))
         scale = original_height / size
     
-    image_resized = image.resize((new_width, new_height))
-    
-    # Prepare image for processing on the the model
-    transform = T.Compose([
-        T.ToTensor(),
-        T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-    
+    # an ingested upload hands over a draft decoded copy that is already close to the target size
+    if isinstance(image, (IngestedImage, RotatedImage, CroppedImage)):
+        image = image.detector_image(size)
+
+    with timed('resize'):
+        image_resized = image.resize((new_width, new_height))
+        return transform(image_resized), scale
+
+def run_model(model, image_tensors):
+    """Single forward over a list of image tensors (they can have different sizes)"""
     # Running the model without calculating gradients (faster)
     with torch.no_grad():
-        image_tensor = transform(image_resized).unsqueeze(0)
-        predictions = model(image_tensor)
+        return model(list(image_tensors))
+
+class Rung:
+    """One step of the resolution ladder: inference size, rotation and a model that really runs at that size"""
+
+    def __init__(self, size, angle, model, scheduler=None):
+        self.size = size
+        self.angle = angle
+        self.model = model
+        self.scheduler = scheduler
+
+    @property
+    def label(self):
+        return f"{self.size}r{self.angle}" if self.angle else str(self.size)
+
+def parse_ladder(spec):
+    """'320,640,960,640r90' -> [(320, 0), (640, 0), (960, 0), (640, 90)]"""
+    rungs = []
+    for item in spec.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        size, _, angle = item.partition('r')
+        rungs.append((int(size), int(angle or 0)))
+    return rungs
+
+def sized_model(model, size):
+    """The eager model resizes every input to 800px on the short side by itself, so a 320px input would
+    cost as much as a big one. This returns a copy (sharing all weights) whose transform keeps inputs
+    at `size`. Exported backends have the resize baked in and are returned unchanged"""
+    if not resizable(model):
+        return model
+    transform = model.transform
+    resized = copy.copy(model)
+    resized._modules = dict(model._modules)  # own module dict so the transform swap below doesn't touch the original
+    resized.transform = copy.copy(transform)
+    resized.transform.min_size = (size,)
+    resized.transform.max_size = size
+    return resized
+
+def resizable(model):
+    """True for the eager model, whose transform sizes can be read and changed. The torchscript, quantized
+    and onnx exports run the same GeneralizedRCNNTransform, but baked into the graph"""
+    transform = getattr(model, 'transform', None)
+    return transform is not None and isinstance(model, torch.nn.Module) and not isinstance(model, torch.jit.ScriptModule)
+
+def input_scale(model, width, height):
+    """How much the eager model's own transform rescales a width x height input before the backbone"""
+    transform = model.transform
+    # same rule as GeneralizedRCNNTransform in eval: short side to min_size unless the long side passes max_size
+    return min(float(transform.min_size[-1]) / min(width, height), float(transform.max_size) / max(width, height))
+
+def build_ladder(model, spec):
+    return [Rung(size, angle, sized_model(model, size)) for size, angle in parse_ladder(spec)]
+
+def ingest(image):
+    # uploads come in as an IngestedImage, a PIL image is used as it is and a path gets ingested here
+    if isinstance(image, Image.Image):
+        with timed('decode'):
+            image.load()
+        return image
+    if not isinstance(image, IngestedImage):
+        return IngestedImage.from_path(image)
+    return image
+
+def process_image(image, model, size=640, min_detection_confidence=0.3, ocr_det=False, scheduler=None,
+                  max_ocr_crops=None, ocr_time_budget=None, ladder=None, ladder_min_confidence=0.5, prefilter=None):
+    image = ingest(image)
+
+    # the classical text check is much cheaper than a forward: no text means no date to find
+    view = image
+    if prefilter is not None:
+        found = prefilter.analyze(image)
+        if not found.has_text:
+            return []
+        # the ladder's rotated rungs need the whole image, it only gets the early reject. so do the exported
+        # backends: their baked in resize blows any region up to 800px, it could not run at the full pass's scale
+        if found.roi is not None and not ladder and isinstance(image, IngestedImage) and resizable(model):
+            view = CroppedImage(image, found.roi)
+
+    if ladder:
+        return process_image_ladder(image, ladder, min_detection_confidence, ocr_det, max_ocr_crops,
+                                    ocr_time_budget, ladder_min_confidence)
+
+    if view is not image:
+        # the full pass feeds `size` but the eager model upscales that to 800px on the short side. The region
+        # gets the same pixels per original pixel the backbone really saw there, so the text looks the same
+        # to the detector and only the forward shrinks with the region
+        ratio = size / max(image.size)
+        full_size = size * input_scale(model, image.size[0] * ratio, image.size[1] * ratio)
+        roi_size = max(64, round(full_size * max(view.size) / max(image.size)))
+        image_tensor, scale = prepare_image(view, roi_size)
+        with timed('forward'):
+            prediction = run_model(sized_model(model, roi_size), [image_tensor])[0]
+    else:
+        image_tensor, scale = prepare_image(image, size)
+
+        # with a scheduler the forward gets batched together with other requests (the time includes the wait)
+        with timed('forward'):
+            if scheduler is not None:
+                prediction = scheduler.submit(image_tensor).result()
+            else:
+                prediction = run_model(model, [image_tensor])[0]
     
+    crops = collect_crops(view, prediction, scale, min_detection_confidence)
+
+    # best boxes first, OCR stops as soon as the rest can't make it into the top 3
+    crops, ocr_results = read_crops_lazily(crops, ocr_det, max_ocr_crops, ocr_time_budget)
+
+    detections = build_detections(crops, ocr_results)
+    if view is not image:
+        for detection in detections:
+            detection['bbox'] = view.box_to_original(detection['bbox'])
+    return detections
+
+def process_image_ladder(image, ladder, min_detection_confidence=0.3, ocr_det=False, max_ocr_crops=None,
+                         ocr_time_budget=None, ladder_min_confidence=0.5):
+    """Climb the ladder until a rung finds a date box with at least ladder_min_confidence.
+    Every detection gets the 'rung' that produced it, boxes are always in original pixels"""
+    best = []
+    for rung in ladder:
+        view = image
+        if rung.angle:
+            if not isinstance(image, IngestedImage):
+                # rotation needs the ingested image, plain PIL callers just skip those rungs
+                continue
+            view = RotatedImage(image, rung.angle)
+
+        image_tensor, scale = prepare_image(view, rung.size)
+        with timed('forward'):
+            if rung.scheduler is not None:
+                prediction = rung.scheduler.submit(image_tensor).result()
+            else:
+                prediction = run_model(rung.model, [image_tensor])[0]
+
+        crops = collect_crops(view, prediction, scale, min_detection_confidence)
+        crops, ocr_results = read_crops_lazily(crops, ocr_det, max_ocr_crops, ocr_time_budget)
+        detections = build_detections(crops, ocr_results)
+
+        for detection in detections:
+            if rung.angle:
+                detection['bbox'] = view.box_to_original(detection['bbox'])
+            detection['rung'] = rung.label
+
+        if any(d['is_date'] and d['detection_confidence'] >= ladder_min_confidence for d in detections):
+            return detections
+
+        # nothing good enough, keep whichever rung came closest in case the whole ladder fails
+        if detections and (not best or get_detection_priority(detections[0]) > get_detection_priority(best[0])):
+            best = detections
+
+    return best
+
+def read_crops_lazily(crops, ocr_det=False, max_ocr_crops=None, ocr_time_budget=None, keep=3):
+    """OCR crops in descending score order and stop once no unread crop can reach the top `keep`.
+    A crop's priority is at most 1000 + score * 100 (a date read with 100% confidence), so when the
+    keep-th best priority so far is at least that for the next crop, the rest would be wasted OCR.
+    max_ocr_crops / ocr_time_budget (seconds) cap the work per request on top of that"""
+    crops = sorted(crops, key=lambda crop: crop['score'], reverse=True)
+    started = time.monotonic()
+    read, results = [], []
+
+    while len(read) < len(crops):
+        if max_ocr_crops is not None and len(read) >= max_ocr_crops:
+            break
+        if ocr_time_budget is not None and read and time.monotonic() - started >= ocr_time_budget:
+            break
+
+        # ask for as many crops as we are still missing dates, in one batched paddle call
+        confirmed = sum(1 for result in results if result['paddle_text'] and result['is_date'])
+        chunk_size = max(1, keep - confirmed)
+        if max_ocr_crops is not None:
+            chunk_size = min(chunk_size, max_ocr_crops - len(read))
+        chunk = crops[len(read):len(read) + chunk_size]
+
+        results.extend(ocr_service.read_text_batch([crop['region'] for crop in chunk], det=ocr_det))
+        read.extend(chunk)
+
+        if len(read) < len(crops):
+            priorities = sorted((get_detection_priority(_priority_fields(crop, result))
+                                 for crop, result in zip(read, results) if result['paddle_text']), reverse=True)
+            best_possible = 1000 + crops[len(read)]['score'] * 100
+            if len(priorities) >= keep and priorities[keep - 1] >= best_possible:
+                break
+
+    OCR_CROPS.inc(len(read), outcome='read')
+    OCR_CROPS.inc(len(crops) - len(read), outcome='skipped')
+    return read, results
+
+def _priority_fields(crop, result):
+    return {
+        'is_date': result['is_date'],
+        'detection_confidence': crop['score'],
+        'paddle_confidence': float(result['paddle_confidence'])
+    }
+
+def collect_crops(image, prediction, scale, min_detection_confidence=0.3):
+    """Cut the padded date regions out of the original image for every confident box
+    (for an IngestedImage the first crop triggers the full resolution decode)"""
+    original_width, original_height = image.size
+
     # Get predct.. results
-    boxes = predictions[0]['boxes'].cpu().numpy()
-    scores = predictions[0]['scores'].cpu().numpy()
-    labels = predictions[0]['labels'].cpu().numpy()
+    boxes = prediction['boxes'].cpu().numpy()
+    scores = prediction['scores'].cpu().numpy()
+    labels = prediction['labels'].cpu().numpy()
     
-    # Storing all detected dates
-    all_detections = []
+    crops = []
     
     # checking all detected objects
     for box, score, label in zip(boxes, scores, labels):
@@ -70,44 +402,49 @@ def process_image(image_path, model, size=640, min_detection_confidence=0.3):
             y2 = min(original_height, y2 + padding_y)
             
             # chopping the region with the date on iut
-            region = image.crop((x1, y1, x2, y2))
+            crops.append({
+                'region': image.crop((x1, y1, x2, y2)),
+                'bbox': [x1, y1, x2, y2],
+                'score': float(score)
+            })
 
-            results = ocr_service.read_text(region)
-            
-            # If we found text, save the detection
-            if results['paddle_text']:
-                detection = {
-                    'paddle_text': results['paddle_text'],
-                    'detection_confidence': float(score),
-                    'paddle_confidence': float(results['paddle_confidence']),
-                    'dimensions': results['dimensions'],
-                    'bbox': [x1, y1, x2, y2],
-                    'is_date': results['is_date']
-                }
-                all_detections.append(detection)
-
-    # Sort detections by importance
-    def get_detection_priority(detection):
-        # Dates  are rewarding also imoprtant (1000 bonus)
-        is_date_score = 1000 if detection['is_date'] else 0
-        confidence_score = detection['detection_confidence'] * detection['paddle_confidence']
-        return is_date_score + confidence_score
+    return crops
+
+def build_detections(crops, ocr_results):
+    """Pair crops with their OCR results and keep the 3 most important detections"""
+    # Storing all detected dates
+    all_detections = []
+
+    for crop, results in zip(crops, ocr_results):
+        # If we found text, save the detection
+        if results['paddle_text']:
+            detection = {
+                'paddle_text': results['paddle_text'],
+                'detection_confidence': crop['score'],
+                'paddle_confidence': float(results['paddle_confidence']),
+                'dimensions': results['dimensions'],
+                'bbox': crop['bbox'],
+                'is_date': results['is_date']
+            }
+            all_detections.append(detection)
 
     # Sortingf by priority and keep top 3
     sorted_detections = sorted(all_detections, key=get_detection_priority, reverse=True)[:3]
     
     return sorted_detections
 
+# Sort detections by importance
+def get_detection_priority(detection):
+    # Dates  are rewarding also imoprtant (1000 bonus)
+    is_date_score = 1000 if detection['is_date'] else 0
+    confidence_score = detection['detection_confidence'] * detection['paddle_confidence']
+    return is_date_score + confidence_score
+
 def main():
     try:
         # Load the model
         print("Loading model...")
-        model = get_model()
-        
-        # Load saved weights
-        checkpoint = torch.load('checkpoints/final_model.pth', map_location='cpu')
-        model.load_state_dict(checkpoint['model_state_dict']) 
-        model.eval()  # evaluation mode
+        model = load_model(os.getenv('MODEL_BACKEND', 'eager'))
         
         print("Model loaded successfully")
 
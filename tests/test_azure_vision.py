@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+pytest.importorskip('azure.cognitiveservices.vision.computervision')
+pytest.importorskip('azure.ai.translation.text')
+from PIL import Image
+
+from azure_vision import AzureVisionService, _translation_chunks
+from benchmarks.bench_resilience import FakeAzure, start_fake
+from memo_store import MemoStore
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    FakeAzure.mode = 'ok'
+    FakeAzure.delays = []
+    FakeAzure.requests = []
+    endpoint = start_fake()
+    monkeypatch.setenv('AZURE_VISION_ENDPOINT', endpoint)
+    monkeypatch.setenv('AZURE_TRANSLATOR_ENDPOINT', endpoint)
+    monkeypatch.setenv('AZURE_VISION_KEY', 'fake')
+    monkeypatch.setenv('AZURE_TRANSLATOR_KEY', 'fake')
+    monkeypatch.delenv('AZURE_HEDGE_MS', raising=False)
+    return AzureVisionService(max_workers=4, memo=MemoStore(path=str(tmp_path / 'memo.sqlite3')))
+
+
+def posts(prefix):
+    return [request for request in FakeAzure.requests if request[0].startswith(prefix)]
+
+
+def image(shade):
+    return Image.new('RGB', (120, 40), (shade, shade, shade))
+
+
+def test_ocr_reuses_one_connection(service):
+    for shade in (200, 210, 220):
+        assert service._recognize(image(shade)) == '유통기한 2025.12.31'
+    ocr = posts('/vision')
+    assert len(ocr) == 3
+    assert len({client for _, _, client in ocr}) == 1
+
+
+def test_translation_reuses_one_connection(service):
+    for text in ('하나', '둘', '셋'):
+        assert service.translate_texts([text]) == [f"(en) {text}"]
+    translate = posts('/translate')
+    assert len(translate) == 3
+    assert len({client for _, _, client in translate}) == 1
+
+
+def test_translation_chunks_limits():
+    assert list(_translation_chunks(['a'] * 5, max_items=2)) == [['a', 'a'], ['a', 'a'], ['a']]
+    # a chunk closes before the text that would push it over the character limit
+    assert list(_translation_chunks(['aaa', 'bb', 'c', 'dddd'], max_chars=5)) == [['aaa', 'bb'], ['c', 'dddd']]
+    # a single text longer than the limit still goes, on its own
+    assert list(_translation_chunks(['aaaaaaa', 'b'], max_chars=5)) == [['aaaaaaa'], ['b']]
+    assert list(_translation_chunks([])) == []
+
+
+def test_translate_texts_splits_at_item_limit(service):
+    texts = [f"텍스트 {i}" for i in range(1001)]
+    translated = service.translate_texts(texts)
+    assert translated == [f"(en) {text}" for text in texts]
+    assert [len(json.loads(body)) for _, body, _ in posts('/translate')] == [1000, 1]
+
+
+def test_translate_texts_splits_at_char_limit(service):
+    texts = ['가' * 30000, '나' * 30000]
+    assert service.translate_texts(texts) == [f"(en) {text}" for text in texts]
+    assert [len(json.loads(body)) for _, body, _ in posts('/translate')] == [1, 1]
+
+
+def test_memo_hits_skip_azure(service):
+    assert service.translate_texts(['사과', '우유']) == ['(en) 사과', '(en) 우유']
+    # only the new text goes out, the others come from the memo in their place
+    assert service.translate_texts(['우유', '빵', '사과']) == ['(en) 우유', '(en) 빵', '(en) 사과']
+    assert [json.loads(body) for _, body, _ in posts('/translate')] == [[{'text': '사과'}, {'text': '우유'}],
+                                                                          [{'text': '빵'}]]
+    assert service.memo.stats()['translation']['hits'] == 2
+
+    service._recognize(image(200))
+    service._recognize(image(200))
+    assert len(posts('/vision')) == 1
+    assert service.memo.stats()['ocr_text'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
@@ -0,0 +1,17 @@
+import json
+
+from batch_scan import load_done
+
+
+def test_load_done_drops_lines_without_path(tmp_path):
+    output = tmp_path / 'results.jsonl'
+    lines = [json.dumps({'path': 'a.jpg', 'dates': []}),
+             json.dumps({'error': 'no path'}),
+             json.dumps(['not', 'a', 'record']),
+             json.dumps({'path': 'b.jpg', 'dates': []}),
+             '{"path": "c.jp']
+    output.write_text('\n'.join(lines), encoding='utf-8')
+
+    assert load_done(str(output)) == {'a.jpg', 'b.jpg'}
+    # the dropped lines are gone from the file, so the resumed run appends after clean records
+    assert output.read_text(encoding='utf-8') == lines[0] + '\n' + lines[3] + '\n'
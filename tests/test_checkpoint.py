@@ -0,0 +1,67 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+torchvision = pytest.importorskip('torchvision')
+pytest.importorskip('safetensors')
+from torchvision.models import ResNet50_Weights, resnet50
+from torchvision.models.detection import fasterrcnn_resnet50_fpn
+from torchvision.models.detection._utils import overwrite_eps
+from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
+
+from checkpoint_store import convert_checkpoint, load_weights
+from test_model import get_model, load_eager_model
+
+
+@pytest.fixture
+def trained_state(monkeypatch, tmp_path):
+    """State dict shaped like the shipped checkpoint: torchvision's pretrained model (frozen batch norms,
+    no num_batches_tracked) with our 5 class head. The backbone download is replaced by random weights"""
+    monkeypatch.setattr(torchvision.models._api, 'load_state_dict_from_url',
+                        lambda *args, **kwargs: resnet50().state_dict())
+    torch.manual_seed(0)
+    model = fasterrcnn_resnet50_fpn(weights=None, weights_backbone=ResNet50_Weights.DEFAULT)
+    model.roi_heads.box_predictor = FastRCNNPredictor(model.roi_heads.box_predictor.cls_score.in_features, 5)
+    overwrite_eps(model, 0.0)
+    model.eval()
+
+    checkpoint_path = tmp_path / 'final_model.pth'
+    torch.save({'model_state_dict': model.state_dict()}, checkpoint_path)
+    return model, str(checkpoint_path)
+
+
+def assert_same_weights(model, reference):
+    expected = reference.state_dict()
+    loaded = model.state_dict()
+    assert loaded.keys() == expected.keys()
+    assert not [name for name in loaded if 'num_batches_tracked' in name]
+    for name, tensor in expected.items():
+        assert torch.equal(loaded[name], tensor), name
+
+
+def test_checkpoint_has_frozen_batch_norm_layout(trained_state):
+    reference, _ = trained_state
+    assert reference.state_dict().keys() == get_model().state_dict().keys()
+
+
+def test_safetensors_round_trip(trained_state):
+    reference, checkpoint_path = trained_state
+    weights_path, _ = convert_checkpoint(checkpoint_path)
+
+    with torch.device('meta'):
+        model = get_model()
+    load_weights(model, weights_path, verify=True)
+    assert_same_weights(model, reference)
+
+    # the whole load path, and the same detections as the model the checkpoint came from
+    model = load_eager_model(checkpoint_path)
+    image = torch.rand(3, 96, 128)
+    with torch.no_grad():
+        ours, theirs = model([image])[0], reference([image])[0]
+    for key in ('boxes', 'scores', 'labels'):
+        assert torch.allclose(ours[key], theirs[key])
+
+
+def test_pth_fallback_loads(trained_state):
+    reference, checkpoint_path = trained_state
+    # no safetensors next to it, the old torch.load path
+    assert_same_weights(load_eager_model(checkpoint_path), reference)
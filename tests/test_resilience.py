@@ -0,0 +1,150 @@
+import itertools
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import resilience
+from benchmarks.bench_resilience import FakeAzure, start_fake
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, hedged_call
+
+
+@pytest.fixture
+def fake():
+    FakeAzure.mode = 'ok'
+    FakeAzure.hang_seconds = 2.0
+    FakeAzure.delays = []
+    FakeAzure.requests = []
+    yield start_fake()
+    FakeAzure.mode = 'ok'
+    FakeAzure.delays = []
+
+
+def post(endpoint, timeout=5.0):
+    request = urllib.request.Request(endpoint + '/vision/v3.2/ocr', data=b'{}', method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
+
+
+def head(endpoint):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(endpoint, method='HEAD'), timeout=2.0) as response:
+            return response.status < 500
+    except urllib.error.HTTPError:
+        return False
+
+
+def test_deadline_expires():
+    deadline = Deadline(0.1)
+    assert not deadline.expired()
+    assert deadline.timeout(cap=0.05) == 0.05
+    time.sleep(0.15)
+    assert deadline.expired()
+    assert deadline.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout()
+
+
+def test_breaker_opens_after_threshold(fake):
+    breaker = CircuitBreaker('fake', failure_threshold=3, reset_timeout=60)
+    FakeAzure.mode = 'error'
+    for _ in range(3):
+        with pytest.raises(urllib.error.HTTPError):
+            breaker.call(post, fake)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # open: the service is not called at all
+    calls = len(FakeAzure.requests)
+    with pytest.raises(CircuitOpenError):
+        breaker.call(post, fake)
+    assert len(FakeAzure.requests) == calls
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_breaker_half_open_trial(fake):
+    breaker = CircuitBreaker('fake', failure_threshold=1, reset_timeout=0.2)
+    FakeAzure.mode = 'error'
+    with pytest.raises(urllib.error.HTTPError):
+        breaker.call(post, fake)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # after reset_timeout one trial goes through, a failed trial opens the breaker again
+    time.sleep(0.25)
+    with pytest.raises(urllib.error.HTTPError):
+        breaker.call(post, fake)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # a slow trial keeps everything else out until it answers, then the breaker closes
+    time.sleep(0.25)
+    FakeAzure.mode = 'ok'
+    FakeAzure.delays = [0.3]
+    trial = threading.Thread(target=breaker.call, args=(post, fake))
+    trial.start()
+    time.sleep(0.1)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(post, fake)
+    trial.join()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.call(post, fake) == 200
+
+
+def test_breaker_probe_closes(fake):
+    breaker = CircuitBreaker('fake', failure_threshold=1, probe=lambda: head(fake), probe_interval=0.1)
+    FakeAzure.mode = 'error'
+    with pytest.raises(urllib.error.HTTPError):
+        breaker.call(post, fake)
+    time.sleep(0.35)
+    # the probe sees the outage too, the breaker stays open
+    assert breaker.is_open()
+
+    # no request has to fail for recovery, the probe closes it in the background
+    FakeAzure.mode = 'ok'
+    until = time.monotonic() + 2.0
+    while breaker.is_open() and time.monotonic() < until:
+        time.sleep(0.05)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.call(post, fake) == 200
+
+
+def test_hedged_call_second_call_wins(fake):
+    FakeAzure.delays = [1.0]  # only the first call is slow
+    counter = itertools.count()
+
+    def call():
+        number = next(counter)
+        post(fake)
+        return number
+
+    start = time.monotonic()
+    assert hedged_call(call, hedge_after=0.1) == 1
+    assert time.monotonic() - start < 0.8
+
+
+def test_hedged_call_fast_answer_sends_no_hedge(fake):
+    assert hedged_call(post, fake, hedge_after=0.5) == 200
+    assert len(FakeAzure.requests) == 1
+
+
+def test_hedged_call_cancels_queued_loser(fake, monkeypatch):
+    # one thread: the hedge waits in the queue behind the first call and gets cancelled once it answers
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resilience, '_executor', executor)
+    monkeypatch.setattr(resilience, '_executor_pid', os.getpid())
+    FakeAzure.delays = [0.3]
+
+    assert hedged_call(post, fake, hedge_after=0.1) == 200
+    executor.shutdown(wait=True)
+    assert len(FakeAzure.requests) == 1
+
+
+def test_hedged_call_respects_deadline(fake):
+    FakeAzure.mode = 'hang'
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedged_call(post, fake, hedge_after=0.1, deadline=Deadline(0.4))
+    assert time.monotonic() - start < 1.0
@@ -0,0 +1,46 @@
+import io
+import os
+import time
+
+import pytest
+
+pytest.importorskip('PIL')
+from PIL import Image
+
+from upload_store import UploadStore
+
+
+def jpeg(shade):
+    out = io.BytesIO()
+    Image.new('RGB', (64, 48), (shade, shade, shade)).save(out, format='JPEG')
+    return out.getvalue()
+
+
+def test_storing_again_refreshes_age(tmp_path):
+    store = UploadStore(root=str(tmp_path), max_age_days=30)
+    data = jpeg(100)
+    stored = store.store(data)
+    assert store.flush(timeout=5)
+
+    path = store.path_for(stored['filename'])
+    old = time.time() - 20 * 24 * 3600
+    os.utime(path, (old, old))
+
+    # a result cache hit stores the upload again, the retention policy must see it as recent
+    assert store.store(data) == stored
+    assert store.flush(timeout=5)
+    assert time.time() - os.path.getmtime(path) < 60
+
+
+def test_storing_again_restores_evicted_upload(tmp_path):
+    store = UploadStore(root=str(tmp_path))
+    data = jpeg(150)
+    stored = store.store(data)
+    assert store.flush(timeout=5)
+
+    path = store.path_for(stored['filename'])
+    os.remove(path)
+    store.store(data)
+    assert store.flush(timeout=5)
+    with open(path, 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,83 @@
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_ingest import IngestedImage
+from metrics import PREFILTER, timed
+
+# has_text: False means the detector can be skipped, roi: [x1, y1, x2, y2] in original pixels or None
+# for the whole image, regions: the text-like boxes that were found (original pixels)
+PrefilterResult = namedtuple('PrefilterResult', ['has_text', 'roi', 'regions', 'text_ratio'])
+
+
+def text_regions(gray, min_height=6, max_height_ratio=0.3, min_fill=0.35):
+    """Boxes of printed-text-like blobs: morphological gradient (strokes have strong edges on both sides),
+    Otsu threshold, then a wide closing that melts the characters of a line into one blob"""
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    lines = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    height = gray.shape[0]
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # text lines are wider than tall, not huge, and their box is mostly filled with edges
+        if h < min_height or h > height * max_height_ratio or w < h * 1.5:
+            continue
+        if cv2.countNonZero(binary[y:y + h, x:x + w]) / float(w * h) < min_fill:
+            continue
+        regions.append((x, y, x + w, y + h))
+    return regions
+
+
+class TextPrefilter:
+    """Cheap OpenCV pass in front of the detector. Images without anything that looks like printed
+    text are rejected, otherwise the detector only gets the part of the image that has text in it"""
+
+    def __init__(self, work_size=640, min_regions=None, margin=0.1, max_roi_ratio=None):
+        # same size as the detector input by default, so both share the draft decode
+        self.work_size = work_size
+        self.min_regions = min_regions or int(os.getenv('PREFILTER_MIN_REGIONS', 1))
+        self.margin = margin
+        # an roi covering most of the image saves nothing, the whole image goes through then
+        self.max_roi_ratio = max_roi_ratio or float(os.getenv('PREFILTER_MAX_ROI', 0.6))
+
+    def _gray(self, image):
+        if isinstance(image, IngestedImage):
+            small = image.detector_image(self.work_size)
+        else:
+            small = image
+        ratio = self.work_size / max(small.size)
+        if ratio < 1:
+            small = small.resize((max(1, int(small.size[0] * ratio)), max(1, int(small.size[1] * ratio))), Image.BILINEAR)
+        return np.array(small.convert('L'))
+
+    def analyze(self, image):
+        with timed('prefilter'):
+            gray = self._gray(image)
+            scale = max(image.size) / max(gray.shape)
+            found = text_regions(gray)
+
+        width, height = image.size
+        regions = [[int(x1 * scale), int(y1 * scale), int(x2 * scale), int(y2 * scale)] for x1, y1, x2, y2 in found]
+        text_ratio = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions) / float(width * height)
+        if len(regions) < self.min_regions:
+            PREFILTER.inc(outcome='rejected')
+            return PrefilterResult(False, None, regions, text_ratio)
+
+        # union of all text, with some context around it (the detector was trained on whole packages)
+        x1, y1 = min(r[0] for r in regions), min(r[1] for r in regions)
+        x2, y2 = max(r[2] for r in regions), max(r[3] for r in regions)
+        pad_x = int(max((x2 - x1) * self.margin, width * 0.05))
+        pad_y = int(max((y2 - y1) * self.margin, height * 0.05))
+        roi = [max(0, x1 - pad_x), max(0, y1 - pad_y), min(width, x2 + pad_x), min(height, y2 + pad_y)]
+
+        if (roi[2] - roi[0]) * (roi[3] - roi[1]) > self.max_roi_ratio * width * height:
+            PREFILTER.inc(outcome='full')
+            return PrefilterResult(True, None, regions, text_ratio)
+        PREFILTER.inc(outcome='cropped')
+        return PrefilterResult(True, roi, regions, text_ratio)
@@ -0,0 +1,206 @@
+import hashlib
+import io
+import os
+import queue
+import re
+import threading
+import time
+
+from PIL import Image
+
+from metrics import timed
+
+# only files this store wrote are managed, anything else in the folder is left alone
+STORED_NAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+
+class UploadStore:
+    """Content-addressed upload folder. Writes happen on a background thread, every upload gets a
+    small thumbnail, and the oldest files are evicted once the folder is over its size cap or age limit"""
+
+    def __init__(self, root='static/uploads', url_prefix='/static/uploads', max_bytes=512 * 1024 * 1024,
+                 max_age_days=30, thumbnail_size=640, queue_size=64):
+        self.root = root
+        self.thumb_root = os.path.join(root, 'thumbs')
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600 if max_age_days else None
+        self.thumbnail_size = thumbnail_size
+        self.queue_size = queue_size
+
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._last_sweep = 0.0
+
+        self.writes = 0
+        self.duplicates = 0
+        self.evictions = 0
+        self.total_bytes = None  # counted by the writer on first use
+
+        os.makedirs(self.thumb_root, exist_ok=True)
+
+    def _ensure_worker(self):
+        # same as the inference scheduler, a forked gunicorn worker starts its own writer thread
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._pending = set()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name='upload-store', daemon=True)
+                self._worker.start()
+
+    def store(self, data, ext='.jpg'):
+        """Queue the upload for writing and return its urls right away"""
+        digest = hashlib.sha256(data).hexdigest()
+        filename = f"{digest}{ext.lower()}"
+        result = {
+            'filename': filename,
+            'image_path': f"{self.url_prefix}/{filename}",
+            'thumbnail_path': f"{self.url_prefix}/thumbs/{digest}.jpg"
+        }
+
+        self._ensure_worker()
+        with self._lock:
+            if filename in self._pending:
+                self.duplicates += 1
+                return result
+            self._pending.add(filename)
+
+        try:
+            self._queue.put_nowait((filename, data))
+        except queue.Full:
+            # writer is behind, this request pays for its own write instead of growing the backlog
+            self._write(filename, data)
+        return result
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is on disk"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'writes': self.writes,
+                'duplicates': self.duplicates,
+                'evictions': self.evictions,
+                'pending': len(self._pending),
+                'total_bytes': self.total_bytes or 0
+            }
+
+    def path_for(self, filename):
+        return os.path.join(self.root, filename)
+
+    def _thumb_path(self, filename):
+        return os.path.join(self.thumb_root, os.path.splitext(filename)[0] + '.jpg')
+
+    def _run(self):
+        with self._lock:
+            self.total_bytes = sum(size for _, size, _ in self._entries())
+        while True:
+            filename, data = self._queue.get()
+            self._write(filename, data)
+
+    def _write(self, filename, data):
+        path = self.path_for(filename)
+        added = 0
+        try:
+            if os.path.exists(path):
+                # same picture again, only refresh its age for the retention policy
+                os.utime(path)
+                thumb_path = self._thumb_path(filename)
+                if os.path.exists(thumb_path):
+                    os.utime(thumb_path)
+                with self._lock:
+                    self.duplicates += 1
+            else:
+                with timed('upload_save'):
+                    added += _atomic_write(path, data)
+                    added += _atomic_write(self._thumb_path(filename), self._thumbnail(data))
+                with self._lock:
+                    self.writes += 1
+        except Exception as e:
+            print(f"Upload store Error: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(filename)
+                if self.total_bytes is not None:
+                    self.total_bytes += added
+
+        if added:
+            self._enforce_retention()
+
+    def _thumbnail(self, data):
+        image = Image.open(io.BytesIO(data))
+        size = (self.thumbnail_size, self.thumbnail_size)
+        # draft lets libjpeg decode at 1/8 scale, a thumbnail never needs the full image
+        image.draft('RGB', size)
+        image = image.convert('RGB')
+        image.thumbnail(size)
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=80)
+        return out.getvalue()
+
+    def _entries(self):
+        entries = []
+        for folder in (self.root, self.thumb_root):
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                if not STORED_NAME.match(name):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _enforce_retention(self):
+        with self._lock:
+            over_size = self.total_bytes is not None and self.total_bytes > self.max_bytes
+        now = time.time()
+        # the age check needs a directory scan, once a minute is plenty
+        if not over_size and now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, mtime in entries:
+            too_old = self.max_age and now - mtime > self.max_age
+            if not too_old and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+        with self._lock:
+            self.total_bytes = total
+
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
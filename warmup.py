@@ -0,0 +1,228 @@
+"""Warm the model and paddle up before serving, and find the thread counts that suit this host
+
+    python warmup.py                          # one warmup, prints how long each step took
+    python warmup.py --autotune --workers 2   # try thread configs, save the best to thread_config.json
+
+gunicorn.conf.py reads thread_config.json when it exists.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+THREAD_CONFIG_PATH = os.getenv('THREAD_CONFIG', 'thread_config.json')
+
+
+def load_thread_config(path=THREAD_CONFIG_PATH):
+    # plain json on purpose, gunicorn.conf.py reads it before torch may be imported
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"could not read {path}: {str(e)}")
+        return None
+
+
+def tuned_thread_config(workers, path=THREAD_CONFIG_PATH):
+    """The autotuned thread counts, but only when they were measured for this many workers"""
+    config = load_thread_config(path) or {}
+    if config and config.get('workers') != workers:
+        print(f"{path} was tuned for {config.get('workers')} workers, not {workers}, ignoring it")
+        return {}
+    return config
+
+
+def apply_thread_config(intra_op_threads, interop_threads=None):
+    import torch
+    torch.set_num_threads(intra_op_threads)
+    if interop_threads:
+        try:
+            # only allowed once per process and before any inter-op work ran
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"interop threads stay at {torch.get_num_interop_threads()}: {str(e)}")
+
+
+def synthetic_image(width=1280, height=960):
+    """Packaging-like picture: light background, a dark printed date and some noise, so the detector
+    and paddle go through the same kernels a real upload would"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    image = Image.effect_noise((width, height), 24).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', (width, height), (225, 220, 210)), 0.8)
+    draw = ImageDraw.Draw(image)
+    for i, text in enumerate(['EXP 2026.12.31', 'LOT 24A7', '20261231']):
+        draw.text((width // 5, height // 3 + i * height // 8), text, fill=(20, 20, 20))
+    return image.filter(ImageFilter.SMOOTH)
+
+
+def warmup(model, ocr, sizes=(640,), rounds=2, models=None):
+    """Synthetic forwards at every size (one model per size when `models` is given, like the ladder rungs)
+    plus batched and full paddle reads. Returns the seconds of the last round per step"""
+    from test_model import prepare_image, run_model
+
+    image = synthetic_image()
+    crop = image.crop((image.size[0] // 5 - 10, image.size[1] // 3 - 10, image.size[0] // 2, image.size[1] // 3 + 30))
+    timings = {}
+    for _ in range(rounds):
+        for size in sizes:
+            tensor, _ = prepare_image(image, size)
+            start = time.perf_counter()
+            run_model((models or {}).get(size, model), [tensor])
+            timings[f'forward_{size}'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ocr.read_text_batch([crop, crop, crop])
+        timings['ocr_batch'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ocr.read_text_batch([crop], det=True)
+        timings['ocr_full'] = time.perf_counter() - start
+    return timings
+
+
+def warmup_app():
+    """Warm what the app loaded: the detector at DETECTION_SIZE, every ladder rung and the OCR engine"""
+    if os.getenv('WARMUP', '1') != '1':
+        return None
+    import app as app_module
+    from test_model import ocr_service
+
+    sizes = [app_module.app.config['DETECTION_SIZE']]
+    models = {}
+    for rung in app_module.ladder or []:
+        if rung.size not in models:
+            models[rung.size] = rung.model
+            sizes.append(rung.size)
+    start = time.perf_counter()
+    timings = warmup(app_module.model, ocr_service, sizes=sorted(set(sizes)),
+                     rounds=int(os.getenv('WARMUP_ROUNDS', 2)), models=models)
+    print(f"warmup done in {time.perf_counter() - start:.1f}s: "
+          + ', '.join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in timings.items()))
+    return timings
+
+
+def _measure(intra, interop, backend, size, iterations, barrier, results):
+    # runs in a fresh spawned process, interop threads can only be set before torch did any work
+    os.environ['OMP_NUM_THREADS'] = str(intra)
+    os.environ['MKL_NUM_THREADS'] = str(intra)
+    os.environ['OCR_CPU_THREADS'] = str(intra)
+    os.environ['OCR_POOL_SIZE'] = '0'
+    apply_thread_config(intra, interop)
+
+    from test_model import load_model, ocr_service
+    model = load_model(backend)
+    warmup(model, ocr_service, sizes=(size,), rounds=1)
+
+    image = synthetic_image()
+    crop = image.crop((200, 280, 640, 360))
+    from test_model import prepare_image, run_model
+
+    barrier.wait()  # all workers start together so they really compete for the cores
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        tensor, _ = prepare_image(image, size)
+        run_model(model, [tensor])
+        ocr_service.read_text_batch([crop, crop, crop])
+        latencies.append(time.perf_counter() - start)
+    results.put((time.perf_counter() - started, latencies))
+
+
+def measure(intra, interop, workers, backend, size, iterations):
+    """`workers` processes running request-shaped work side by side, like gunicorn workers on this host"""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_measure, args=(intra, interop, backend, size, iterations, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    runs = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for _, worker_latencies in runs for latency in worker_latencies)
+    wall = max(seconds for seconds, _ in runs)
+    return {
+        'intra_op_threads': intra,
+        'interop_threads': interop,
+        'requests_per_sec': len(latencies) / wall,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    }
+
+
+def candidates(cores, workers):
+    # from one thread per worker up to all cores per worker (oversubscribed), powers of two in between
+    intra, counts = 1, []
+    while intra <= max(1, cores // workers) * 2:
+        counts.append(intra)
+        intra *= 2
+    fair = max(1, cores // workers)
+    if fair not in counts:
+        counts.append(fair)
+    return [(count, interop) for count in sorted(counts) for interop in (1, 2)]
+
+
+def autotune(workers, backend, size, iterations, path=THREAD_CONFIG_PATH):
+    cores = os.cpu_count() or 1
+    print(f"{cores} cores, {workers} workers, {iterations} requests per worker and config")
+    print(f"{'intra':>6}{'interop':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    results = []
+    for intra, interop in candidates(cores, workers):
+        result = measure(intra, interop, workers, backend, size, iterations)
+        results.append(result)
+        print(f"{intra:>6}{interop:>8}{result['requests_per_sec']:>9.2f}{result['p50_ms']:>9.0f}{result['p99_ms']:>9.0f}")
+
+    # best throughput, but a config within 5% of it that has a clearly lower p99 wins
+    top = max(result['requests_per_sec'] for result in results)
+    close = [result for result in results if result['requests_per_sec'] >= top * 0.95]
+    best = min(close, key=lambda result: result['p99_ms'])
+
+    config = {
+        'workers': workers,
+        'intra_op_threads': best['intra_op_threads'],
+        'interop_threads': best['interop_threads'],
+        'ocr_cpu_threads': best['intra_op_threads'],
+        'cores': cores,
+        'backend': backend,
+        'measured': results
+    }
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"\nbest: {best['intra_op_threads']} intra-op / {best['interop_threads']} interop threads "
+          f"per worker, saved to {path}")
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm up the model and OCR, or tune the thread counts for this host")
+    parser.add_argument('--autotune', action='store_true')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('GUNICORN_WORKERS', 2)))
+    parser.add_argument('--backend', default=os.getenv('MODEL_BACKEND', 'eager'))
+    parser.add_argument('--size', type=int, default=640)
+    parser.add_argument('--iterations', type=int, default=10, help="requests per worker for every config")
+    parser.add_argument('--output', default=THREAD_CONFIG_PATH)
+    args = parser.parse_args()
+
+    if args.autotune:
+        autotune(args.workers, args.backend, args.size, args.iterations, args.output)
+        return 0
+
+    from test_model import load_model, ocr_service
+    model = load_model(args.backend)
+    for round_number in (1, 2):
+        timings = warmup(model, ocr_service, sizes=(args.size,), rounds=1)
+        print(f"round {round_number}: " + ', '.join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in timings.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())